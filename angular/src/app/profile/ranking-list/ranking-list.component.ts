@@ -28,7 +28,7 @@ export class RankingListComponent implements OnInit {
   ngOnInit() {
     this.server.get('ranking', true, false)
       .then(data => {
-        this.profiles = data;
+        this.profiles = data['ranking'];
         this.loading = false;
       })
       .catch(err => {
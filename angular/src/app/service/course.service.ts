@@ -38,7 +38,8 @@ export class CourseService {
           this.server.post('courses/', {
             'type': '',
             'category': this.categorys[i].name,
-            'language': this.user.language
+            'language': this.user.language,
+            'summary': true
           }, true)
             .then((data) => {
                 requests++;
@@ -45,6 +45,7 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'learning_base.request_metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -58,6 +59,15 @@ MIDDLEWARE_CLASSES = (
 
 CORS_ORIGIN_ALLOW_ALL = True
 
+# Records the number of queries, the database time and the wall time of every
+# request in the 'learning_base.request_metrics' log and, with DEBUG, in the
+# X-Query-Count, X-DB-Time-Ms and X-Wall-Time-Ms response headers
+REQUEST_METRICS = False
+
+# Directory of the request, database, cache and try counters of the processes
+# served at /metrics (see learning_base/metrics.py), None disables them
+METRICS_DIR = None
+
 ROOT_URLCONF = 'clonecademy.urls'
 
 TEMPLATES = [
@@ -85,6 +95,32 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'database/db.sqlite.3'),
+        'OPTIONS': {
+            # seconds a connection waits for the write lock
+            'timeout': 20,
+        },
+    }
+}
+
+# Pragmas applied to every SQLite connection (see learning_base/sqlite.py).
+# The write ahead log lets the uwsgi processes read while another process
+# writes, synchronous = NORMAL is durable in this mode and avoids a sync of
+# the log on every commit, the database is read through a memory map.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+# The cache holds the positional course indices. Deployments running several
+# processes need a cache shared between them (see settings_production.py)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
@@ -94,7 +130,7 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_jwt.authentication.JSONWebTokenAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'learning_base.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ),
@@ -127,3 +163,11 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.8/howto/static-files/
 
 STATIC_URL = '/static/'
+
+# Uploaded files, the images of the questions are stored in the blob
+# directory (see learning_base/blobs.py)
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_URL = '/media/'
+
+# The tests write uploaded files into a temporary media directory
+TEST_RUNNER = 'clonecademy.test_runner.TemporaryMediaRunner'
@@ -0,0 +1,25 @@
+"""
+Settings profile storing the learner activity (the tries, the progress and
+the points ledger) in a database file of its own, see
+learning_base/databases.py. Both databases are migrated separately:
+
+    manage.py migrate --settings=clonecademy.settings_split
+    manage.py migrate --database=analytics --settings=clonecademy.settings_split
+
+The activity of an existing database is copied with the move_activity
+command. Other profiles enable the split by importing this module instead of
+clonecademy.settings.
+"""
+
+from clonecademy.settings import *
+
+DATABASES['analytics'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': os.path.join(BASE_DIR, 'database/analytics.sqlite.3'),
+    'OPTIONS': {
+        # seconds a connection waits for the write lock
+        'timeout': 20,
+    },
+}
+
+DATABASE_ROUTERS = ['learning_base.databases.AnalyticsRouter']
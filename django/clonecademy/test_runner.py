@@ -0,0 +1,28 @@
+"""
+Test runner of the project
+"""
+
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TemporaryMediaRunner(DiscoverRunner):
+    """
+    Runs the tests with a temporary MEDIA_ROOT, so neither the migrations of
+    the test databases nor the tests write into the media directory of the
+    project
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super(TemporaryMediaRunner, self).setup_test_environment(**kwargs)
+        self.media_root = tempfile.mkdtemp()
+        self.media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.media_settings.disable()
+        shutil.rmtree(self.media_root)
+        super(TemporaryMediaRunner, self).teardown_test_environment(**kwargs)
@@ -13,7 +13,9 @@ Including another URLconf
     1. Add an import:  from blog import urls as blog_urls
     2. Add a URL to urlpatterns:  url(r'^blog/', include(blog_urls))
 """
+from django.conf import settings
 from django.conf.urls import include, url
+from django.conf.urls.static import static
 from django.contrib import admin
 
 from rest_framework import routers
@@ -64,7 +66,11 @@ urlpatterns = [
     url(r'^user/current$', views.UserView.as_view()),
 
     url(r'^ranking$', views.RankingView.as_view()),
+    url(r'^metrics$', views.MetricsView.as_view()),
     url(r'^pw_reset/?$', views.PwResetView.as_view()),
 
     url(r'^register/$', views.UserRegisterView.as_view())
 ]
+
+# the media files are served by nginx in production
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1 @@
+default_app_config = 'learning_base.apps.LearningBaseConfig'
@@ -0,0 +1,65 @@
+"""
+Compiled answer keys used to grade submissions. The key of a question holds
+the ids of its correct answers and its points, the key of a quiz holds the
+correct answer ids of all quiz questions of a course. The keys are stored in
+the content cache under the content version of the course, so they are
+outdated by the signal handlers whenever answers or questions are edited.
+"""
+
+from collections import namedtuple
+
+from .content_cache import get_content
+from .models import QuizAnswer
+
+# correct is a frozenset of answer ids, or None if every answer is correct
+AnswerKey = namedtuple('AnswerKey', ['correct', 'points'])
+
+QUIZ_KEY = 'quiz_key'
+
+
+def question_key_kind(question_id):
+    """
+    :return: the name of the answer key of a question in the content cache
+    """
+    return 'key_{}'.format(question_id)
+
+
+def question_key(question):
+    """
+    :param question: a question loaded together with its module and course
+    :return: the AnswerKey of the question
+    """
+    course = question.module.course
+
+    def build():
+        return AnswerKey(question.correct_answers(), question.get_points())
+
+    return get_content(course.id, question_key_kind(question.id), build,
+                       course.content_version)
+
+
+def quiz_key(course):
+    """
+    :param course: the course of the quiz
+    :return: a dictionary mapping the ids of the quiz questions to the
+             frozensets of their correct answer ids
+    """
+    def build():
+        correct = {quiz_id: set() for quiz_id in
+                   course.quizquestion_set.values_list('id', flat=True)}
+        for quiz_id, answer_id in QuizAnswer.objects.filter(
+                quiz__course=course, correct=True).values_list('quiz', 'id'):
+            correct[quiz_id].add(answer_id)
+        return {quiz_id: frozenset(answers)
+                for quiz_id, answers in correct.items()}
+
+    return get_content(course.id, QUIZ_KEY, build, course.content_version)
+
+
+def grade(answer_key, answers):
+    """
+    :param answer_key: the AnswerKey of a question
+    :param answers: the ids of the chosen answers
+    :return: True iff exactly the correct answers are chosen
+    """
+    return answer_key.correct is None or answer_key.correct == set(answers)
@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class LearningBaseConfig(AppConfig):
     name = 'learning_base'
+
+    def ready(self):
+        from . import signals  # registers the signal handlers
+        from .request_metrics import install_query_recording
+        from .sqlite import configure_connection
+        connection_created.connect(install_query_recording)
+        connection_created.connect(configure_connection)
@@ -0,0 +1,81 @@
+"""
+Token authentication serving the users from the cache. The user is cached
+together with the profile and the roles, so authenticated requests need no
+database queries to resolve the requesting user. The signal handlers remove
+the cached users whenever tokens, users, profiles or group memberships are
+changed.
+"""
+
+import hashlib
+
+from django.core.cache import cache
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from . import metrics
+from .models import get_roles
+
+# seconds a user is served from the cache
+AUTH_TIMEOUT = 60 * 5
+
+
+def token_cache_key(key):
+    """
+    :return: the cache key of a token, the token itself is not used in the
+             key since the keys of the file cache are visible in the file
+             system
+    """
+    return 'auth_token_{}'.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+def forget_tokens(keys):
+    """
+    removes the cached users of the given tokens
+    :param keys: the keys of the tokens
+    """
+    cache.delete_many([token_cache_key(key) for key in keys])
+
+
+def forget_users(user_ids):
+    """
+    removes the cached users, needs to be called whenever a user, its profile
+    or its groups are changed
+    :param user_ids: the ids of the changed users
+    """
+    forget_tokens(Token.objects.filter(user__in=user_ids).values_list(
+        'key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement of the TokenAuthentication caching the user of every
+    token in the configured cache for AUTH_TIMEOUT seconds
+    """
+
+    def authenticate_credentials(self, key):
+        """
+        returns the user and the token of a token key
+        :param key: the key sent by the client
+        :return: a (user, token) tuple
+        :raise: AuthenticationFailed if the token is invalid or the user is
+                inactive
+        """
+        cache_key = token_cache_key(key)
+        credentials = cache.get(cache_key)
+        metrics.count_cache('token', credentials is not None)
+        if credentials is not None:
+            return credentials
+        try:
+            token = Token.objects.select_related('user__profile').get(key=key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+        get_roles(token.user)
+        credentials = (token.user, token)
+        cache.set(cache_key, credentials, AUTH_TIMEOUT)
+        return credentials
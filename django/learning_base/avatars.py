@@ -0,0 +1,133 @@
+"""
+Avatars of the users. Uploaded avatars are decoded, cropped to a square and
+stored as thumbnails of fixed sizes in the blob store. The profiles only
+store the hash of the uploaded image, profiles without an avatar share the
+thumbnails of the default picture, which are stored when their url is first
+requested.
+"""
+
+import hashlib
+import io
+import os
+
+from django.conf import settings
+from PIL import Image
+
+from .blobs import blob_path, blob_url, decode_data_uri, write_file
+from .default_picture import default_picture
+
+# the names and edge lengths of the thumbnails
+AVATAR_SIZES = (('small', 64), ('large', 256))
+
+JPEG_QUALITY = 85
+
+
+def avatar_name(avatar_hash, size):
+    """
+    :return: the name of a thumbnail in the blob store
+    """
+    return 'avatars/{}/{}-{}.jpg'.format(avatar_hash[:2], avatar_hash, size)
+
+
+def avatar_url(avatar_hash, size='large'):
+    """
+    :param avatar_hash: the hash of the avatar, empty for the default avatar
+    :param size: the name of the thumbnail size
+    :return: the url of the thumbnail
+    """
+    if not avatar_hash:
+        store_default_avatar()
+        avatar_hash = default_avatar_hash()
+    return blob_url(avatar_name(avatar_hash, size))
+
+
+def make_thumbnails(content):
+    """
+    Crops the image to a square and scales it to the thumbnail sizes
+    :param content: the bytes of the image
+    :return: a dictionary mapping the size names to the encoded thumbnails
+    :raise: ValueError if the content is no readable image
+    """
+    try:
+        image = Image.open(io.BytesIO(content))
+        image.load()
+    except (OSError, SyntaxError, Image.DecompressionBombError) as error:
+        raise ValueError('invalid image') from error
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    else:
+        image = image.convert('RGB')
+    side = min(image.size)
+    left = (image.width - side) // 2
+    top = (image.height - side) // 2
+    image = image.crop((left, top, left + side, top + side))
+    thumbnails = {}
+    for size, length in AVATAR_SIZES:
+        thumbnail = io.BytesIO()
+        image.resize((length, length), Image.LANCZOS).save(
+            thumbnail, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+        thumbnails[size] = thumbnail.getvalue()
+    return thumbnails
+
+
+def store_avatar_content(content):
+    """
+    Stores the thumbnails of an image unless they are stored already
+    :param content: the bytes of the image
+    :return: the hash of the avatar
+    :raise: ValueError if the content is no readable image
+    """
+    avatar_hash = hashlib.sha256(content).hexdigest()
+    paths = {size: blob_path(avatar_name(avatar_hash, size))
+             for size, _ in AVATAR_SIZES}
+    if not all(os.path.exists(path) for path in paths.values()):
+        for size, thumbnail in make_thumbnails(content).items():
+            write_file(paths[size], thumbnail)
+    return avatar_hash
+
+
+def store_avatar(value):
+    """
+    Stores an uploaded avatar
+    :param value: the avatar sent by the frontend as base64 data uri
+    :return: the hash of the avatar, or None if the value is no data uri and
+             the avatar is not changed
+    :raise: ValueError if the data uri contains no readable image
+    """
+    if not (value or '').startswith('data:'):
+        return None
+    decoded = decode_data_uri(value)
+    if not decoded:
+        raise ValueError('invalid image')
+    return store_avatar_content(decoded[1])
+
+
+_default_avatar_hash = None
+
+
+def default_avatar_hash():
+    """
+    :return: the hash of the default avatar
+    """
+    global _default_avatar_hash
+    if _default_avatar_hash is None:
+        _default_avatar_hash = hashlib.sha256(
+            decode_data_uri(default_picture)[1]).hexdigest()
+    return _default_avatar_hash
+
+
+# the media directories the default avatar was stored in by this process
+_default_avatar_roots = set()
+
+
+def store_default_avatar():
+    """
+    Stores the thumbnails of the default avatar unless this process stored
+    them already
+    """
+    if settings.MEDIA_ROOT not in _default_avatar_roots:
+        store_avatar_content(decode_data_uri(default_picture)[1])
+        _default_avatar_roots.add(settings.MEDIA_ROOT)
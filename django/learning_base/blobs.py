@@ -0,0 +1,147 @@
+"""
+Content addressed store for the images of questions and answers. Images are
+sent by the frontend as base64 data uris. They are written once to the media
+directory under the hash of their content and the models store the url of
+the file, so identical images are stored once and the files never change.
+"""
+
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.db import models
+
+# the directory of the blobs in MEDIA_ROOT and MEDIA_URL
+BLOB_DIR = 'blobs'
+
+# image types stored as files, other data uris are kept inline
+EXTENSIONS = {
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/gif': 'gif',
+    'image/bmp': 'bmp',
+    'image/webp': 'webp',
+}
+
+DATA_URI = re.compile(r'^data:(?P<mime>[\w.+-]+/[\w.+-]+);base64,(?P<data>.*)$',
+                      re.DOTALL)
+
+
+def blob_name(content, extension):
+    """
+    :return: the path of the blob relative to the blob directory, the first
+             two characters of the hash are used as a sub directory
+    """
+    digest = hashlib.sha256(content).hexdigest()
+    return '{}/{}.{}'.format(digest[:2], digest, extension)
+
+
+def blob_url(name):
+    """
+    :return: the url the blob with the given name is served under
+    """
+    return '{}{}/{}'.format(settings.MEDIA_URL, BLOB_DIR, name)
+
+
+def blob_path(name):
+    """
+    :return: the path of the blob with the given name in the file system
+    """
+    return os.path.join(settings.MEDIA_ROOT, BLOB_DIR, *name.split('/'))
+
+
+def write_file(path, content):
+    """
+    Writes an immutable file if it does not exist yet. The file is written to
+    a temporary file first, so it is never read half written.
+    :param path: the path of the file
+    :param content: the bytes of the file
+    """
+    if os.path.exists(path):
+        return
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(handle, 'wb') as temp_file:
+        temp_file.write(content)
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, path)
+
+
+def write_blob(content, extension):
+    """
+    Stores the content if no blob with the same content exists
+    :param content: the bytes of the blob
+    :param extension: the file extension of the blob
+    :return: the name of the blob
+    """
+    name = blob_name(content, extension)
+    write_file(blob_path(name), content)
+    return name
+
+
+def decode_data_uri(value):
+    """
+    :param value: a base64 data uri
+    :return: the mime type and the decoded content, or None if the value is
+             no valid base64 data uri
+    """
+    match = DATA_URI.match(value or '')
+    if not match:
+        return None
+    try:
+        content = base64.b64decode(match.group('data'), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return match.group('mime').lower(), content
+
+
+def store_data_uri(value):
+    """
+    Moves a base64 encoded image into the blob store
+    :param value: the value of an image field
+    :return: the url of the stored image, or the unchanged value if it is no
+             base64 data uri of a supported image type
+    """
+    decoded = decode_data_uri(value)
+    if not decoded or decoded[0] not in EXTENSIONS:
+        return value
+    mime, content = decoded
+    return blob_url(write_blob(content, EXTENSIONS[mime]))
+
+
+def load_data_uri(value):
+    """
+    Reverts store_data_uri
+    :param value: the value of an image field
+    :return: the stored image as base64 data uri, or the unchanged value if
+             it is no url of the blob store
+    """
+    prefix = blob_url('')
+    if not (value or '').startswith(prefix):
+        return value
+    name = value[len(prefix):]
+    extension = name.rsplit('.', 1)[-1]
+    mime = {ext: mime for mime, ext in EXTENSIONS.items()}.get(extension)
+    try:
+        with open(blob_path(name), 'rb') as blob:
+            content = blob.read()
+    except OSError:
+        return value
+    return 'data:{};base64,{}'.format(mime, base64.b64encode(content).decode())
+
+
+class BlobField(models.TextField):
+    """
+    Text field for images. Base64 data uris assigned to the field are moved
+    into the blob store when the model is saved and replaced by their url.
+    """
+
+    def pre_save(self, model_instance, add):
+        value = store_data_uri(getattr(model_instance, self.attname))
+        setattr(model_instance, self.attname, value)
+        return value
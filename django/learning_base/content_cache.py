@@ -0,0 +1,82 @@
+"""
+Cache of the serialized, user independent content of the courses. The cache
+keys contain the content version of the course, which is incremented by the
+signal handlers whenever the course, its modules, questions, answers or quiz
+are changed, so outdated entries are never read and expire by themselves.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db.models import F
+
+from . import metrics
+from .models import Course
+
+# seconds an entry is kept, entries of outdated versions are never read again
+CONTENT_TIMEOUT = 60 * 60 * 24
+
+_deferred = threading.local()
+
+
+def content_key(course_id, version, kind):
+    """
+    :return: the cache key of a part of the course content
+    """
+    return 'course_content_{}_{}_{}'.format(course_id, version, kind)
+
+
+def bump_content_version(courses):
+    """
+    Marks the cached content of the courses as outdated
+    :param courses: a Course queryset
+    """
+    courses.update(content_version=F('content_version') + 1)
+
+
+@contextmanager
+def deferred_versions():
+    """
+    Suspends the version updates of the signal handlers in the current
+    thread. Used by bulk saves, which bump the version once at the end.
+    """
+    _deferred.depth = getattr(_deferred, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _deferred.depth -= 1
+
+
+def versions_deferred():
+    """
+    :return: True iff the version updates are suspended in the current thread
+    """
+    return getattr(_deferred, 'depth', 0) > 0
+
+
+def get_content(course_id, kind, build, version=None):
+    """
+    Returns a part of the course content from the cache, the content is built
+    and cached if the cache contains no entry for the current version of the
+    course.
+    :param course_id: the id of the course
+    :param kind: the name of the part of the content
+    :param build: a function returning the content
+    :param version: the content version of the course if the course is
+                    loaded already, it is read from the database otherwise
+    :return: the content
+    :raise: Course.DoesNotExist if there is no such course
+    """
+    if version is None:
+        version = Course.objects.filter(id=course_id).values_list(
+            'content_version', flat=True).first()
+    if version is None:
+        raise Course.DoesNotExist('Course not found')
+    key = content_key(course_id, version, kind)
+    content = cache.get(key)
+    metrics.count_cache('course_content', content is not None)
+    if content is None:
+        content = build()
+        cache.set(key, content, CONTENT_TIMEOUT)
+    return content
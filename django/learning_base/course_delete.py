@@ -0,0 +1,97 @@
+"""
+Set based deletion of courses. Instead of loading and deleting every module,
+question and answer, the rows referencing the deleted courses are removed
+table by table with one statement each, following the on_delete rules of
+the foreign keys. The child tables of the polymorphic questions are reached
+through their parent links like any other cascading relation, the rows of the
+activity tables referencing deleted rows are released by
+databases.release_references.
+"""
+
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import models
+
+from .answer_keys import QUIZ_KEY, question_key_kind
+from .content_cache import content_key
+from .course_tree import invalidate_course_index
+from .databases import REFERENCES, atomic, release_references
+from .models import Course, Question
+
+
+def delete_rows(queryset):
+    """
+    Deletes the rows of a queryset together with all rows referencing them.
+    Cascading relations are deleted recursively, nullable references are set
+    to null. No objects are loaded and no signals are sent.
+    :param queryset: the rows to delete
+    :raise: ValueError if a relation uses another on_delete rule
+    """
+    model = queryset.model
+    keys = queryset.values('pk')
+    if model in REFERENCES:
+        release_references(model, keys.values_list('pk', flat=True))
+    for relation in model._meta.get_fields(include_parents=False,
+                                            include_hidden=True):
+        if relation.many_to_many:
+            # the rows of the intermediate table
+            through = relation.remote_field.through if relation.concrete \
+                else relation.through
+            field = next(field for field in through._meta.concrete_fields
+                         if field.is_relation
+                         and field.related_model is model)
+            delete_rows(through._base_manager.filter(
+                **{'{}__in'.format(field.name): keys}))
+            continue
+        if relation.concrete or not relation.is_relation:
+            continue
+        field = relation.field
+        related = relation.related_model._base_manager.filter(
+            **{'{}__in'.format(field.name): keys})
+        on_delete = field.remote_field.on_delete
+        if on_delete is models.CASCADE:
+            delete_rows(related)
+        elif on_delete is models.SET_NULL:
+            related.update(**{field.name: None})
+        elif on_delete is not models.DO_NOTHING:
+            raise ValueError('unsupported on_delete rule of {}'.format(field))
+    # _raw_delete issues a single DELETE without collecting the objects
+    queryset._raw_delete(queryset.db)
+
+
+def delete_courses(courses):
+    """
+    Deletes courses with their modules, questions, answers, quizzes and the
+    progress of the users in one transaction
+    :param courses: a Course queryset
+    """
+    course_ids = list(courses.values_list('id', flat=True))
+    if not course_ids:
+        return
+    with atomic():
+        clear_course_content(course_ids)
+        delete_rows(Course.objects.filter(id__in=course_ids))
+
+
+def clear_course_content(course_ids):
+    """
+    Removes the cached content, answer keys and indices of courses which are
+    deleted, needed since new courses could get the same ids
+    :param course_ids: the ids of the courses
+    """
+    questions = defaultdict(list)
+    for course_id, question_id in Question.objects.filter(
+            module__course__in=course_ids).values_list('module__course',
+                                                       'id'):
+        questions[course_id].append(question_id)
+    keys = []
+    for course_id, version in Course.objects.filter(
+            id__in=course_ids).values_list('id', 'content_version'):
+        kinds = ['course', 'edit', QUIZ_KEY]
+        for question_id in questions[course_id]:
+            kinds += ['answers_{}'.format(question_id),
+                      question_key_kind(question_id)]
+        keys += [content_key(course_id, version, kind) for kind in kinds]
+        invalidate_course_index(course_id)
+    cache.delete_many(keys)
@@ -0,0 +1,355 @@
+"""
+Diff based save of complete courses. The submitted course tree is compared
+with the stored tree and only the differences are written: changed rows are
+updated, unchanged rows are skipped, removed rows are deleted with one
+statement per model and new answers are inserted in bulk. The whole save runs
+in a single transaction, so a failed save never leaves a half written course.
+"""
+
+from django.core.exceptions import ValidationError
+from django.db.models import F
+from rest_framework.exceptions import ParseError
+
+from . import progress
+from .content_cache import bump_content_version, deferred_versions
+from .course_delete import delete_rows
+from .course_tree import invalidate_course_index
+from .databases import atomic
+from .info.models import InformationText, InformationYoutube
+from .info.serializer import InformationYoutubeSerializer
+from .models import Course, CourseCategory, Module, Question, QuizQuestion, \
+    QuizAnswer
+from .multiple_choice.models import MultipleChoiceQuestion, \
+    MultipleChoiceAnswer
+from .multiple_choice.serializer import MultipleChoiceAnswerSerializer
+from .serializers import ModuleSerializer, QuestionSerializer, \
+    QuizSerializer, QuizAnswerSerializer
+
+# the question models of the question types sent by the frontend
+QUESTION_TYPES = {
+    'multiple_choice': MultipleChoiceQuestion,
+    'info_text': InformationText,
+    'info_text_youtube': InformationYoutube,
+}
+
+
+def row_values(model, data):
+    """
+    :param model: the model of the row
+    :param data: the submitted data of the row
+    :return: the values of the fields of the model contained in the data,
+             the foreign keys, the primary key and the content version are
+             not taken from the data
+    :raise: ParseError if a value is invalid
+    """
+    values = {}
+    for field in model._meta.concrete_fields:
+        if (field.name in data and not field.primary_key
+                and not field.is_relation and field.name != 'content_version'):
+            try:
+                values[field.name] = field.to_python(data[field.name])
+            except ValidationError as error:
+                raise ParseError(detail=error.messages, code=None)
+    return values
+
+
+def changed_values(stored, row, names):
+    """
+    :param stored: the stored row
+    :param row: the submitted row
+    :param names: the names of the submitted fields
+    :return: a dictionary with the submitted values differing from the stored
+             values
+    """
+    changes = {}
+    for name in names:
+        field = row._meta.get_field(name)
+        value = field.to_python(field.pre_save(row, False))
+        if value != getattr(stored, field.attname):
+            changes[field.attname] = value
+    return changes
+
+
+def parse_id(value):
+    """
+    :return: the submitted id as integer, or None if it is no valid id
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class TreeLevel:
+    """
+    The submitted rows of one level of the course tree (the modules, the
+    questions, ...) compared with the stored rows of the level
+    """
+
+    def __init__(self, stored, parent_field, order_model=None):
+        """
+        :param stored: the stored rows of the level
+        :param parent_field: the name of the foreign key to the parent row
+        :param order_model: the model with the order field if the order is
+                            unique per parent
+        """
+        self.stored = {row.pk: row for row in stored}
+        self.parent_field = parent_field
+        self.order_model = order_model
+        self.updates = []
+        self.inserts = []
+
+    def submit(self, model, data, parent):
+        """
+        Adds a submitted row. The row updates the stored row with the same id
+        if it has the same type and its parent is stored already, otherwise
+        it is inserted.
+        :param model: the model of the row
+        :param data: the submitted data of the row
+        :param parent: the parent row
+        :return: the new row
+        """
+        values = row_values(model, data)
+        row = model(**values)
+        stored = self.stored.get(parse_id(data.get('id')))
+        if (stored is not None and type(stored) is model
+                and parent.pk is not None):
+            del self.stored[stored.pk]
+            row.pk = stored.pk
+            self.updates.append((stored, row, parent, list(values)))
+        else:
+            self.inserts.append((row, parent))
+        return row
+
+    def keep(self):
+        """
+        Keeps all stored rows unchanged
+        """
+        self.stored = {}
+
+    def park(self):
+        """
+        Moves the rows changing their position and the removed rows to
+        unique negative orders, so the new positions can be written without
+        violating the unique order constraint
+        """
+        if self.order_model is None:
+            return
+        parent_attname = '{}_id'.format(self.parent_field)
+        moved = list(self.stored) + [
+            stored.pk for stored, row, parent, _ in self.updates
+            if (getattr(stored, parent_attname), stored.order)
+            != (parent.pk, row.order)]
+        if moved:
+            self.order_model._base_manager.filter(pk__in=moved).update(
+                order=-1 * F('pk'))
+            # update compares with the parked order, so the new order of a
+            # row keeping its order in another parent is written as well
+            moved = set(moved)
+            for stored, _, _, _ in self.updates:
+                if stored.pk in moved:
+                    stored.order = -stored.pk
+
+    def update(self):
+        """
+        Writes the changed fields of the updated rows
+        """
+        for stored, row, parent, names in self.updates:
+            setattr(row, self.parent_field, parent)
+            changes = changed_values(stored, row,
+                                     names + [self.parent_field])
+            if changes:
+                type(stored)._base_manager.filter(pk=stored.pk).update(
+                    **changes)
+
+    def delete(self):
+        """
+        Deletes the removed rows with one statement per model
+        """
+        removed = {}
+        for row in self.stored.values():
+            # rows of the polymorphic questions are deleted through their
+            # base table, which cascades to the child tables
+            model = ([type(row)] + type(row)._meta.get_parent_list())[-1]
+            removed.setdefault(model, []).append(row.pk)
+        for model, ids in removed.items():
+            delete_rows(model._base_manager.filter(pk__in=ids))
+
+    def insert(self, bulk=False):
+        """
+        Inserts the new rows. Rows referenced by other rows are saved one by
+        one to get their ids, leaf rows can be inserted in bulk.
+        :param bulk: True to insert the rows in bulk
+        """
+        for row, parent in self.inserts:
+            setattr(row, self.parent_field, parent)
+        if not bulk:
+            for row, _ in self.inserts:
+                row.save()
+            return
+        rows = {}
+        for row, _ in self.inserts:
+            rows.setdefault(type(row), []).append(row)
+        for model, model_rows in rows.items():
+            model.objects.bulk_create(model_rows)
+
+
+def save_course(data):
+    """
+    Saves a course together with its modules, questions, answers and quiz.
+    Existing rows are referenced by their ids, stored rows missing in the
+    data are removed.
+    :param data: the course data sent by the frontend
+    :return: the saved course
+    :raise: ParseError if the data is no valid course
+    """
+    modules = data.pop('modules')
+    quiz_data = data.pop('quiz', [])
+    if not modules:
+        raise ParseError(detail='Course needs to have at least one module',
+                         code=None)
+
+    course = None
+    try:
+        with atomic(), deferred_versions():
+            course = save_course_row(data)
+            module_level = TreeLevel(Module.objects.filter(course=course),
+                                     'course', Module)
+            question_level = TreeLevel(
+                Question.objects.filter(module__course=course), 'module',
+                Question)
+            answer_level = TreeLevel(MultipleChoiceAnswer.objects.filter(
+                question__module__course=course), 'question')
+            quiz_level = TreeLevel(QuizQuestion.objects.filter(course=course),
+                                   'course')
+            quiz_answer_level = TreeLevel(
+                QuizAnswer.objects.filter(quiz__course=course), 'quiz')
+
+            submit_quiz(course, quiz_data, quiz_level, quiz_answer_level)
+            submit_modules(course, modules, module_level, question_level,
+                           answer_level)
+
+            levels = (module_level, question_level, answer_level, quiz_level,
+                      quiz_answer_level)
+            for level in levels:
+                level.park()
+            for level in levels:
+                level.update()
+            for level in levels:
+                level.delete()
+            for level in levels:
+                level.insert(bulk=level in (answer_level, quiz_answer_level))
+
+            bump_content_version(Course.objects.filter(id=course.id))
+            progress.refresh_course_progress(course)
+    finally:
+        if course is not None:
+            invalidate_course_index(course.id)
+    return course
+
+
+def save_course_row(data):
+    """
+    Creates or updates the course itself
+    :param data: the course data without modules and quiz
+    :return: the course
+    """
+    values = row_values(Course, data)
+    values['category'] = CourseCategory.objects.get(name=data['category'])
+    values['responsible_mod'] = data['responsible_mod']
+    stored = Course.objects.filter(id=parse_id(data.get('id'))).first()
+    if stored is None:
+        course = Course(**values)
+        course.save()
+        return course
+    changes = changed_values(stored, Course(**values), list(values))
+    if changes:
+        Course.objects.filter(id=stored.id).update(**changes)
+        for name, value in changes.items():
+            setattr(stored, name, value)
+    return stored
+
+
+def submit_quiz(course, quiz_data, quiz_level, answer_level):
+    """
+    Validates the quiz and adds it to the tree levels. Quizzes with less
+    than 5 questions are removed, quizzes with more than 20 questions are
+    ignored.
+    """
+    if not quiz_data or len(quiz_data) < 5:
+        return
+    if len(quiz_data) > 20:
+        quiz_level.keep()
+        answer_level.keep()
+        return
+    for quiz in quiz_data:
+        quiz_serializer = QuizSerializer(data=quiz)
+        if not quiz_serializer.is_valid():
+            raise ParseError(detail=str(quiz_serializer.errors), code=None)
+        if 'answers' not in quiz:
+            raise ParseError(detail='The quiz has no answers', code=None)
+        if len(quiz['answers']) != 4:
+            raise ParseError(detail='Quiz must have 4 answers', code=None)
+        quiz_question = quiz_level.submit(QuizQuestion, quiz, course)
+        solvable = False
+        for answer in quiz['answers']:
+            answer_serializer = QuizAnswerSerializer(data=answer)
+            if not answer_serializer.is_valid():
+                raise ParseError(detail=str(answer_serializer.errors),
+                                 code=None)
+            solvable |= answer_level.submit(QuizAnswer, answer,
+                                            quiz_question).correct
+        if not solvable:
+            raise ParseError(detail='This quiz is not solvable', code=None)
+
+
+def submit_modules(course, modules, module_level, question_level,
+                   answer_level):
+    """
+    Validates the modules with their questions and answers and adds them to
+    the tree levels
+    """
+    for module in modules:
+        if not ModuleSerializer(data=module).is_valid():
+            raise ParseError(detail='Error in module serialization',
+                             code=None)
+        questions = module.get('questions')
+        if not questions:
+            raise ParseError(detail='empty module is not allowed', code=None)
+        course_module = module_level.submit(Module, module, course)
+        for question in questions:
+            if not QuestionSerializer(data=question).is_valid():
+                raise ParseError(detail='Error in question serialization',
+                                 code=None)
+            model = QUESTION_TYPES.get(question.get('type'))
+            if model is None:
+                raise ParseError(
+                    detail='{} is not a valid question type'.format(
+                        question.get('type')))
+            if model is InformationYoutube and 'url' in question:
+                urls = InformationYoutubeSerializer.pattern.findall(
+                    question['url'])
+                question = dict(question, url=urls[0] if urls
+                                else question['url'])
+            row = question_level.submit(model, question, course_module)
+            if model is MultipleChoiceQuestion:
+                submit_answers(row, question.get('answers', []),
+                               answer_level)
+
+
+def submit_answers(question, answers, answer_level):
+    """
+    Validates the answers of a multiple choice question and adds them to the
+    answer level
+    """
+    solvable = False
+    for answer in answers:
+        answer_serializer = MultipleChoiceAnswerSerializer(data=answer)
+        if not answer_serializer.is_valid():
+            raise ParseError(detail=answer_serializer.errors, code=None)
+        solvable |= answer_level.submit(MultipleChoiceAnswer, answer,
+                                        question).is_correct
+    if not solvable:
+        raise ParseError(
+            detail="Unsolvable question {}".format(question.title),
+            code=None)
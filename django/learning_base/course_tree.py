@@ -0,0 +1,150 @@
+"""
+Loader fetching complete courses (modules, questions and answers) with a
+fixed number of queries, independent of the size of the courses, and the
+cached positional index resolving course urls to questions
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import Prefetch, prefetch_related_objects
+
+from . import metrics
+from .models import Module, Question
+from .multiple_choice.models import MultipleChoiceQuestion
+
+
+def load_course_tree(courses, answers=True, quiz=False):
+    """
+    Fetches the given courses together with their modules, questions and
+    answers. The related objects are stored in the prefetch cache, so
+    course.module_set.all(), module.question_set.all(), question.answer_set()
+    and the reverse accesses question.module and module.course are served
+    without further queries.
+    :param courses: a Course queryset
+    :param answers: whether the answers of the questions are fetched
+    :param quiz: whether the quiz questions and their answers are fetched
+    :return: a list of the courses
+    """
+    courses = list(courses.select_related('category'))
+    prefetch_related_objects(
+        courses,
+        Prefetch('module_set', queryset=Module.objects.all()),
+        Prefetch('module_set__question_set', queryset=Question.objects.all()))
+    if quiz:
+        prefetch_related_objects(courses, 'quizquestion_set__quizanswer_set')
+    if answers:
+        questions = [question
+                     for course in courses
+                     for module in course.module_set.all()
+                     for question in module.question_set.all()
+                     if isinstance(question, MultipleChoiceQuestion)]
+        prefetch_related_objects(questions, 'multiplechoiceanswer_set')
+    return courses
+
+
+def load_course_outline(course):
+    """
+    Fetches the modules of a course and the titles of their questions with
+    two queries. Like load_course_tree, the related objects are stored in the
+    prefetch cache. The questions are plain Question instances without the
+    fields of their question types.
+    :param course: the course
+    :return: the course
+    """
+    prefetch_related_objects(
+        [course],
+        Prefetch('module_set', queryset=Module.objects.all()),
+        Prefetch('module_set__question_set',
+                 queryset=Question.objects.non_polymorphic().only(
+                     'id', 'title', 'module', 'order')))
+    return course
+
+
+def course_index_key(course_id):
+    """
+    :return: the cache key of the positional index of a course
+    """
+    return 'course_index_{}'.format(course_id)
+
+
+def get_course_index(course_id):
+    """
+    Returns the positional index of a course. The index contains a list for
+    every module of the course (in order) with a (primary key, content type
+    id) pair for every question of the module (in order). The index is
+    cached until invalidate_course_index is called for the course.
+    :param course_id: the id of the course
+    :return: the index as a list of lists
+    """
+    key = course_index_key(course_id)
+    index = cache.get(key)
+    metrics.count_cache('course_index', index is not None)
+    if index is None:
+        modules = list(Module.objects.filter(
+            course=course_id).values_list('id', flat=True))
+        questions = {module: [] for module in modules}
+        for module, question, ctype in Question.objects.filter(
+                module__course=course_id).values_list(
+                    'module_id', 'id', 'polymorphic_ctype_id'):
+            questions[module].append((question, ctype))
+        index = [questions[module] for module in modules]
+        cache.set(key, index, None)
+    return index
+
+
+def invalidate_course_index(course_id):
+    """
+    Removes the cached positional index of a course. Needs to be called
+    whenever modules or questions of the course are added, removed or
+    reordered.
+    :param course_id: the id of the changed course
+    """
+    cache.delete(course_index_key(course_id))
+
+
+def question_position(course_id, module_index, question_index):
+    """
+    :return: the position of the question with the given url indices,
+             counted over all questions of the course in module and question
+             order
+    """
+    index = get_course_index(course_id)
+    module_index = int(module_index)
+    return (sum(len(module) for module in index[:module_index])
+            + int(question_index))
+
+
+def locate_question(course_id, module_index, question_index):
+    """
+    Looks the url indices /courses/<course>/<module>/<question> up in the
+    positional index of the course
+    :param course_id: the id of the course
+    :param module_index: the position of the module in the course
+    :param question_index: the position of the question in the module
+    :return: the id and the content type id of the question
+    :raise: Question.DoesNotExist if there is no such question
+    """
+    index = get_course_index(course_id)
+    module_index = int(module_index)
+    question_index = int(question_index)
+    if not (0 <= module_index < len(index)
+            and 0 <= question_index < len(index[module_index])):
+        raise Question.DoesNotExist('Question not found')
+    return index[module_index][question_index]
+
+
+def resolve_question(course_id, module_index, question_index):
+    """
+    Resolves the url indices /courses/<course>/<module>/<question> to the
+    question with a single primary key query. The module and the course of
+    the question are fetched with the same query.
+    :param course_id: the id of the course
+    :param module_index: the position of the module in the course
+    :param question_index: the position of the question in the module
+    :return: the question as an instance of its specific question type
+    :raise: Question.DoesNotExist if there is no such question
+    """
+    question_id, ctype = locate_question(course_id, module_index,
+                                         question_index)
+    model = ContentType.objects.get_for_id(ctype).model_class()
+    return model.objects.select_related('module__course').get(id=question_id)
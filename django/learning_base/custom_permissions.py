@@ -4,6 +4,8 @@ module containing all custom access management
 
 from rest_framework.permissions import IsAuthenticated
 
+from .models import is_admin, is_mod
+
 SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
 
 
@@ -19,8 +21,7 @@ class IsModOrAdmin(IsAuthenticated):
         :return: True iff the user is part of the groups 'admin' or 'moderator'
         """
         return (super().has_permission(request, view)
-                and (request.user.groups.filter(name="moderator").exists()
-                     or request.user.groups.filter(name="admin").exists()))
+                and (is_mod(request.user) or is_admin(request.user)))
 
 
 class IsAdmin(IsAuthenticated):
@@ -36,7 +37,7 @@ class IsAdmin(IsAuthenticated):
         """
 
         return (super().has_permission(request, view)
-                and request.user.groups.filter(name="admin").exists())
+                and is_admin(request.user))
 
 
 class IsAdminOrReadOnly(IsAuthenticated):
@@ -55,7 +56,7 @@ class IsAdminOrReadOnly(IsAuthenticated):
 
         return (super().has_permission(request, view)
                 and (request.method in SAFE_METHODS
-                     or request.user.groups.filter(name="admin").exists()))
+                     or is_admin(request.user)))
 
 
 class IsModOrAdminOrReadOnly(IsAuthenticated):
@@ -74,5 +75,5 @@ class IsModOrAdminOrReadOnly(IsAuthenticated):
 
         return (super().has_permission(request, view)
                 and (request.method in SAFE_METHODS
-                     or request.user.groups.filter(name="moderator").exists()
-                     or request.user.groups.filter(name="admin").exists()))
+                     or is_mod(request.user)
+                     or is_admin(request.user)))
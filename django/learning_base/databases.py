@@ -0,0 +1,146 @@
+"""
+Routing of the learner activity to a database of its own. The tries, the
+progress tables and the points ledger are written with every submitted
+answer and scanned by the statistics. With the router of this module (see
+clonecademy/settings_split.py) they are stored in the 'analytics' database,
+so reading and editing the course content never waits for them.
+
+The database cannot enforce references between two database files. The
+foreign keys of the activity tables are therefore declared without
+constraints and without on_delete rules, release_references applies the
+rules when the referenced rows are deleted. Queries must not join the
+activity tables with the tables of the default database, the ids are read
+from one database and passed to the other.
+"""
+
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, models, router, transaction
+
+from .models import Course, PointsEntry, Question, QuizQuestion, Try, \
+    UserCourseProgress, UserQuestionProgress
+
+ANALYTICS_DB_ALIAS = 'analytics'
+
+# the names of the models stored in the analytics database
+ANALYTICS_MODELS = {'learning_base.try', 'learning_base.userquestionprogress',
+                    'learning_base.usercourseprogress',
+                    'learning_base.pointsentry'}
+
+# the references of the activity tables, keyed by the referenced model, with
+# the rule applied when a referenced row is deleted
+REFERENCES = {
+    User: ((Try, 'user', models.SET_NULL),
+           (UserQuestionProgress, 'user', models.CASCADE),
+           (UserCourseProgress, 'user', models.CASCADE),
+           (PointsEntry, 'user', models.CASCADE)),
+    Course: ((UserQuestionProgress, 'course', models.CASCADE),
+             (UserCourseProgress, 'course', models.CASCADE),
+             (PointsEntry, 'course', models.SET_NULL)),
+    Question: ((Try, 'question', models.SET_NULL),
+               (UserQuestionProgress, 'question', models.CASCADE),
+               (PointsEntry, 'question', models.SET_NULL)),
+    QuizQuestion: ((Try, 'quiz_question', models.SET_NULL),
+                   (UserQuestionProgress, 'quiz_question', models.CASCADE),
+                   (PointsEntry, 'quiz_question', models.SET_NULL)),
+}
+
+
+def is_analytics_model(model):
+    """
+    :return: True iff the model is stored in the analytics database, works
+             for the historical models of the migrations as well
+    """
+    return model._meta.label_lower in ANALYTICS_MODELS
+
+
+class AnalyticsRouter:
+    """
+    Stores the learner activity in the analytics database and all other
+    models in the default database
+    """
+
+    @staticmethod
+    def db_for_read(model, **hints):
+        """
+        :return: the database of the model
+        """
+        return ANALYTICS_DB_ALIAS if is_analytics_model(model) \
+            else DEFAULT_DB_ALIAS
+
+    db_for_write = db_for_read
+
+    @staticmethod
+    def allow_relation(obj1, obj2, **hints):
+        """
+        allows the references between the two databases
+        """
+        return True
+
+    @staticmethod
+    def allow_migrate(db, app_label, model_name=None, **hints):
+        """
+        creates the tables of every model in its own database only, data
+        migrations run on the default database
+        """
+        if model_name is None:
+            return db == DEFAULT_DB_ALIAS
+        analytics = '{}.{}'.format(app_label, model_name) in ANALYTICS_MODELS
+        return db == (ANALYTICS_DB_ALIAS if analytics else DEFAULT_DB_ALIAS)
+
+
+def analytics_database():
+    """
+    :return: the alias of the database storing the learner activity, the
+             default database unless the router is installed
+    """
+    return router.db_for_write(Try)
+
+
+@contextmanager
+def atomic():
+    """
+    Runs a block in a transaction of the default and, if the activity is
+    stored separately, in a transaction of the analytics database. The
+    analytics transaction commits first. Two database files cannot commit
+    together, a failure between the two commits keeps the activity written.
+    """
+    alias = analytics_database()
+    with transaction.atomic():
+        if alias == DEFAULT_DB_ALIAS:
+            yield
+        else:
+            with transaction.atomic(using=alias):
+                yield
+
+
+def release_references(model, ids):
+    """
+    Applies the on_delete rules of the references from the activity tables
+    to deleted rows
+    :param model: the model of the deleted rows
+    :param ids: the ids of the deleted rows
+    """
+    ids = list(ids)
+    if not ids:
+        return
+    for related, field, on_delete in REFERENCES.get(model, ()):
+        rows = related.objects.filter(**{'{}__in'.format(field): ids})
+        if on_delete is models.CASCADE:
+            rows.delete()
+        else:
+            rows.update(**{field: None})
+
+
+def ids_for(ids, model):
+    """
+    Prepares ids for a lookup in a query of another model
+    :param ids: a queryset selecting the ids
+    :param model: the model of the outer query
+    :return: the queryset as subquery if both models are stored in the same
+             database, otherwise the list of the ids
+    """
+    if router.db_for_read(ids.model) == router.db_for_read(model):
+        return ids
+    return list(ids)
@@ -0,0 +1,282 @@
+"""
+Generation of synthetic datasets for measuring the API at a realistic size.
+The users, courses and the history of tries are derived from a seed, so the
+same arguments always produce the same dataset. All rows are written with
+bulk inserts, the ids of rows referenced by other rows are assigned in
+advance. The generated users cannot log in with a password, their
+authentication tokens are random.
+"""
+
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import progress, ranking
+from .databases import atomic
+from .info.models import InformationText
+from .models import Course, CourseCategory, Module, PointsEntry, Profile, \
+    Question, QuizAnswer, QuizQuestion, Try, get_user_hash
+from .multiple_choice.models import MultipleChoiceAnswer, \
+    MultipleChoiceQuestion
+
+# prefix of the names of the generated users and courses
+PREFIX = 'synthetic'
+
+# number of rows kept in memory before they are inserted
+FLUSH_SIZE = 10000
+
+# number of answers of every multiple choice and quiz question
+NUM_ANSWERS = 4
+
+# probability that a learner answers a question wrong
+WRONG_ANSWER_RATE = 0.3
+
+# number of days the generated history reaches back
+HISTORY_DAYS = 180
+
+
+def next_id(model):
+    """
+    :return: the first free id of the model
+    """
+    return (model._base_manager.aggregate(last=Max('id'))['last'] or 0) + 1
+
+
+def insert_children(model, rows):
+    """
+    Inserts the rows of a model inheriting from Question. Django cannot bulk
+    insert models with several tables, so the rows of the Question table are
+    inserted first and the rows of the child table are inserted separately.
+    :param model: the child model
+    :param rows: the instances of the child model with their ids
+    """
+    ctype = ContentType.objects.get_for_model(model, for_concrete_model=False)
+    parents = []
+    for row in rows:
+        row.polymorphic_ctype_id = ctype.id
+        parents.append(Question(
+            id=row.id, polymorphic_ctype_id=ctype.id, **{
+                field.attname: getattr(row, field.attname)
+                for field in Question._meta.local_concrete_fields
+                if field.attname not in ('id', 'polymorphic_ctype_id')}))
+    Question.objects.bulk_create(parents)
+    fields = model._meta.local_concrete_fields
+    batch_size = max(1, 999 // len(fields))
+    for start in range(0, len(rows), batch_size):
+        model._base_manager._insert(rows[start:start + batch_size],
+                                    fields=fields)
+
+
+class BulkWriter:
+    """
+    Collects rows of several models and inserts them in bulk whenever
+    FLUSH_SIZE rows are collected
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.count = 0
+        self.written = {}
+
+    def add(self, row):
+        """
+        adds a row, all rows of the model are inserted if enough rows are
+        collected
+        """
+        self.rows.setdefault(type(row), []).append(row)
+        self.count += 1
+        if self.count >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """
+        inserts all collected rows
+        """
+        for model, rows in self.rows.items():
+            if issubclass(model, Question) and model is not Question:
+                insert_children(model, rows)
+            else:
+                model.objects.bulk_create(rows)
+            self.written[model] = self.written.get(model, 0) + len(rows)
+        self.rows = {}
+        self.count = 0
+
+
+def generate_dataset(num_users, num_courses, num_modules, num_questions,
+                     num_quiz_questions, started_courses, seed=0,
+                     moderator=False):
+    """
+    Generates users, courses with their modules, questions, answers and
+    quizzes and a history of tries of the users. Every user starts some of
+    the courses and answers their questions in order, with wrong answers in
+    between, until stopping somewhere in the course. Learners completing a
+    course take its quiz. The progress and the ranking of the users are
+    computed from the tries afterwards.
+    :param num_users: the number of users
+    :param num_courses: the number of courses
+    :param num_modules: the number of modules per course
+    :param num_questions: the number of questions per module, the first
+                          question of every module is a learning text
+    :param num_quiz_questions: the number of quiz questions per course, 0
+                               for courses without quiz
+    :param started_courses: the number of courses started by every user
+    :param seed: the seed of the random generator
+    :param moderator: whether the first user, who is responsible for the
+                      courses, is added to the moderator group
+    :return: a dictionary mapping the models to the number of written rows
+    """
+    rng = random.Random(seed)
+    writer = BulkWriter()
+    now = timezone.now()
+    with atomic():
+        users = generate_users(writer, rng, num_users)
+        # the first user is responsible for the courses
+        responsible_mod = users[0] if users else None
+        if responsible_mod and moderator:
+            group, _ = Group.objects.get_or_create(name='moderator')
+            group.user_set.add(responsible_mod.id)
+        courses = generate_courses(writer, rng, num_courses, num_modules,
+                                   num_questions, num_quiz_questions,
+                                   responsible_mod)
+        for user in users:
+            for course, questions, quiz in rng.sample(
+                    courses, min(started_courses, len(courses))):
+                start = now - timedelta(days=rng.uniform(0, HISTORY_DAYS))
+                generate_tries(writer, rng, user, course, questions, quiz,
+                               start, now)
+        writer.flush()
+        progress.rebuild_progress()
+        ranking.reconcile_rankings()
+    return writer.written
+
+
+def generate_users(writer, rng, num_users):
+    """
+    generates users with profiles and authentication tokens, the users have
+    unusable passwords and random tokens independent of the seed
+    :return: the users
+    """
+    password = make_password(None)
+    first_id = next_id(User)
+    users = []
+    for user_id in range(first_id, first_id + num_users):
+        username = '{}_{}'.format(PREFIX, user_id)
+        user = User(id=user_id, username=username, password=password,
+                    email='{}@example.com'.format(username))
+        users.append(user)
+        writer.add(user)
+        writer.add(Profile(user_id=user_id, user_hash=get_user_hash(username)))
+        token = Token(user_id=user_id)
+        token.key = token.generate_key()
+        writer.add(token)
+    writer.flush()
+    return users
+
+
+def generate_courses(writer, rng, num_courses, num_modules, num_questions,
+                     num_quiz_questions, responsible_mod):
+    """
+    generates visible courses with their content
+    :return: a list of (course, questions, quiz questions) tuples, the
+             questions in course order
+    """
+    categories = [CourseCategory.objects.get_or_create(
+        name='{} {}'.format(PREFIX, number))[0] for number in range(3)]
+    course_id = next_id(Course)
+    module_id = next_id(Module)
+    question_id = next_id(Question)
+    quiz_id = next_id(QuizQuestion)
+    courses = []
+    for _ in range(num_courses):
+        course = Course(id=course_id, name='{} course {}'.format(
+            PREFIX, course_id), category=rng.choice(categories),
+                        difficulty=rng.choice(Course.DIFFICULTY)[0],
+                        language=Course.ENG, responsible_mod=responsible_mod,
+                        is_visible=True, description='generated course')
+        course_id += 1
+        writer.add(course)
+        questions = []
+        for module_order in range(num_modules):
+            module = Module(id=module_id, course=course, order=module_order,
+                            name='module {}'.format(module_order),
+                            learning_text='learning text')
+            module_id += 1
+            writer.add(module)
+            for order in range(num_questions):
+                if order == 0:
+                    question = InformationText(
+                        title='text {}'.format(question_id),
+                        text='information', text_field='information')
+                else:
+                    question = MultipleChoiceQuestion(
+                        title='question {}'.format(question_id),
+                        text='question', question='which answer is correct',
+                        feedback='feedback')
+                question.id = question.question_ptr_id = question_id
+                question.module = module
+                question.order = order
+                question_id += 1
+                writer.add(question)
+                if order:
+                    correct = rng.sample(range(NUM_ANSWERS),
+                                         rng.randint(1, 2))
+                    for number in range(NUM_ANSWERS):
+                        writer.add(MultipleChoiceAnswer(
+                            question_id=question.id,
+                            text='answer {}'.format(number),
+                            is_correct=number in correct))
+                questions.append(question)
+        quiz = []
+        for _ in range(num_quiz_questions):
+            quiz_question = QuizQuestion(id=quiz_id, course=course,
+                                         question='quiz question')
+            quiz_id += 1
+            writer.add(quiz_question)
+            correct = rng.randrange(NUM_ANSWERS)
+            for number in range(NUM_ANSWERS):
+                writer.add(QuizAnswer(quiz=quiz_question,
+                                      text='answer {}'.format(number),
+                                      correct=number == correct))
+            quiz.append(quiz_question)
+        courses.append((course, questions, quiz))
+    writer.flush()
+    return courses
+
+
+def generate_tries(writer, rng, user, course, questions, quiz, start, end):
+    """
+    generates the tries of a user working through a course, the points of
+    the solved questions are added to the points ledger
+    :param start: the time of the first try
+    :param end: the latest time of a try
+    """
+    # the number of questions at the beginning of the course the user solves
+    solved = rng.randint(1, len(questions))
+    step = (end - start) / (2 * len(questions) + len(quiz) + 1)
+    date = start
+    for question in questions[:solved]:
+        is_text = isinstance(question, InformationText)
+        while not is_text and rng.random() < WRONG_ANSWER_RATE:
+            date += step * rng.random()
+            writer.add(Try(user=user, question=question, answer='[]',
+                           date=date, solved=False))
+        date += step * rng.random()
+        writer.add(Try(user=user, question=question, answer='[]', date=date,
+                       solved=True))
+        points = question.get_points()
+        if points:
+            writer.add(PointsEntry(user=user, points=points,
+                                   question=question, date=date))
+    if solved < len(questions):
+        return
+    for quiz_question in quiz:
+        date += step * rng.random()
+        writer.add(Try(user=user, quiz_question=quiz_question, answer='[]',
+                       date=date,
+                       solved=rng.random() >= WRONG_ANSWER_RATE))
@@ -0,0 +1,90 @@
+"""
+Streaming CSV export of tries
+"""
+
+import csv
+
+from django.utils import timezone
+
+from .models import Profile, Question
+
+# number of tries fetched from the database at once
+CHUNK_SIZE = 1000
+
+CSV_HEADER = ['question', 'user', 'date', 'solved']
+CSV_FIELDS = ('question', 'user', 'date', 'solved')
+
+
+class Echo(object):
+    """
+    file like object returning the written value, so csv.writer produces
+    the rows for a streaming response
+    """
+
+    @staticmethod
+    def write(value):
+        """
+        :return: the written value
+        """
+        return value
+
+
+def iterate_tries(tries, fields):
+    """
+    Iterates over the values of the tries in chunks of CHUNK_SIZE without
+    holding all of them in memory. Unordered querysets are read in chunks of
+    ascending ids, ordered querysets with a database iterator.
+    :param tries: a Try queryset
+    :param fields: the fields returned for every try
+    :return: a generator of lists of value tuples
+    """
+    if tries.ordered:
+        chunk = []
+        for row in tries.values_list(*fields).iterator():
+            chunk.append(row)
+            if len(chunk) == CHUNK_SIZE:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+        return
+    last_id = 0
+    while True:
+        chunk = list(tries.filter(id__gt=last_id).order_by('id').values_list(
+            'id', *fields)[:CHUNK_SIZE])
+        if chunk:
+            yield [row[1:] for row in chunk]
+        if len(chunk) < CHUNK_SIZE:
+            return
+        last_id = chunk[-1][0]
+
+
+def stream_tries_csv(tries):
+    """
+    Generates the csv export of the tries row by row. Users are anonymized
+    with the hash stored in their profile.
+    :param tries: a Try queryset
+    :return: a generator of csv lines
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    # names of the questions, fetched once per question as instances of
+    # their question type, and hashes of the users, fetched once per user
+    questions = {None: ''}
+    user_hashes = {None: ''}
+    for chunk in iterate_tries(tries, CSV_FIELDS):
+        missing = {row[0] for row in chunk} - set(questions)
+        if missing:
+            questions.update(
+                (question.id, str(question))
+                for question in Question.objects.filter(id__in=missing))
+        missing = {row[1] for row in chunk} - set(user_hashes)
+        if missing:
+            found = dict(Profile.objects.filter(user__in=missing).values_list(
+                'user', 'user_hash'))
+            user_hashes.update((user, found.get(user, '')) for user in missing)
+        for question, user, date, solved in chunk:
+            if date is not None:
+                date = timezone.localtime(date).strftime('%d/%m/%Y')
+            yield writer.writerow([questions.get(question, ''),
+                                   user_hashes.get(user, ''), date, solved])
@@ -2,6 +2,7 @@
 Models for information type questions
 """
 from django.db import models
+from learning_base.blobs import BlobField
 from learning_base.models import Question
 
 
@@ -15,7 +16,7 @@ class InformationText(Question):
 
     __name__ = "info_text"
 
-    image = models.TextField(
+    image = BlobField(
         blank=True,
     )
 
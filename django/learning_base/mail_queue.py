@@ -0,0 +1,114 @@
+"""
+Database backed queue of outgoing mails. The views enqueue their mails and
+return immediately, the send_queued_mail worker delivers the queued mails in
+batches over a single connection to the mail server. Failed deliveries are
+retried with an exponentially growing delay. Passwords sent by mail are
+created at the delivery and never stored in the queue.
+"""
+
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from .models import MailJob
+
+# number of mails delivered over one connection
+BATCH_SIZE = 50
+
+# number of deliveries tried before a job is given up
+MAX_ATTEMPTS = 5
+
+# seconds waited before the first retry, doubled for every further retry
+RETRY_DELAY = 60
+
+# replaced by the new password in the message of a password reset
+PASSWORD_PLACEHOLDER = '{password}'
+
+# length of the passwords created by password resets
+PASSWORD_LENGTH = 16
+
+
+def enqueue_mail(subject, message, from_email, recipients,
+                 password_reset=None):
+    """
+    Stores a mail in the queue, the arguments match
+    django.core.mail.send_mail
+    :param password_reset: the user whose password is replaced when the mail
+                           is delivered, the message contains
+                           PASSWORD_PLACEHOLDER at the position of the new
+                           password
+    :return: the job of the mail
+    """
+    return MailJob.objects.create(
+        subject=subject, message=message, from_email=from_email,
+        recipients='\n'.join(address for address in recipients if address),
+        password_reset=password_reset)
+
+
+def due_jobs(limit):
+    """
+    :return: the jobs to deliver now, the oldest first
+    """
+    return list(MailJob.objects.filter(
+        attempts__lt=MAX_ATTEMPTS, next_attempt__lte=timezone.now()
+    ).select_related('password_reset').order_by('id')[:limit])
+
+
+def deliver_mails(batch_size=BATCH_SIZE):
+    """
+    Delivers a batch of the queued mails over one connection. Delivered jobs
+    are removed, failed jobs are scheduled for a retry.
+    :param batch_size: the maximal number of delivered mails
+    :return: the number of delivered and the number of failed mails
+    """
+    jobs = due_jobs(batch_size)
+    if not jobs:
+        return 0, 0
+    delivered = []
+    failed = 0
+    connection = get_connection()
+    try:
+        for job in jobs:
+            message = job.message
+            if job.password_reset is not None:
+                password = get_random_string(length=PASSWORD_LENGTH)
+                message = message.replace(PASSWORD_PLACEHOLDER, password)
+            mail = EmailMessage(job.subject, message, job.from_email,
+                                job.recipients.split('\n'),
+                                connection=connection)
+            try:
+                # opens the connection unless it is open already
+                connection.open()
+                mail.send()
+            except Exception as error:
+                failed += 1
+                retry_later(job, error)
+                # the connection may be broken after a failed delivery
+                connection.close()
+            else:
+                delivered.append(job.id)
+                if job.password_reset is not None:
+                    # the password is only replaced once it reached the user
+                    job.password_reset.set_password(password)
+                    job.password_reset.save()
+    finally:
+        MailJob.objects.filter(id__in=delivered).delete()
+        connection.close()
+    return len(delivered), failed
+
+
+def retry_later(job, error):
+    """
+    Stores a failed delivery attempt of a job
+    :param job: the job
+    :param error: the exception raised by the delivery
+    """
+    job.attempts += 1
+    job.next_attempt = timezone.now() + timedelta(
+        seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+    job.last_error = str(error) or type(error).__name__
+    MailJob.objects.filter(id=job.id).update(
+        attempts=job.attempts, next_attempt=job.next_attempt,
+        last_error=job.last_error)
@@ -0,0 +1,162 @@
+"""
+management command measuring how the throughput of answer submissions scales
+with the number of worker processes
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from learning_base import views
+from learning_base.course_save import save_course
+from learning_base.models import CourseCategory, Profile, Question
+from learning_base.multiple_choice.models import MultipleChoiceAnswer
+from learning_base.workers import START_TIMEOUT, collect_results, \
+    start_workers
+
+
+def submit_answers(user_id, course_id, questions, barrier):
+    """
+    Submits the correct answers to all questions of the course as one user,
+    runs in a worker process
+    :param questions: the url indices and the correct answer ids of the
+                      questions in course order
+    :param barrier: synchronizes the start of the workers
+    :return: the number of errors and the elapsed seconds
+    """
+    user = User.objects.select_related('profile').get(id=user_id)
+    factory = APIRequestFactory()
+    view = views.QuestionView.as_view()
+    errors = 0
+    barrier.wait(START_TIMEOUT)
+    start = time.perf_counter()
+    for module_index, question_index, answers in questions:
+        request = factory.post('courses/', {'answers': answers},
+                               format='json')
+        force_authenticate(request, user)
+        try:
+            response = view(request, course_id=str(course_id),
+                            module_id=str(module_index),
+                            question_id=str(question_index))
+            if response.status_code != 200:
+                errors += 1
+        except OperationalError:
+            errors += 1
+    return errors, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    """
+    Creates a course in temporary SQLite databases and lets a growing
+    number of processes submit answers to it concurrently. Every submission
+    writes a try, the progress of the user and a points entry and updates
+    the ranking of the profile. The configured databases are not touched.
+    """
+    help = ('Measures the answer submission throughput for different '
+            'numbers of worker processes')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', default='1,2,4,8',
+            help='comma separated numbers of worker processes')
+        parser.add_argument(
+            '--submissions', type=int, default=50,
+            help='number of submissions per worker')
+        parser.add_argument(
+            '--rollback-journal', action='store_true',
+            help='use the rollback journal instead of the write ahead log')
+
+    def handle(self, *args, **options):
+        worker_counts = [int(count) for count in options['workers'].split(',')]
+        directory = tempfile.mkdtemp()
+        connections.close_all()
+        # every configured database is replaced by a temporary file
+        names = {alias: connections[alias].settings_dict['NAME']
+                 for alias in connections}
+        previous = (settings.MEDIA_ROOT,
+                    getattr(settings, 'SQLITE_PRAGMAS', {}))
+        for alias in names:
+            connections[alias].settings_dict['NAME'] = os.path.join(
+                directory, '{}.sqlite3'.format(alias))
+        settings.MEDIA_ROOT = os.path.join(directory, 'media')
+        if options['rollback_journal']:
+            settings.SQLITE_PRAGMAS = {'journal_mode': 'DELETE'}
+        try:
+            for alias in names:
+                call_command('migrate', database=alias, verbosity=0)
+            course_id, questions = self.create_course(options['submissions'])
+            self.stdout.write('workers  submissions  seconds  per second  '
+                              'errors')
+            for count in worker_counts:
+                self.run(count, course_id, questions)
+        finally:
+            connections.close_all()
+            for alias, name in names.items():
+                connections[alias].settings_dict['NAME'] = name
+            settings.MEDIA_ROOT, settings.SQLITE_PRAGMAS = previous
+            shutil.rmtree(directory)
+
+    @staticmethod
+    def create_course(num_questions):
+        """
+        :return: the id of a course with the given number of questions and
+                 the url indices and correct answers of the questions
+        """
+        CourseCategory.objects.create(name='benchmark')
+        author = User.objects.create(username='benchmark author')
+        questions = [{
+            'title': 'question {}'.format(number), 'text': 'text',
+            'feedback': '', 'type': 'multiple_choice', 'order': number,
+            'answers': [{'text': 'yes', 'is_correct': True},
+                        {'text': 'no', 'is_correct': False}]}
+                     for number in range(num_questions)]
+        course = save_course({
+            'name': 'benchmark', 'category': 'benchmark', 'difficulty': 1,
+            'language': 'en', 'responsible_mod': author,
+            'modules': [{'name': 'module', 'learning_text': 'text',
+                         'order': 0, 'questions': questions}]})
+        correct = {}
+        for question_id, answer_id in MultipleChoiceAnswer.objects.filter(
+                question__module__course=course,
+                is_correct=True).values_list('question', 'id'):
+            correct.setdefault(question_id, []).append(answer_id)
+        question_ids = Question.objects.filter(
+            module__course=course).order_by('order').values_list(
+                'id', flat=True)
+        connections.close_all()
+        return course.id, [(0, index, correct[question_id])
+                           for index, question_id in enumerate(question_ids)]
+
+    def run(self, count, course_id, questions):
+        """
+        Lets the given number of new users submit their answers at once and
+        prints the throughput
+        """
+        user_ids = []
+        for _ in range(count):
+            user = User.objects.create(
+                username='benchmark {}'.format(User.objects.count()))
+            Profile.objects.create(user=user)
+            user_ids.append(user.id)
+        connections.close_all()
+
+        barrier = multiprocessing.Barrier(count)
+        outcomes = collect_results(*start_workers(
+            submit_answers, [(user_id, course_id, questions, barrier)
+                             for user_id in user_ids]))
+
+        submissions = count * len(questions)
+        seconds = max(elapsed for _, elapsed in outcomes)
+        errors = sum(errors for errors, _ in outcomes)
+        self.stdout.write('{:7d}  {:11d}  {:7.2f}  {:10.1f}  {:6d}'.format(
+            count, submissions, seconds, submissions / seconds, errors))
@@ -0,0 +1,60 @@
+"""
+management command generating a synthetic dataset
+"""
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from learning_base.dataset import PREFIX, generate_dataset
+
+
+class Command(BaseCommand):
+    """
+    Adds generated users, courses and a history of tries to the database.
+    The progress tables and the rankings are rebuilt afterwards. Meant for
+    load tests on a copy of the database, the generated users authenticate
+    with their tokens only. Without --force the command only runs in debug
+    mode on a database without other users.
+    """
+    help = 'Generates a synthetic dataset of users, courses and tries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000,
+                            help='number of users')
+        parser.add_argument('--courses', type=int, default=50,
+                            help='number of courses')
+        parser.add_argument('--modules', type=int, default=5,
+                            help='number of modules per course')
+        parser.add_argument('--questions', type=int, default=8,
+                            help='number of questions per module')
+        parser.add_argument('--quiz', type=int, default=5,
+                            help='number of quiz questions per course, 0 '
+                                 'or 5 to 20')
+        parser.add_argument('--started', type=int, default=3,
+                            help='number of courses started by every user')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='seed of the random generator')
+        parser.add_argument('--moderator', action='store_true',
+                            help='add the user responsible for the courses '
+                                 'to the moderator group')
+        parser.add_argument('--force', action='store_true',
+                            help='run without debug mode or on a database '
+                                 'with other users')
+
+    def handle(self, *args, **options):
+        if not options['force']:
+            if not settings.DEBUG:
+                raise CommandError('DEBUG is not set, use --force to '
+                                   'generate the dataset anyway')
+            if User.objects.exclude(username__startswith=PREFIX).exists():
+                raise CommandError('The database contains other users, use '
+                                   '--force to generate the dataset anyway')
+        written = generate_dataset(
+            options['users'], options['courses'], options['modules'],
+            options['questions'], options['quiz'], options['started'],
+            options['seed'], options['moderator'])
+        for model, count in written.items():
+            self.stdout.write('{} {} rows'.format(count,
+                                                  model._meta.object_name))
+        self.stdout.write(self.style.SUCCESS('Generated the dataset'))
@@ -0,0 +1,216 @@
+"""
+management command replaying learner flows against the API and reporting the
+latency and throughput per endpoint
+"""
+
+import json
+import math
+import multiprocessing
+import random
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import resolve
+from rest_framework.authtoken.models import Token
+
+from learning_base.course_tree import get_course_index
+from learning_base.dataset import PREFIX
+from learning_base.models import Course, QuizAnswer
+from learning_base.multiple_choice.models import MultipleChoiceAnswer
+from learning_base.workers import START_TIMEOUT, collect_results, \
+    start_workers
+
+# probability that a learner submits a wrong answer before the correct one
+WRONG_ANSWER_RATE = 0.3
+
+
+def load_courses():
+    """
+    reads the generated courses with the correct answers of their questions
+    :return: a list of (course id, questions, quiz) tuples. The questions are
+             (module index, question index, correct answer ids) tuples in
+             course order, the quiz is a list of the answers of the quiz
+             questions as (quiz question id, [(answer id, correct)]) tuples
+    """
+    correct = defaultdict(list)
+    for question, answer in MultipleChoiceAnswer.objects.filter(
+            question__module__course__name__startswith=PREFIX,
+            is_correct=True).values_list('question', 'id'):
+        correct[question].append(answer)
+    quiz_answers = defaultdict(lambda: defaultdict(list))
+    for course, quiz_question, answer, is_correct in QuizAnswer.objects.filter(
+            quiz__course__name__startswith=PREFIX).order_by(
+                'quiz', 'id').values_list('quiz__course', 'quiz', 'id',
+                                          'correct'):
+        quiz_answers[course][quiz_question].append((answer, is_correct))
+    courses = []
+    for course_id in Course.objects.filter(
+            name__startswith=PREFIX).values_list('id', flat=True):
+        questions = [(module_index, question_index, correct[question])
+                     for module_index, module in enumerate(
+                         get_course_index(course_id))
+                     for question_index, (question, _) in enumerate(module)]
+        courses.append((course_id, questions,
+                        sorted(quiz_answers[course_id].items())))
+    return courses
+
+
+class Learner:
+    """
+    A user working through the courses, the requests are timed and grouped
+    by the method and the view answering them
+    """
+
+    def __init__(self, token, rng, measurements):
+        self.client = Client(HTTP_AUTHORIZATION='Token {}'.format(token))
+        self.rng = rng
+        self.measurements = measurements
+        # the position of the next question in every course
+        self.positions = defaultdict(int)
+
+    def request(self, method, path, data=None):
+        """
+        sends a request and stores its duration and status
+        """
+        start = time.perf_counter()
+        if method == 'GET':
+            response = self.client.get(path)
+        else:
+            response = self.client.post(path, json.dumps(data),
+                                        content_type='application/json')
+        elapsed = time.perf_counter() - start
+        endpoint = '{} {}'.format(method, resolve(path).func.__name__)
+        self.measurements.append((endpoint, elapsed, response.status_code))
+
+    def flow(self, course, steps):
+        """
+        Opens the catalog and the course and answers the next questions of
+        the course. Learners reaching the end of the course take the quiz
+        and start the course again.
+        :param course: the course tuple of load_courses
+        :param steps: the number of answered questions
+        """
+        course_id, questions, quiz = course
+        self.request('POST', '/courses/', {'type': '', 'category': '',
+                                           'language': 'en'})
+        self.request('GET', '/courses/{}'.format(course_id))
+        for _ in range(steps):
+            position = self.positions[course_id]
+            if position >= len(questions):
+                self.quiz(course_id, quiz)
+                self.positions[course_id] = 0
+                return
+            module_index, question_index, answers = questions[position]
+            path = '/courses/{}/{}/{}'.format(course_id, module_index,
+                                              question_index)
+            self.request('GET', path)
+            if answers and self.rng.random() < WRONG_ANSWER_RATE:
+                self.request('POST', path, {'answers': []})
+            self.request('POST', path, {'answers': answers})
+            self.positions[course_id] += 1
+
+    def quiz(self, course_id, quiz):
+        """
+        requests and answers the quiz of a course
+        """
+        if not quiz:
+            return
+        path = '/courses/{}/quiz'.format(course_id)
+        self.request('GET', path)
+        submission = [{'id': quiz_question, 'answers': [
+            {'id': answer, 'chosen': correct} for answer, correct in answers]}
+                      for quiz_question, answers in quiz]
+        self.request('POST', path, {'type': 'check_answers',
+                                    'answers': submission})
+
+
+def replay(tokens, courses, options, seed, barrier):
+    """
+    Replays learner flows, runs in a worker process
+    :param tokens: the authentication tokens of the learners of the worker
+    :param courses: the courses returned by load_courses
+    :param options: the options of the command
+    :param seed: the seed of the random generator of the worker
+    :param barrier: synchronizes the start of the workers
+    :return: the measurements and the elapsed seconds
+    """
+    rng = random.Random(seed)
+    measurements = []
+    learners = [Learner(token, rng, measurements) for token in tokens]
+    barrier.wait(START_TIMEOUT)
+    start = time.perf_counter()
+    for _ in range(options['flows']):
+        rng.choice(learners).flow(rng.choice(courses), options['steps'])
+    return measurements, time.perf_counter() - start
+
+
+def percentile(values, fraction):
+    """
+    :param values: the sorted values
+    :param fraction: the fraction of values at or below the percentile
+    :return: the percentile of the values (nearest rank)
+    """
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class Command(BaseCommand):
+    """
+    Replays learner flows (catalog, course, questions and quiz) of the users
+    created by generate_dataset against the url configuration of the
+    project. Every worker process drives its own learners. The answers are
+    written to the configured database, so run it on a copy.
+    """
+    help = ('Replays learner flows and reports the latency and throughput '
+            'per endpoint')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='number of concurrent worker processes')
+        parser.add_argument('--flows', type=int, default=20,
+                            help='number of learner flows per worker')
+        parser.add_argument('--steps', type=int, default=5,
+                            help='number of questions answered per flow')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='seed of the random generators')
+
+    def handle(self, *args, **options):
+        tokens = list(Token.objects.filter(
+            user__username__startswith=PREFIX).order_by(
+                'user').values_list('key', flat=True))
+        courses = load_courses()
+        workers = options['workers']
+        if len(tokens) < workers or not courses:
+            raise CommandError('Generate a dataset with at least {} users '
+                               'first'.format(workers))
+        connections.close_all()
+
+        barrier = multiprocessing.Barrier(workers)
+        outcomes = collect_results(*start_workers(
+            replay, [(tokens[worker::workers], courses, options,
+                      options['seed'] + worker, barrier)
+                     for worker in range(workers)]))
+        seconds = max(elapsed for _, elapsed in outcomes)
+
+        durations = defaultdict(list)
+        errors = defaultdict(int)
+        for measurements, _ in outcomes:
+            for endpoint, elapsed, status in measurements:
+                durations[endpoint].append(elapsed * 1000)
+                errors[endpoint] += status >= 400
+        self.stdout.write('{:26}  {:>8}  {:>8}  {:>8}  {:>8}  {:>9}  {:>6}'
+                          .format('endpoint', 'requests', 'p50 ms', 'p95 ms',
+                                  'p99 ms', 'per second', 'errors'))
+        for endpoint in sorted(durations):
+            values = sorted(durations[endpoint])
+            self.stdout.write(
+                '{:26}  {:8d}  {:8.1f}  {:8.1f}  {:8.1f}  {:9.1f}  {:6d}'
+                .format(endpoint, len(values), percentile(values, 0.5),
+                        percentile(values, 0.95), percentile(values, 0.99),
+                        len(values) / seconds, errors[endpoint]))
+        total = sum(len(values) for values in durations.values())
+        self.stdout.write(self.style.SUCCESS(
+            '{} requests in {:.2f} seconds, {:.1f} per second'.format(
+                total, seconds, total / seconds)))
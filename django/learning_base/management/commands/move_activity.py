@@ -0,0 +1,50 @@
+"""
+management command copying the learner activity into the analytics database
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from learning_base.databases import analytics_database
+from learning_base.models import PointsEntry, Try, UserCourseProgress, \
+    UserQuestionProgress
+
+# number of rows copied with one insert
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """
+    Copies the tries, the progress and the points ledger of a database
+    created before the split into the analytics database, keeping their
+    ids. The tables in the default database are left untouched and are no
+    longer read.
+    """
+    help = 'Copies the learner activity into the analytics database'
+
+    def handle(self, *args, **options):
+        target = analytics_database()
+        if target == DEFAULT_DB_ALIAS:
+            raise CommandError('The activity is stored in the default '
+                               'database, use the clonecademy.settings_split '
+                               'settings')
+        models = (Try, UserQuestionProgress, UserCourseProgress, PointsEntry)
+        for model in models:
+            if model.objects.using(target).exists():
+                raise CommandError('The analytics database contains {} rows '
+                                   'already'.format(model.__name__))
+        with transaction.atomic(using=target):
+            for model in models:
+                copied = 0
+                last_id = 0
+                while True:
+                    rows = list(model.objects.using(DEFAULT_DB_ALIAS).filter(
+                        id__gt=last_id).order_by('id')[:BATCH_SIZE])
+                    if not rows:
+                        break
+                    model.objects.using(target).bulk_create(rows)
+                    copied += len(rows)
+                    last_id = rows[-1].id
+                self.stdout.write('Copied {} {} rows'.format(
+                    copied, model.__name__))
+        self.stdout.write(self.style.SUCCESS('Moved the activity'))
@@ -0,0 +1,20 @@
+"""
+management command recreating the progress tables from the Try history
+"""
+
+from django.core.management.base import BaseCommand
+
+from learning_base.progress import rebuild_progress
+
+
+class Command(BaseCommand):
+    """
+    Backfills UserQuestionProgress and UserCourseProgress from all solved
+    tries. Existing progress entries are replaced.
+    """
+    help = 'Rebuilds the user progress tables from the Try history'
+
+    def handle(self, *args, **options):
+        entries = rebuild_progress()
+        self.stdout.write(
+            self.style.SUCCESS('Rebuilt {} progress entries'.format(entries)))
@@ -0,0 +1,26 @@
+"""
+management command rewriting the points ledger with the current points of
+the questions
+"""
+
+from django.core.management.base import BaseCommand
+
+from learning_base.ranking import reconcile_rankings, \
+    recompute_question_points
+
+
+class Command(BaseCommand):
+    """
+    Sets the points of the ledger entries of the questions to the current
+    points of the questions and recomputes the rankings from the ledger. The
+    entries of quiz questions and quiz bonuses are kept.
+    """
+    help = ('Recomputes the points of the answered questions and the '
+            'rankings of all users')
+
+    def handle(self, *args, **options):
+        entries = recompute_question_points()
+        profiles = reconcile_rankings()
+        self.stdout.write(self.style.SUCCESS(
+            'Updated {} points entries and reconciled {} rankings'.format(
+                entries, profiles)))
@@ -0,0 +1,20 @@
+"""
+management command recomputing the rankings from the points ledger
+"""
+
+from django.core.management.base import BaseCommand
+
+from learning_base.ranking import reconcile_rankings
+
+
+class Command(BaseCommand):
+    """
+    Sets the ranking of every profile to the sum of its entries in the
+    points ledger
+    """
+    help = 'Recomputes the ranking of all users from the points ledger'
+
+    def handle(self, *args, **options):
+        profiles = reconcile_rankings()
+        self.stdout.write(
+            self.style.SUCCESS('Reconciled {} rankings'.format(profiles)))
@@ -0,0 +1,39 @@
+"""
+management command delivering the queued mails
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from learning_base.mail_queue import BATCH_SIZE, deliver_mails
+
+
+class Command(BaseCommand):
+    """
+    Delivers the mails of the mail queue. Runs until it is stopped and polls
+    the queue in a fixed interval, or delivers the due mails once.
+    """
+    help = 'Delivers the queued mails'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='deliver the due mails and exit')
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='seconds between two polls of an empty queue')
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='number of mails delivered over one connection')
+
+    def handle(self, *args, **options):
+        while True:
+            delivered, failed = deliver_mails(options['batch_size'])
+            if delivered or failed:
+                self.stdout.write('Delivered {} mails, {} failed'.format(
+                    delivered, failed))
+            if options['once'] and delivered + failed < options['batch_size']:
+                return
+            if not delivered + failed:
+                time.sleep(options['interval'])
@@ -0,0 +1,358 @@
+"""
+Counters of the API in the text exposition format of Prometheus. Every
+process counts in memory and writes its counters to a file of its own in the
+METRICS_DIR directory at most every FLUSH_INTERVAL seconds and when it
+exits. The metrics view adds up the files of all processes, so the counters
+cover all uwsgi workers. The files of finished processes are merged into
+one file, so the counters never decrease while the directory exists.
+Nothing is counted if METRICS_DIR is not set.
+"""
+
+import atexit
+import fcntl
+import json
+import os
+import tempfile
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+# upper bounds of the buckets of the latency histograms in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+# the type and the description of every metric
+METRICS = {
+    'clonecademy_requests_total': (
+        'counter', 'Requests by view, method and status code'),
+    'clonecademy_request_duration_seconds': (
+        'histogram', 'Wall time of the requests by view'),
+    'clonecademy_db_queries_total': (
+        'counter', 'SQL queries of the requests by view'),
+    'clonecademy_db_duration_seconds_total': (
+        'counter', 'Time spent in the SQL queries of the requests by view'),
+    'clonecademy_cache_requests_total': (
+        'counter', 'Cache lookups by cache and result'),
+    'clonecademy_cache_hit_ratio': (
+        'gauge', 'Fraction of the cache lookups finding an entry by cache'),
+    'clonecademy_tries_total': (
+        'counter', 'Inserted tries'),
+}
+
+# suffixes of the series of a histogram
+HISTOGRAM_SUFFIXES = ('_bucket', '_sum', '_count')
+
+# seconds between two writes of the counters of a process
+FLUSH_INTERVAL = 10
+
+# the file with the counters of the finished processes
+MERGED_FILE = 'merged.json'
+
+# the file locked while the counters are collected
+LOCK_FILE = 'lock'
+
+
+def enabled():
+    """
+    :return: True iff the metrics are collected
+    """
+    return bool(getattr(settings, 'METRICS_DIR', None))
+
+
+class Registry:
+    """
+    The counters of the current process, keyed by the name of the series and
+    the sorted (label, value) pairs
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        removes all counters, a forked process starts with a file of its own
+        """
+        self.pid = os.getpid()
+        self.name = '{}-{}.json'.format(self.pid, int(time.time() * 1000))
+        self.counters = defaultdict(float)
+        self.flushed = None
+
+    def check_fork(self):
+        """
+        drops the counters inherited from the parent process after a fork
+        """
+        if os.getpid() != self.pid:
+            self.reset()
+
+    def increment(self, name, value=1, **labels):
+        """
+        adds a value to a counter
+        """
+        self.check_fork()
+        self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    def flush(self):
+        """
+        replaces the file of the process with the current counters
+        """
+        self.check_fork()
+        if not self.counters:
+            return
+        self.flushed = time.monotonic()
+        write_rows(os.path.join(settings.METRICS_DIR, self.name),
+                   [[name, labels, value]
+                    for (name, labels), value in self.counters.items()])
+
+    def flush_due(self):
+        """
+        writes the counters if the last write is FLUSH_INTERVAL seconds ago
+        """
+        self.check_fork()
+        if (self.flushed is None
+                or time.monotonic() - self.flushed >= FLUSH_INTERVAL):
+            self.flush()
+
+
+def write_rows(path, rows):
+    """
+    replaces a counter file, readers never see a partly written file
+    :param path: the path of the file
+    :param rows: the [name, labels, value] rows of the counters
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(handle, 'w') as file:
+        json.dump(rows, file)
+    os.replace(temporary, path)
+
+
+registry = Registry()
+
+
+@atexit.register
+def flush_at_exit():
+    """
+    writes the counters counted since the last write of the process
+    """
+    if enabled():
+        registry.flush()
+
+
+def increment(name, value=1, **labels):
+    """
+    adds a value to a counter of the current process
+    :param name: the name of the series
+    :param value: the added value
+    :param labels: the labels of the series
+    """
+    if enabled():
+        registry.increment(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    """
+    adds a duration to a histogram of the current process
+    :param name: the name of the histogram
+    :param seconds: the duration
+    :param labels: the labels of the series
+    """
+    if not enabled():
+        return
+    for bound in LATENCY_BUCKETS:
+        if seconds <= bound:
+            registry.increment(name + '_bucket', le=str(bound), **labels)
+    registry.increment(name + '_bucket', le='+Inf', **labels)
+    registry.increment(name + '_sum', seconds, **labels)
+    registry.increment(name + '_count', **labels)
+
+
+def count_cache(cache_name, hit):
+    """
+    counts a lookup in a cache
+    :param cache_name: the name of the cached data
+    :param hit: whether the cache contained an entry
+    """
+    increment('clonecademy_cache_requests_total', cache=cache_name,
+              result='hit' if hit else 'miss')
+
+
+def record_request(view, method, status, seconds, queries, db_seconds):
+    """
+    counts a request and its queries and writes the counters of the process
+    :param view: the name of the view answering the request
+    :param method: the HTTP method
+    :param status: the status code of the response
+    :param seconds: the wall time of the request
+    :param queries: the number of SQL queries
+    :param db_seconds: the time spent in the SQL queries
+    """
+    if not enabled():
+        return
+    view = view or 'unresolved'
+    increment('clonecademy_requests_total', view=view, method=method,
+              status=str(status))
+    observe('clonecademy_request_duration_seconds', seconds, view=view)
+    increment('clonecademy_db_queries_total', queries, view=view)
+    increment('clonecademy_db_duration_seconds_total', db_seconds, view=view)
+    registry.flush_due()
+
+
+def read_rows(path):
+    """
+    :return: the rows of a counter file, an empty list if the file was
+             removed or is not written by this module
+    """
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return []
+
+
+def is_running(pid):
+    """
+    :return: True iff a process with the id is running
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def add_rows(counters, rows):
+    """
+    adds the rows of a counter file to the counters
+    """
+    for name, labels, value in rows:
+        counters[(name, tuple(tuple(label) for label in labels))] += value
+
+
+def merge_finished(directory, file_names):
+    """
+    Adds the files of the finished processes to the merged file and removes
+    them. Called with the lock of the directory held.
+    :param directory: the METRICS_DIR directory
+    :param file_names: the names of the counter files of the processes
+    :return: the names of the files of the running processes
+    """
+    finished = []
+    for file_name in file_names:
+        pid = file_name.split('-')[0]
+        if pid.isdigit() and not is_running(int(pid)):
+            finished.append(file_name)
+    if not finished:
+        return file_names
+    merged = defaultdict(float)
+    add_rows(merged, read_rows(os.path.join(directory, MERGED_FILE)))
+    for file_name in finished:
+        add_rows(merged, read_rows(os.path.join(directory, file_name)))
+    write_rows(os.path.join(directory, MERGED_FILE),
+               [[name, labels, value]
+                for (name, labels), value in merged.items()])
+    for file_name in finished:
+        os.remove(os.path.join(directory, file_name))
+    return [file_name for file_name in file_names
+            if file_name not in finished]
+
+
+def collect():
+    """
+    adds up the counters written by all processes, the files of finished
+    processes are merged first
+    :return: a dictionary mapping (name, labels) keys to the values
+    """
+    registry.flush()
+    counters = defaultdict(float)
+    directory = settings.METRICS_DIR
+    if not os.path.isdir(directory):
+        return counters
+    # concurrent scrapes must not merge the same file twice
+    with open(os.path.join(directory, LOCK_FILE), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        processes = [file_name for file_name in os.listdir(directory)
+                     if file_name.endswith('.json')
+                     and file_name != MERGED_FILE]
+        for file_name in [MERGED_FILE] + merge_finished(directory,
+                                                        processes):
+            add_rows(counters, read_rows(os.path.join(directory, file_name)))
+    return counters
+
+
+def cache_ratios(counters):
+    """
+    :return: the hit ratio of every cache as (name, labels) keys and values
+    """
+    lookups = defaultdict(lambda: [0, 0])
+    for (name, labels), value in counters.items():
+        if name == 'clonecademy_cache_requests_total':
+            labels = dict(labels)
+            lookups[labels['cache']][labels['result'] == 'hit'] += value
+    return {('clonecademy_cache_hit_ratio', (('cache', cache),)):
+            hits / (hits + misses)
+            for cache, (misses, hits) in lookups.items()}
+
+
+def family(name):
+    """
+    :return: the name of the metric a series belongs to
+    """
+    for suffix in HISTOGRAM_SUFFIXES:
+        base = name[:-len(suffix)]
+        if name.endswith(suffix) and METRICS.get(base, ('',))[0] == \
+                'histogram':
+            return base
+    return name
+
+
+def format_value(value):
+    """
+    :return: the value in the exposition format, integers without fraction
+    """
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def escape(value):
+    """
+    :return: the label value escaped for the exposition format
+    """
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def series_order(row):
+    """
+    sorts the series by their name and labels, the buckets of a histogram by
+    their upper bound
+    """
+    name, labels, _ = row
+    return (name, [pair for pair in labels if pair[0] != 'le'],
+            [float(value) for label, value in labels if label == 'le'])
+
+
+def render():
+    """
+    :return: the metrics of all processes in the text exposition format
+    """
+    counters = collect()
+    counters.update(cache_ratios(counters))
+    families = defaultdict(list)
+    for (name, labels), value in counters.items():
+        families[family(name)].append((name, labels, value))
+    lines = []
+    for metric in sorted(families):
+        kind, description = METRICS.get(metric, ('untyped', ''))
+        lines.append('# HELP {} {}'.format(metric, description))
+        lines.append('# TYPE {} {}'.format(metric, kind))
+        for name, labels, value in sorted(families[metric],
+                                          key=series_order):
+            if labels:
+                # the upper bound of a bucket is written last
+                labels = sorted(labels, key=lambda pair: pair[0] == 'le')
+                name += '{' + ','.join('{}="{}"'.format(label, escape(text))
+                                       for label, text in labels) + '}'
+            lines.append('{} {}'.format(name, format_value(value)))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 06:08
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_base', '0021_usercourseprogress_unlocked'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='ranking',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+    ]
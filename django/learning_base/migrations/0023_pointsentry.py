@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 06:09
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def carry_over_rankings(apps, schema_editor):
+    """
+    stores the current ranking of every user as opening entry of the ledger
+    """
+    Profile = apps.get_model('learning_base', 'Profile')
+    PointsEntry = apps.get_model('learning_base', 'PointsEntry')
+    PointsEntry.objects.bulk_create(
+        [PointsEntry(user_id=user, points=ranking)
+         for user, ranking in Profile.objects.exclude(ranking=0).values_list(
+             'user_id', 'ranking')],
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('learning_base', '0022_auto_20261018_0608'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointsEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.IntegerField()),
+                ('date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('course', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='learning_base.Course')),
+                ('question', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='learning_base.Question')),
+                ('quiz_question', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='learning_base.QuizQuestion')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(carry_over_rankings,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 06:11
+from __future__ import unicode_literals
+
+from hashlib import sha512
+
+from django.db import migrations, models
+
+
+def fill_user_hashes(apps, schema_editor):
+    """
+    stores the anonymized hash of the username of every existing profile
+    """
+    Profile = apps.get_model('learning_base', 'Profile')
+    for profile_id, username in Profile.objects.values_list(
+            'id', 'user__username'):
+        Profile.objects.filter(id=profile_id).update(
+            user_hash=sha512(str.encode(username)).hexdigest()[:10])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_base', '0023_pointsentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='user_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=10),
+        ),
+        migrations.RunPython(fill_user_hashes, migrations.RunPython.noop),
+    ]
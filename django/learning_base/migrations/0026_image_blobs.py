@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 06:15
+from __future__ import unicode_literals
+
+from django.db import migrations
+import learning_base.blobs
+
+# the image fields moved into the blob store
+IMAGE_FIELDS = [
+    ('informationtext', 'image'),
+    ('multiplechoiceanswer', 'img'),
+    ('multiplechoicequestion', 'feedback_image'),
+    ('multiplechoicequestion', 'question_image'),
+    ('quizanswer', 'img'),
+    ('quizquestion', 'image'),
+]
+
+
+def convert_images(apps, convert, prefix):
+    """
+    converts the values of all image fields starting with the prefix
+    """
+    for model_name, field in IMAGE_FIELDS:
+        model = apps.get_model('learning_base', model_name)
+        entries = model.objects.filter(
+            **{field + '__startswith': prefix}).values_list('pk', field)
+        for pk, value in entries.iterator():
+            converted = convert(value)
+            if converted != value:
+                model.objects.filter(pk=pk).update(**{field: converted})
+
+
+def extract_images(apps, schema_editor):
+    """
+    moves the base64 images into the blob store
+    """
+    convert_images(apps, learning_base.blobs.store_data_uri, 'data:')
+
+
+def inline_images(apps, schema_editor):
+    """
+    replaces the urls of the blob store with base64 images
+    """
+    convert_images(apps, learning_base.blobs.load_data_uri,
+                   learning_base.blobs.blob_url(''))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_base', '0025_try_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='informationtext',
+            name='image',
+            field=learning_base.blobs.BlobField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='multiplechoiceanswer',
+            name='img',
+            field=learning_base.blobs.BlobField(blank=True, verbose_name='The Image for the answer'),
+        ),
+        migrations.AlterField(
+            model_name='multiplechoicequestion',
+            name='feedback_image',
+            field=learning_base.blobs.BlobField(blank=True, verbose_name='The Image for the question'),
+        ),
+        migrations.AlterField(
+            model_name='multiplechoicequestion',
+            name='question_image',
+            field=learning_base.blobs.BlobField(blank=True, verbose_name='The Image for the question'),
+        ),
+        migrations.AlterField(
+            model_name='quizanswer',
+            name='img',
+            field=learning_base.blobs.BlobField(blank=True, default='', help_text='The image for this answer'),
+        ),
+        migrations.AlterField(
+            model_name='quizquestion',
+            name='image',
+            field=learning_base.blobs.BlobField(blank=True, default='', help_text='The image which is shown in this quiz'),
+        ),
+        migrations.RunPython(extract_images, inline_images),
+    ]
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 06:16
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from learning_base import avatars
+from learning_base.default_picture import default_picture
+
+
+def store_avatars(apps, schema_editor):
+    """
+    moves the uploaded avatars into the thumbnail store, profiles with the
+    default picture or an unreadable avatar get the shared default avatar,
+    whose thumbnails are stored on demand. Nothing is written to the media
+    directory if no profile has an uploaded avatar.
+    """
+    Profile = apps.get_model('learning_base', 'Profile')
+    entries = Profile.objects.exclude(avatar__isnull=True).exclude(
+        avatar__in=['', default_picture]).values_list('id', 'avatar')
+    for profile_id, avatar in entries.iterator():
+        try:
+            avatar_hash = avatars.store_avatar(avatar)
+        except ValueError:
+            continue
+        if avatar_hash:
+            Profile.objects.filter(id=profile_id).update(
+                avatar_hash=avatar_hash)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_base', '0026_image_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Avatar of the User'),
+        ),
+        migrations.RunPython(store_avatars, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='profile',
+            name='avatar',
+        ),
+    ]
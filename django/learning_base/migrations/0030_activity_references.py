@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 06:38
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_base', '0029_mail_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pointsentry',
+            name='course',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='learning_base.Course'),
+        ),
+        migrations.AlterField(
+            model_name='pointsentry',
+            name='question',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='learning_base.Question'),
+        ),
+        migrations.AlterField(
+            model_name='pointsentry',
+            name='quiz_question',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='learning_base.QuizQuestion'),
+        ),
+        migrations.AlterField(
+            model_name='pointsentry',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='try',
+            name='question',
+            field=models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='learning_base.Question'),
+        ),
+        migrations.AlterField(
+            model_name='try',
+            name='quiz_question',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='learning_base.QuizQuestion'),
+        ),
+        migrations.AlterField(
+            model_name='try',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='usercourseprogress',
+            name='course',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='learning_base.Course'),
+        ),
+        migrations.AlterField(
+            model_name='usercourseprogress',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='userquestionprogress',
+            name='course',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='learning_base.Course'),
+        ),
+        migrations.AlterField(
+            model_name='userquestionprogress',
+            name='question',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='learning_base.Question'),
+        ),
+        migrations.AlterField(
+            model_name='userquestionprogress',
+            name='quiz_question',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='learning_base.QuizQuestion'),
+        ),
+        migrations.AlterField(
+            model_name='userquestionprogress',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
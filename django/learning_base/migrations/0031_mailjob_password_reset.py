@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 07:06
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def clear_reset_passwords(apps, schema_editor):
+    """
+    deletes the queued password reset mails, their messages contain the new
+    passwords. Users whose mail was not delivered request a new one.
+    """
+    MailJob = apps.get_model('learning_base', 'MailJob')
+    MailJob.objects.filter(
+        subject='Password Reset on clonecademy.net').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('learning_base', '0030_activity_references'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailjob',
+            name='password_reset',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(clear_reset_passwords,
+                             migrations.RunPython.noop),
+    ]
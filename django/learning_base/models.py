@@ -5,12 +5,13 @@ itself.
 """
 
 from hashlib import sha512
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 from polymorphic.models import PolymorphicModel
 
-from .default_picture import default_picture
+from .avatars import avatar_url
+from .blobs import BlobField
 
 
 class Profile(models.Model):
@@ -43,15 +44,24 @@ class Profile(models.Model):
         default="en"
     )
 
-    avatar = models.TextField(
+    # hash of the uploaded avatar, empty for the default avatar, the
+    # thumbnails are stored by learning_base.avatars
+    avatar_hash = models.CharField(
         verbose_name="Avatar of the User",
-        default=default_picture,
-        null=True,
+        max_length=64,
         blank=True,
     )
 
     ranking = models.IntegerField(
-        default=0
+        default=0,
+        db_index=True
+    )
+
+    # anonymized hash of the username, see get_user_hash
+    user_hash = models.CharField(
+        max_length=10,
+        blank=True,
+        db_index=True,
     )
 
     def get_link_to_profile(self):
@@ -72,26 +82,84 @@ class Profile(models.Model):
         """
         :return: True if the user is in the group moderators
         """
-        return self.user.groups.filter(name="moderator").exists()
+        return is_mod(self.user)
 
     def is_admin(self):
         """
         Returns True if the user is in the group admin
         :return: whether the user belong to the admin group
         """
-        return self.user.groups.filter(name="admin").exists()
+        return is_admin(self.user)
 
     def get_hash(self):
         """
-        calculates a hash to get anonymous user data
+        returns a hash to get anonymous user data
         :return: the first 10 digits of the hash
         """
-        return sha512(str.encode(self.user.username)).hexdigest()[:10]
+        if not self.user_hash:
+            self.user_hash = get_user_hash(self.user.username)
+        return self.user_hash
+
+    def get_avatar_url(self, size='large'):
+        """
+        :param size: the name of the thumbnail size, see AVATAR_SIZES
+        :return: the url of the avatar thumbnail
+        """
+        return avatar_url(self.avatar_hash, size)
+
+    def save(self, *args, **kwargs):
+        self.get_hash()
+        super(Profile, self).save(*args, **kwargs)
 
     def __str__(self):
         return str(self.user)
 
 
+def get_roles(user):
+    """
+    Returns the names of the groups of a user. The names are read with one
+    query and cached on the user object, which is created for every request,
+    so the permission classes and the view share the result.
+    :param user: the user
+    :return: a frozenset of group names
+    """
+    roles = getattr(user, '_roles', None)
+    if roles is None:
+        roles = frozenset(user.groups.values_list('name', flat=True))
+        user._roles = roles
+    return roles
+
+
+def clear_roles(user):
+    """
+    removes the cached group names of a user after the groups were changed
+    """
+    user.__dict__.pop('_roles', None)
+
+
+def is_mod(user):
+    """
+    :return: True if the user is in the group moderators
+    """
+    return 'moderator' in get_roles(user)
+
+
+def is_admin(user):
+    """
+    :return: True if the user is in the group admin
+    """
+    return 'admin' in get_roles(user)
+
+
+def get_user_hash(username):
+    """
+    calculates a hash to get anonymous user data
+    :param username: the name of the user
+    :return: the first 10 digits of the hash
+    """
+    return sha512(str.encode(username)).hexdigest()[:10]
+
+
 class CourseCategory(models.Model):
     """
     The type of a course, meaning the field in which the course belongs, e.g.
@@ -112,6 +180,15 @@ class CourseCategory(models.Model):
     def __str__(self):
         return self.name
 
+    def delete(self):
+        """
+        Deletes the category together with its courses
+        """
+        from .course_delete import delete_courses
+        with transaction.atomic():
+            delete_courses(self.course_set.all())
+            super(CourseCategory, self).delete()
+
 
 class Course(models.Model):
     """
@@ -195,6 +272,12 @@ class Course(models.Model):
         default=""
     )
 
+    # incremented whenever the course or its content is changed, see
+    # learning_base.content_cache
+    content_version = models.PositiveIntegerField(
+        default=0
+    )
+
     def __str__(self):
         return self.name
 
@@ -205,11 +288,12 @@ class Course(models.Model):
         return len(Module.objects.filter(course=self))
 
     def delete(self):
-        for module in self.module_set.all():
-            for question in module.question_set.all():
-                question.delete()
-            module.delete()
-        super(Course, self).delete()
+        """
+        Deletes the course with all its content with a few set based
+        statements
+        """
+        from .course_delete import delete_courses
+        delete_courses(Course.objects.filter(id=self.id))
 
 class Module(models.Model):
     """
@@ -376,6 +460,14 @@ class Question(PolymorphicModel):
         """
         raise NotImplementedError
 
+    def correct_answers(self):
+        """
+        Returns the ids of the correct answers for the answer key of the
+        question. Subclasses with answers need to override this method.
+        :return: a frozenset of answer ids, or None if every answer is correct
+        """
+        return None
+
     def __str__(self):
         return self.title
 
@@ -391,7 +483,7 @@ class QuizQuestion(models.Model):
         default=""
     )
 
-    image = models.TextField(
+    image = BlobField(
         help_text="The image which is shown in this quiz",
         default="",
         blank=True
@@ -403,23 +495,27 @@ class QuizQuestion(models.Model):
         on_delete=models.CASCADE
     )
 
-    def evaluate(self, data):
+    def evaluate(self, data, correct=None):
         """
         Checks whether the quiz question is answered correctly
+        :param data: the submission with the chosen answers
+        :param correct: the ids of the correct answers if they are loaded
+                        already
         :return: True iff all and only the correct answers are
                  provided
         """
-        answers = self.answer_set()
-        for ans in answers:
-            if ans.correct:
-                for i in data['answers']:
-                    if 'id' in i and (i['id'] == ans.id and not i['chosen']):
-                        return False
-            if not ans.correct:
-                for i in data:
-                    if 'id' in i and (i['id'] == ans.id and i['chosen']):
-                        return False
-        return True
+        if correct is None:
+            correct = self.correct_answers()
+        chosen = {answer['id'] for answer in data['answers']
+                  if 'id' in answer and answer.get('chosen')}
+        return chosen == correct
+
+    def correct_answers(self):
+        """
+        :return: a frozenset of the ids of the correct answers
+        """
+        return frozenset(self.quizanswer_set.filter(
+            correct=True).values_list('id', flat=True))
 
     def answer_set(self):
         """
@@ -455,7 +551,7 @@ class QuizAnswer(models.Model):
         help_text="The answer text"
     )
 
-    img = models.TextField(
+    img = BlobField(
         help_text="The image for this answer",
         default="",
         blank=True
@@ -486,24 +582,43 @@ class Try(models.Model):
     A try represents a submission of an answer. Each time an answer is
     submitted, a Try object is created in the database, detailing answer,
     whether it was answered correctly and the time of the submission.
+    The tries, the progress and the points ledger may be stored in a
+    database of their own, their references are released by
+    databases.release_references instead of the database.
     :author: Claas Voelcker
     """
+
+    class Meta:
+        # the tries are read by user and question, user and quiz question,
+        # user and time range and are counted per question. user and
+        # question are leading columns of these indexes and need no index of
+        # their own
+        index_together = (('user', 'question', 'solved'),
+                          ('user', 'quiz_question', 'solved'),
+                          ('user', 'date'),
+                          ('question', 'solved'))
+
     user = models.ForeignKey(
         User,
-        on_delete=models.SET_NULL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
         null=True,
+        db_index=False,
     )
 
     question = models.ForeignKey(
         Question,
         null=True,
-        on_delete=models.SET_NULL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
     )
 
     quiz_question = models.ForeignKey(
         QuizQuestion,
         null=True,
-        on_delete=models.SET_NULL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
     )
 
     answer = models.TextField(
@@ -514,7 +629,8 @@ class Try(models.Model):
 
     date = models.DateTimeField(
         default=timezone.now,
-        null=True
+        null=True,
+        db_index=True
     )
 
     solved = models.BooleanField(
@@ -526,12 +642,205 @@ class Try(models.Model):
             self.question, self.solved, self.date)
 
 
+class UserQuestionProgress(models.Model):
+    """
+    Marks a question or quiz question as solved by a user. An entry is
+    written the first time a solved Try is recorded, so the progress of a
+    user can be read without scanning the Try history.
+    """
+
+    class Meta:
+        unique_together = (('user', 'question'), ('user', 'quiz_question'))
+        index_together = (('user', 'course'),)
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+
+    question = models.ForeignKey(
+        Question,
+        null=True,
+        blank=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+
+    quiz_question = models.ForeignKey(
+        QuizQuestion,
+        null=True,
+        blank=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+
+    date = models.DateTimeField(
+        default=timezone.now
+    )
+
+    def __str__(self):
+        return "Progress_{}_{}".format(
+            self.user, self.question or self.quiz_question)
+
+
+class UserCourseProgress(models.Model):
+    """
+    Aggregated progress of a user in a course, maintained together with
+    UserQuestionProgress.
+    """
+
+    class Meta:
+        unique_together = ('user', 'course')
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+
+    # number of questions of the course solved by the user
+    solved_questions = models.IntegerField(
+        default=0
+    )
+
+    # number of quiz questions of the course solved by the user
+    solved_quiz_questions = models.IntegerField(
+        default=0
+    )
+
+    # position of the furthest question the user may open, counted over all
+    # questions of the course in module and question order. This equals the
+    # number of questions at the beginning of the course the user has solved
+    unlocked = models.IntegerField(
+        default=0
+    )
+
+    def __str__(self):
+        return "Progress_{}_{}".format(self.user, self.course)
+
+
+class PointsEntry(models.Model):
+    """
+    An entry of the append-only ledger of ranking points. Every award of
+    points is stored as an entry, Profile.ranking caches the sum of the
+    entries of a user. Entries without question, quiz question and course
+    carry over the points a user had before the ledger was introduced.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+
+    points = models.IntegerField()
+
+    # the question the points were awarded for
+    question = models.ForeignKey(
+        Question,
+        null=True,
+        blank=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+
+    # the quiz question the points were awarded for
+    quiz_question = models.ForeignKey(
+        QuizQuestion,
+        null=True,
+        blank=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+
+    # the course whose quiz bonus the points were awarded for
+    course = models.ForeignKey(
+        Course,
+        null=True,
+        blank=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+
+    date = models.DateTimeField(
+        default=timezone.now
+    )
+
+    def __str__(self):
+        return "Points_{}_{}_{}".format(self.user, self.points, self.date)
+
+
+class MailJob(models.Model):
+    """
+    An outgoing mail waiting in the queue. The views only store the mail,
+    it is delivered by the send_queued_mail worker, which removes the job
+    after the delivery. Jobs failing too often stay in the queue together
+    with their last error. The new password of a password reset is not
+    stored, it is created and set when the mail is delivered.
+    """
+
+    class Meta:
+        index_together = (('attempts', 'next_attempt'),)
+
+    subject = models.TextField()
+
+    message = models.TextField()
+
+    from_email = models.CharField(
+        max_length=254
+    )
+
+    # the addresses of the recipients, one per line
+    recipients = models.TextField()
+
+    attempts = models.IntegerField(
+        default=0
+    )
+
+    # the job is not delivered before this time
+    next_attempt = models.DateTimeField(
+        default=timezone.now
+    )
+
+    last_error = models.TextField(
+        blank=True,
+        default=''
+    )
+
+    # the user getting a new password with the mail, the message contains
+    # mail_queue.PASSWORD_PLACEHOLDER at the position of the password
+    password_reset = models.ForeignKey(
+        User,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE
+    )
+
+    def __str__(self):
+        return "MailJob_{}_{}".format(self.id, self.subject)
+
+
 def started_courses(user):
     """
     returns all courses started by a user
     :param user: the user that is currently accessing the database
     :return: all courses where the user has answered at least one course
     """
-    courses = Course.objects.filter(
-        module__question__try__user=user)
-    return courses.distinct()
+    # the tries may be stored in another database than the courses
+    from .databases import ids_for
+    questions = ids_for(Try.objects.filter(
+        user=user, question__isnull=False).order_by().values_list(
+            'question', flat=True).distinct(), Question)
+    return Course.objects.filter(module__question__in=questions).distinct()
@@ -3,7 +3,8 @@ module containing all models for multiple choice questions
 """
 
 from django.db import models
-from learning_base.models import Question
+from learning_base.blobs import BlobField
+from learning_base.models import Course, Question
 
 
 class MultipleChoiceQuestion(Question):
@@ -13,12 +14,12 @@ class MultipleChoiceQuestion(Question):
     """
     __name__ = "multiple_choice"
 
-    question_image = models.TextField(
+    question_image = BlobField(
         verbose_name="The Image for the question",
         blank=True,
     )
 
-    feedback_image = models.TextField(
+    feedback_image = BlobField(
         verbose_name="The Image for the question",
         blank=True,
     )
@@ -46,12 +47,14 @@ class MultipleChoiceQuestion(Question):
         the correct answers
         :author: Tobias Huber
         """
+        return self.correct_answers() == set(data)
 
-        # get all correct answers, map them to their id and make a
-        # (mathematical) set out of it"
-        answers = set([x.id for x in
-                       self.multiplechoiceanswer_set.filter(is_correct=True)])
-        return answers == set(data)
+    def correct_answers(self):
+        """
+        :return: a frozenset of the ids of the correct answers
+        """
+        return frozenset(self.multiplechoiceanswer_set.filter(
+            is_correct=True).values_list('id', flat=True))
 
     def __str__(self):
         return self.title
@@ -77,9 +80,9 @@ class MultipleChoiceQuestion(Question):
     def get_points(self):
         """
         returns the points value of the question
-        :return: 2 if the course is hard, else 1
+        :return: 2 if the course is difficult, else 1
         """
-        return 2 if self.module.course.category == 2 else 1
+        return 2 if self.module.course.difficulty == Course.DIFFICULT else 1
 
     @staticmethod
     def get_edit_serializer():
@@ -116,7 +119,7 @@ class MultipleChoiceAnswer(models.Model):
         default=False
     )
 
-    img = models.TextField(
+    img = BlobField(
         verbose_name="The Image for the answer",
         blank=True
     )
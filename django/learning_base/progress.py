@@ -0,0 +1,311 @@
+"""
+Functions maintaining and reading the materialized learning progress of the
+users (UserQuestionProgress and UserCourseProgress)
+"""
+
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .course_tree import get_course_index
+from .databases import analytics_database
+from .models import Module, Question, QuizQuestion, Try, \
+    UserQuestionProgress, UserCourseProgress
+
+
+def record_solved(user, course, question=None, quiz_question=None):
+    """
+    Stores that the user solved a question or quiz question of the course.
+    :param user: the user who solved the question
+    :param course: the course the question belongs to
+    :param question: the solved question
+    :param quiz_question: the solved quiz question
+    :return: True iff the question was not solved by the user before
+    """
+    try:
+        with transaction.atomic(using=analytics_database()):
+            UserQuestionProgress.objects.create(
+                user=user, course=course, question=question,
+                quiz_question=quiz_question)
+    except IntegrityError:
+        return False
+
+    counter = 'solved_questions' if question else 'solved_quiz_questions'
+    values = {}
+    if question:
+        values['unlocked'] = count_unlocked(question_order(course),
+                                            solved_questions(user, course))
+    increment_course_progress(user, course, counter, 1, **values)
+    return True
+
+
+def record_solved_quiz(user, course, quiz_questions):
+    """
+    Stores that the user solved quiz questions of the course with a single
+    insert. If another request stored one of the questions in the meantime,
+    the questions are stored one by one.
+    :param user: the user who solved the quiz questions
+    :param course: the course of the quiz
+    :param quiz_questions: the solved quiz questions
+    :return: the quiz questions which were not solved by the user before
+    """
+    if not quiz_questions:
+        return []
+    try:
+        with transaction.atomic(using=analytics_database()):
+            UserQuestionProgress.objects.bulk_create(
+                [UserQuestionProgress(user=user, course=course,
+                                      quiz_question=quiz_question)
+                 for quiz_question in quiz_questions])
+    except IntegrityError:
+        return [quiz_question for quiz_question in quiz_questions
+                if record_solved(user, course, quiz_question=quiz_question)]
+    increment_course_progress(user, course, 'solved_quiz_questions',
+                              len(quiz_questions))
+    return list(quiz_questions)
+
+
+def increment_course_progress(user, course, counter, amount, **values):
+    """
+    Increments a counter of the course progress of the user, the progress is
+    created if it does not exist
+    :param counter: the name of the counter field
+    :param amount: the value added to the counter
+    :param values: further field values to set
+    """
+    updated = UserCourseProgress.objects.filter(
+        user=user, course=course).update(**{counter: F(counter) + amount},
+                                         **values)
+    if not updated:
+        UserCourseProgress.objects.create(user=user, course=course,
+                                          **{counter: amount}, **values)
+
+
+def solved_questions(user, course):
+    """
+    :return: the ids of all questions of the course solved by the user
+    """
+    return set(UserQuestionProgress.objects.filter(
+        user=user, course=course, question__isnull=False
+    ).values_list('question_id', flat=True))
+
+
+def solved_questions_by_course(user, courses):
+    """
+    reads the solved questions of several courses with one query
+    :param user: the user
+    :param courses: a list of courses
+    :return: a dictionary mapping course ids to the ids of all questions of
+             the course solved by the user
+    """
+    solved = {course.id: set() for course in courses}
+    entries = UserQuestionProgress.objects.filter(
+        user=user, course__in=list(solved), question__isnull=False
+    ).values_list('course_id', 'question_id')
+    for course, question in entries:
+        solved[course].add(question)
+    return solved
+
+
+def solved_quiz_questions(user, course):
+    """
+    :return: the ids of all quiz questions of the course solved by the user
+    """
+    return set(UserQuestionProgress.objects.filter(
+        user=user, course=course, quiz_question__isnull=False
+    ).values_list('quiz_question_id', flat=True))
+
+
+def question_order(course):
+    """
+    :return: the ids of all questions of the course in module and question
+             order
+    """
+    return list(Question.objects.filter(module__course=course).order_by(
+        'module__order', 'order').values_list('id', flat=True))
+
+
+def count_unlocked(order, solved):
+    """
+    :param order: the question ids of a course in order
+    :param solved: the ids of the questions solved by a user
+    :return: the number of questions at the beginning of the course solved
+             by the user
+    """
+    unlocked = 0
+    for question in order:
+        if question not in solved:
+            break
+        unlocked += 1
+    return unlocked
+
+
+def unlocked_position(user, course):
+    """
+    :return: the position of the furthest question of the course the user
+             may open
+    """
+    unlocked = UserCourseProgress.objects.filter(
+        user=user, course=course).values_list('unlocked', flat=True).first()
+    return unlocked or 0
+
+
+def course_completed(user, course):
+    """
+    :return: True iff the user solved all questions of the course
+    """
+    num_questions = sum(len(module)
+                        for module in get_course_index(course.id))
+    return unlocked_position(user, course) >= num_questions
+
+
+def count_per_course(queryset, course_field):
+    """
+    :return: a subquery counting the entries of the queryset belonging to
+             the course of the outer query
+    """
+    return Coalesce(Subquery(queryset.filter(
+        **{course_field: OuterRef('pk')}).order_by().values(
+            course_field).annotate(count=Count('id')).values('count')),
+                    Value(0))
+
+
+def with_course_summary(courses, user):
+    """
+    Annotates the courses with the number of modules (num_modules), the
+    number of questions (num_questions) and the number of questions solved
+    by the user (num_answered). The counters are computed by subqueries, so
+    the courses are read with a single query, and the progress of the user
+    is read with a second query.
+    :param courses: a Course queryset
+    :param user: the user whose progress is annotated
+    :return: a list of the annotated courses
+    """
+    courses = list(courses.annotate(
+        num_modules=count_per_course(Module.objects.all(), 'course'),
+        num_questions=count_per_course(Question.objects.non_polymorphic(),
+                                       'module__course')))
+    # the progress may be stored in another database than the courses
+    solved = dict(UserCourseProgress.objects.filter(user=user).values_list(
+        'course_id', 'solved_questions'))
+    for course in courses:
+        course.num_answered = solved.get(course.id, 0)
+    return courses
+
+
+def refresh_course_progress(course):
+    """
+    Updates the progress of all users in a course after the questions of the
+    course were changed
+    :param course: the changed course
+    """
+    order = question_order(course)
+    solved = defaultdict(set)
+    for user, question in UserQuestionProgress.objects.filter(
+            course=course, question__isnull=False).values_list(
+                'user_id', 'question_id'):
+        solved[user].add(question)
+    for entry in UserCourseProgress.objects.filter(course=course):
+        solved_questions = len(solved[entry.user_id])
+        unlocked = count_unlocked(order, solved[entry.user_id])
+        if (entry.unlocked, entry.solved_questions) != (unlocked,
+                                                        solved_questions):
+            UserCourseProgress.objects.filter(id=entry.id).update(
+                unlocked=unlocked, solved_questions=solved_questions)
+
+
+def course_progress(course, solved):
+    """
+    calculates the progress of a user in an array of arrays. The outer array
+    is the module and the inner contains the questions, e.g.
+    [[{'solved': True, 'title': 'question 1'}], [...]]
+    A question only counts as solved if all questions before are solved.
+    :param course: the course
+    :param solved: the ids of the questions solved by the user
+    :return: the progress array
+    """
+    return progress_array([[(question.id, question.title)
+                            for question in course_module.question_set.all()]
+                           for course_module in course.module_set.all()],
+                          solved)
+
+
+def progress_array(modules, solved):
+    """
+    calculates the progress array described in course_progress
+    :param modules: a list with a list of (id, title) pairs of the questions
+                    for every module
+    :param solved: the ids of the questions solved by the user
+    :return: the progress array
+    """
+    progress = []
+    answered_question_before = True
+    for questions in modules:
+        module_set = []
+        for question_id, title in questions:
+            answered_question_before = (answered_question_before
+                                        and question_id in solved)
+            module_set.append({'solved': answered_question_before,
+                               'title': title})
+        progress.append(module_set)
+    return progress
+
+
+def rebuild_progress():
+    """
+    Recreates the progress tables from the Try history
+    :return: the number of progress entries written
+    """
+    solved_tries = Try.objects.filter(solved=True, user__isnull=False)
+    questions = solved_tries.filter(question__isnull=False).values_list(
+        'user', 'question').annotate(first_solved=Min('date'))
+    quiz_questions = solved_tries.filter(
+        quiz_question__isnull=False).values_list(
+            'user', 'quiz_question').annotate(first_solved=Min('date'))
+
+    # the courses of the questions are read separately, the tries may be
+    # stored in another database than the questions
+    orders = defaultdict(list)
+    question_courses = {}
+    for course, question in Question.objects.order_by(
+            'module__course', 'module__order', 'order').values_list(
+                'module__course', 'id'):
+        orders[course].append(question)
+        question_courses[question] = course
+    quiz_courses = dict(QuizQuestion.objects.values_list('id', 'course'))
+
+    entries = []
+    question_counter = Counter()
+    quiz_counter = Counter()
+    solved = defaultdict(set)
+    for user, question, date in questions:
+        course = question_courses[question]
+        entries.append(UserQuestionProgress(
+            user_id=user, question_id=question, course_id=course, date=date))
+        question_counter[(user, course)] += 1
+        solved[(user, course)].add(question)
+    for user, quiz_question, date in quiz_questions:
+        course = quiz_courses[quiz_question]
+        entries.append(UserQuestionProgress(
+            user_id=user, quiz_question_id=quiz_question, course_id=course,
+            date=date))
+        quiz_counter[(user, course)] += 1
+
+    with transaction.atomic(using=analytics_database()):
+        UserQuestionProgress.objects.all().delete()
+        UserCourseProgress.objects.all().delete()
+        UserQuestionProgress.objects.bulk_create(entries, batch_size=500)
+        UserCourseProgress.objects.bulk_create(
+            [UserCourseProgress(user_id=user, course_id=course,
+                                solved_questions=question_counter[(user,
+                                                                   course)],
+                                solved_quiz_questions=quiz_counter[(user,
+                                                                    course)],
+                                unlocked=count_unlocked(orders[course],
+                                                        solved[(user,
+                                                                course)]))
+             for user, course in set(question_counter) | set(quiz_counter)],
+            batch_size=500)
+    return len(entries)
@@ -0,0 +1,172 @@
+"""
+Functions awarding ranking points and reading the ranking of the users.
+Profiles are ranked by their ranking points (descending) and their id
+(ascending) for equal points, which is the order of the index on
+Profile.ranking.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Q, Sum
+
+from .authentication import forget_users
+from .databases import atomic
+from .models import Profile, PointsEntry, Question
+
+# number of profiles updated by one statement of reconcile_rankings
+UPDATE_BATCH_SIZE = 500
+
+
+def award_points(user, points, question=None, quiz_question=None,
+                 course=None):
+    """
+    Appends an entry to the points ledger and adds the points to the cached
+    ranking of the user. The ranking is incremented in the database, so
+    concurrent awards are not lost, and only the ranking column is written.
+    :param user: the user receiving the points
+    :param points: the number of points
+    :param question: the question the points are awarded for
+    :param quiz_question: the quiz question the points are awarded for
+    :param course: the course whose quiz bonus the points are awarded for
+    """
+    if not points:
+        return
+    with atomic():
+        PointsEntry.objects.create(user=user, points=points,
+                                   question=question,
+                                   quiz_question=quiz_question, course=course)
+        Profile.objects.filter(user=user).update(
+            ranking=F('ranking') + points)
+    forget_users([user.id])
+
+
+def reconcile_rankings():
+    """
+    Recomputes the ranking of all profiles from the points ledger. The sums
+    of the ledger are read with one query, since the ledger may be stored in
+    another database than the profiles, and the profiles with equal sums are
+    updated together.
+    :return: the number of updated profiles
+    """
+    users = defaultdict(list)
+    for user, total in PointsEntry.objects.order_by().values_list(
+            'user').annotate(total=Sum('points')):
+        if total:
+            users[total].append(user)
+    with transaction.atomic():
+        updated = Profile.objects.update(ranking=0)
+        for total, user_ids in users.items():
+            for start in range(0, len(user_ids), UPDATE_BATCH_SIZE):
+                Profile.objects.filter(
+                    user__in=user_ids[start:start + UPDATE_BATCH_SIZE]
+                ).update(ranking=total)
+    return updated
+
+
+def recompute_question_points():
+    """
+    Sets the points of the ledger entries of the questions to the current
+    points of the questions, after the points of a question type changed.
+    The ids are read separately from the ledger and the questions, since the
+    ledger may be stored in another database. The rankings need to be
+    reconciled afterwards.
+    :return: the number of updated entries
+    """
+    question_ids = list(PointsEntry.objects.filter(
+        question__isnull=False).order_by().values_list(
+            'question', flat=True).distinct())
+    questions = defaultdict(list)
+    for start in range(0, len(question_ids), UPDATE_BATCH_SIZE):
+        for question in Question.objects.filter(
+                id__in=question_ids[start:start + UPDATE_BATCH_SIZE]
+        ).select_related('module__course'):
+            questions[question.get_points()].append(question.id)
+    updated = 0
+    with atomic():
+        for points, ids in questions.items():
+            for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+                updated += PointsEntry.objects.filter(
+                    question__in=ids[start:start + UPDATE_BATCH_SIZE]
+                ).exclude(points=points).update(points=points)
+    return updated
+
+
+def ranked_above(ranking, profile_id):
+    """
+    :return: a filter for all profiles ranked above the given position
+    """
+    return Q(ranking__gt=ranking) | Q(ranking=ranking, id__lt=profile_id)
+
+
+def ranked_below(ranking, profile_id):
+    """
+    :return: a filter for all profiles ranked below the given position
+    """
+    return Q(ranking__lt=ranking) | Q(ranking=ranking, id__gt=profile_id)
+
+
+def get_rank(ranking, profile_id):
+    """
+    counts the profiles ranked above the given position
+    :return: the rank of the position, starting with 1
+    """
+    return Profile.objects.filter(ranked_above(ranking, profile_id)).count() + 1
+
+
+def encode_cursor(profile):
+    """
+    :return: a cursor pointing behind the profile in the ranking
+    """
+    return '{}:{}'.format(profile.ranking, profile.id)
+
+
+def decode_cursor(cursor):
+    """
+    :return: the (ranking, profile id) position the cursor points to
+    :raise: ValueError if the cursor is malformed
+    """
+    ranking, profile_id = cursor.split(':')
+    return int(ranking), int(profile_id)
+
+
+def get_page(limit, cursor=None):
+    """
+    Returns a page of the ranking
+    :param limit: the number of profiles in the page
+    :param cursor: the cursor returned with the previous page or None for
+                   the first page
+    :return: the profiles, the rank of the first profile and the cursor of
+             the next page (None for the last page)
+    """
+    profiles = Profile.objects.select_related('user').order_by('-ranking',
+                                                               'id')
+    first_rank = 1
+    if cursor:
+        ranking, profile_id = decode_cursor(cursor)
+        profiles = profiles.filter(ranked_below(ranking, profile_id))
+        first_rank = get_rank(ranking, profile_id) + 1
+    profiles = list(profiles[:limit + 1])
+    next_cursor = None
+    if len(profiles) > limit:
+        profiles = profiles[:limit]
+        next_cursor = encode_cursor(profiles[-1])
+    return profiles, first_rank, next_cursor
+
+
+def get_neighbors(profile, rank, window):
+    """
+    Returns the profiles ranked next to the given profile
+    :param profile: the profile in the center
+    :param rank: the rank of the profile
+    :param window: the number of profiles above and below the profile
+    :return: the profiles (including the given one) and the rank of the
+             first profile
+    """
+    above = list(Profile.objects.select_related('user').filter(
+        ranked_above(profile.ranking, profile.id)).order_by(
+            'ranking', '-id')[:window])
+    below = list(Profile.objects.select_related('user').filter(
+        ranked_below(profile.ranking, profile.id)).order_by(
+            '-ranking', 'id')[:window])
+    return above[::-1] + [profile] + below, rank - len(above)
@@ -0,0 +1,209 @@
+"""
+Per request measurements of the database usage. The middleware of this
+module records the number of SQL queries, the time spent in the databases
+and the wall time of every request, tagged with the view answering it. The
+measurements are written to the 'learning_base.request_metrics' logger as
+one JSON object per request if the REQUEST_METRICS setting is True and added
+to the counters of the metrics module if METRICS_DIR is set. In debug mode
+they are returned as response headers as well. The middleware is only active
+if one of the settings is set.
+
+The queries are counted by a wrapper around the cursors of every connection
+(install_query_recording), which reports to the recorders active in the
+current thread, like connection.execute_wrapper of newer Django versions.
+"""
+
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.deprecation import MiddlewareMixin
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_recording = threading.local()
+
+
+def active_recorders():
+    """
+    :return: the list of the recorders active in the current thread
+    """
+    if not hasattr(_recording, 'recorders'):
+        _recording.recorders = []
+    return _recording.recorders
+
+
+class RecordingCursor:
+    """
+    Cursor wrapper reporting the executed statements and their duration to
+    the active recorders
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.cursor.__exit__(exc_type, exc_value, traceback)
+
+    def record(self, method, sql, params):
+        """
+        runs a statement and reports it if a recorder is active
+        """
+        recorders = active_recorders()
+        if not recorders:
+            return method(sql, params)
+        start = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            seconds = time.perf_counter() - start
+            for recorder in recorders:
+                recorder.add(sql, seconds)
+
+    def execute(self, sql, params=None):
+        return self.record(self.cursor.execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self.record(self.cursor.executemany, sql, param_list)
+
+
+def install_query_recording(sender, connection, **kwargs):
+    """
+    Wraps the cursors of a connection in RecordingCursors, connected to the
+    connection_created signal
+    """
+    if getattr(connection, 'query_recording', False):
+        return
+    for name in ('make_cursor', 'make_debug_cursor'):
+        make = getattr(connection, name)
+        setattr(connection, name,
+                lambda cursor, make=make: RecordingCursor(make(cursor)))
+    connection.query_recording = True
+
+
+class QueryRecorder:
+    """
+    Context manager counting the queries of all databases executed by the
+    current thread in a block
+    :param capture: whether the SQL of the queries is kept in queries
+    """
+
+    def __init__(self, capture=False):
+        self.capture = capture
+        self.count = 0
+        self.seconds = 0
+        self.queries = []
+
+    def add(self, sql, seconds):
+        """
+        records an executed query
+        """
+        self.count += 1
+        self.seconds += seconds
+        if self.capture:
+            self.queries.append(sql)
+
+    def __enter__(self):
+        active_recorders().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        recorders = active_recorders()
+        if self in recorders:
+            recorders.remove(self)
+
+
+def view_name(request):
+    """
+    :return: the name of the view answering the request, the class name for
+             class based views, or None if no view was resolved
+    """
+    match = getattr(request, 'resolver_match', None)
+    return match.func.__name__ if match else None
+
+
+class RequestMetricsMiddleware(MiddlewareMixin):
+    """
+    Records the queries and the duration of every request. Content streamed
+    after the view returned, like the csv export, is not measured.
+    """
+
+    def __init__(self, get_response=None):
+        if not (getattr(settings, 'REQUEST_METRICS', False)
+                or metrics.enabled()):
+            raise MiddlewareNotUsed
+        super(RequestMetricsMiddleware, self).__init__(get_response)
+
+    @staticmethod
+    def process_request(request):
+        """
+        starts the measurement of the request
+        """
+        # the measurement of a request aborted by an exception outside of
+        # the view is still running
+        stale = getattr(_recording, 'request', None)
+        if stale is not None:
+            stale.__exit__(None, None, None)
+        request.metrics_start = time.perf_counter()
+        request.metrics_queries = _recording.request = \
+            QueryRecorder().__enter__()
+
+    @staticmethod
+    def finish(request, status):
+        """
+        ends the measurement of the request and logs and counts it
+        :return: the measurement or None if the request was not measured
+        """
+        recorder = getattr(request, 'metrics_queries', None)
+        if recorder is None:
+            return None
+        recorder.__exit__(None, None, None)
+        request.metrics_queries = _recording.request = None
+        seconds = time.perf_counter() - request.metrics_start
+        measurement = {
+            'view': view_name(request),
+            'method': request.method,
+            'path': request.path,
+            'status': status,
+            'queries': recorder.count,
+            'db_ms': round(recorder.seconds * 1000, 3),
+            'wall_ms': round(seconds * 1000, 3),
+        }
+        if getattr(settings, 'REQUEST_METRICS', False):
+            logger.info(json.dumps(measurement, sort_keys=True))
+        metrics.record_request(measurement['view'], request.method, status,
+                               seconds, recorder.count, recorder.seconds)
+        return measurement
+
+    def process_exception(self, request, exception):
+        """
+        measures requests whose view raised an exception, Django answers them
+        with an error page without calling process_response
+        """
+        self.finish(request, 500)
+
+    def process_response(self, request, response):
+        """
+        logs the measurements of the request and adds them to the response
+        in debug mode
+        """
+        measurement = self.finish(request, response.status_code)
+        if measurement is not None and settings.DEBUG:
+            response['X-Query-Count'] = measurement['queries']
+            response['X-DB-Time-Ms'] = measurement['db_ms']
+            response['X-Wall-Time-Ms'] = measurement['wall_ms']
+        return response
@@ -7,6 +7,8 @@ from django.contrib.auth.models import User
 from rest_framework import serializers
 from rest_framework.exceptions import ParseError
 
+from . import avatars, progress
+from .course_tree import invalidate_course_index, load_course_tree
 from .info.serializer import InformationYoutubeSerializer, \
     InformationTextSerializer
 from .multiple_choice.serializer import \
@@ -44,39 +46,44 @@ class QuestionSerializer(serializers.ModelSerializer):
         :param: obj: The object that should be serialized (Question)
         :return: value: a valid json object containing all required fields
         """
-        course_module = obj.module
+        course = obj.module.course
         value = super(QuestionSerializer, self).to_representation(obj)
         value['type'] = obj.__class__.__name__
-        user = self.context['request'].user
-
-        # calculate the current progress of the user in a array of arrays
-        # the outer array is the module and the inner
-        # is the title of the quesiton
-        # e.g [['question 1', 'question, 2'], ['quesiton 3']]
-        value['progress'] = []
-        answered_question_before = True
-        for course_module in obj.module.course.module_set.all():
-            module_set = []
-            for question in course_module.question_set.all():
-                if answered_question_before and question.try_set.filter(
-                        solved=True, user=user).exists():
-                    module_set.append({'solved': True, 'title': question.title})
-
-                else:
-                    answered_question_before = False
-                    module_set.append({'solved': False, 'title': question.title})
-            value['progress'].append(module_set)
-
-        value['last_question'] = obj.is_last_question()
-        value['last_module'] = course_module.is_last_module()
+        solved = self.solved_questions(course)
+
+        value['progress'] = progress.course_progress(course, solved)
+
+        # the module and question lists are served from the prefetch cache
+        # if the course was fetched by load_course_tree or
+        # load_course_outline
+        modules = list(course.module_set.all())
+        course_module = next(module for module in modules
+                             if module.id == obj.module_id)
+        questions = list(course_module.question_set.all())
+        value['last_question'] = obj.id == questions[-1].id
+        value['last_module'] = course_module.id == modules[-1].id
         value['learning_text'] = course_module.learning_text
         serializer = obj.get_serializer()
         value['question_body'] = serializer(obj).data
 
-        value['solved'] = obj.try_set.filter(solved=True, user=user).exists()
+        value['solved'] = obj.id in solved
 
         return value
 
+    def solved_questions(self, course):
+        """
+        The questions of the course solved by the requesting user. The set is
+        read once per course and shared with the other question serializers
+        through the context.
+        :param course: the course of the serialized question
+        :return: a set of question ids
+        """
+        solved = self.context.setdefault('solved_questions', {})
+        if course.id not in solved:
+            solved[course.id] = progress.solved_questions(
+                self.context['request'].user, course)
+        return solved[course.id]
+
     def create(self, validated_data):
         """
         Serializer that governs the dispatch to specific class serializers
@@ -172,7 +179,7 @@ class ModuleSerializer(serializers.ModelSerializer):
 
         value = super(ModuleSerializer, self).to_representation(obj)
 
-        questions = Question.objects.filter(module=obj)
+        questions = obj.question_set.all()
         questions = QuestionSerializer(
             questions, many=True, read_only=True, context=self.context).data
 
@@ -217,6 +224,99 @@ class ModuleSerializer(serializers.ModelSerializer):
                     detail='Error in question serialization', code=None)
             else:
                 question_serializer.create(question)
+        invalidate_course_index(module.course_id)
+
+
+class CourseSummarySerializer(serializers.ModelSerializer):
+    """
+    A serializer for the course catalog, it only serializes the course
+    itself and the counters annotated by progress.with_course_summary
+    """
+    category = serializers.StringRelatedField()
+
+    class Meta:
+        model = Course
+        fields = ('name', 'difficulty', 'id', 'language', 'category',
+                  'is_visible', 'description')
+
+    def to_representation(self, obj):
+        """
+        This function serializes the courses.
+        :param obj: the annotated object to be serialized
+        :return: a json serialization
+        """
+        value = super(CourseSummarySerializer, self).to_representation(obj)
+        value['num_modules'] = obj.num_modules
+        value['num_questions'] = obj.num_questions
+        value['num_answered'] = obj.num_answered
+        value['completion'] = (obj.num_answered / obj.num_questions
+                               if obj.num_questions else 0)
+        value['responsible_mod'] = obj.responsible_mod_id
+        return value
+
+
+def count_course_progress(value):
+    """
+    adds the progress counters (num_answered, num_questions, next_question
+    and current_module) to a serialized course
+    :param value: the course serialized by the CourseSerializer
+    """
+    value.pop('next_question', None)
+    value.pop('current_module', None)
+    num_questions = 0
+    num_answered = 0
+    count_question = 0
+    count_module = 0
+    for module in value['modules']:
+        count_module += 1
+        for question in module['questions']:
+            count_question += 1
+            if question['solved']:
+                num_answered += 1
+            else:
+                value['next_question'] = count_question
+                value['current_module'] = count_module
+            num_questions += 1
+    value['num_answered'] = num_answered
+    value['num_questions'] = num_questions
+
+
+def course_content(course_id):
+    """
+    serializes a course without the progress of a user, the result is cached
+    by the content cache and completed by merge_course_progress
+    :param course_id: the id of the course
+    :return: a dictionary with the serialized course ('course') and the ids
+             of the questions of every module ('questions')
+    """
+    course = load_course_tree(Course.objects.filter(id=course_id))[0]
+    value = CourseSerializer(course, context={
+        'solved_questions': {course.id: set()}}).data
+    value['quiz'] = course.quizquestion_set.exists()
+    questions = [[question.id for question in module.question_set.all()]
+                 for module in course.module_set.all()]
+    return {'course': value, 'questions': questions}
+
+
+def merge_course_progress(content, solved):
+    """
+    adds the progress of a user to the course content
+    :param content: the content returned by course_content
+    :param solved: the ids of the questions solved by the user
+    :return: the serialized course
+    """
+    value = content['course']
+    modules = list(zip(content['questions'], value['modules']))
+    course_progress = progress.progress_array(
+        [[(question_id, question['title'])
+          for question_id, question in zip(ids, module['questions'])]
+         for ids, module in modules], solved)
+    for ids, module in modules:
+        for question_id, question in zip(ids, module['questions']):
+            question['solved'] = question_id in solved
+            question['progress'] = course_progress
+    count_course_progress(value)
+    return value
 
 
 class CourseSerializer(serializers.ModelSerializer):
@@ -246,24 +346,8 @@ class CourseSerializer(serializers.ModelSerializer):
                                    context=self.context).data
 
         value['modules'] = modules
-
-        num_questions = 0
-        num_answered = 0
-        count_question = 0
-        count_module = 0
-        for module in modules:
-            count_module += 1
-            for question in module['questions']:
-                count_question += 1
-                if question['solved']:
-                    num_answered += 1
-                else:
-                    value['next_question'] = count_question
-                    value['current_module'] = count_module
-                num_questions += 1
-        value['num_answered'] = num_answered
-        value['num_questions'] = num_questions
-        value['responsible_mod'] = obj.responsible_mod.id
+        count_course_progress(value)
+        value['responsible_mod'] = obj.responsible_mod_id
         return value
 
     def create(self, validated_data):
@@ -272,79 +356,9 @@ class CourseSerializer(serializers.ModelSerializer):
         questions.
         :param validated_data: valid data for the Course object
         """
-        modules = validated_data.pop('modules')
-        quiz_data = []
-        if 'quiz' in validated_data:
-            quiz_data = validated_data.pop('quiz')
-
-        # check if course is empty and raise error if so
-        if not modules:
-            raise ParseError(detail='Course needs to have at least one module',
-                             code=None)
-        category = validated_data.pop('category')
-        category = CourseCategory.objects.get(name=category)
-        validated_data['category'] = category
-        course = Course(**validated_data)
-        course.save()
-
-        # add quiz to a course
-        if quiz_data and len(quiz_data) >= 5:
-            try:
-                if 5 <= len(quiz_data) <= 20:
-                    quiz_id = [q['id'] for q in quiz_data if 'id' in q.keys()]
-                    for quiz in course.quizquestion_set.all():
-                        if quiz.id not in quiz_id:
-                            quiz.delete()
-                    for quiz in quiz_data:
-                        quiz_serializer = QuizSerializer(data=quiz)
-                        if not quiz_serializer.is_valid():
-                            raise ParseError(
-                                detail=str(quiz_serializer.errors),
-                                code=None)
-                        else:
-                            quiz['course'] = course
-                            quiz_serializer.create(quiz)
-            except ParseError as error:
-                if 'id' not in validated_data:
-                    course.delete()
-                raise ParseError(detail=error.detail, code=None)
-        else:
-            for quiz in course.quizquestion_set.all():
-                quiz.delete()
-
-        # create a array with the ids for all module ids of this course
-        module_id = []
-        for course_module in modules:
-            if 'id' in course_module:
-                module_id.append(course_module['id'])
-
-        # check if this is a edit or creation of a new course
-        if module_id:
-            # get all modules for the current course
-            module_query = Module.objects.filter(
-                course_id=validated_data['id'])
-            # iterate over the modules and if the modules does not exist in the
-            # edited course it will be removed
-            for course_module in module_query:
-                if course_module.id not in module_id:
-                    course_module.delete()
-
-        try:
-            if len(modules) <= 0:
-                raise ParseError(detail='no Empty course allowed', code=None)
-            for module in modules:
-                module_serializer = ModuleSerializer(data=module)
-                if not module_serializer.is_valid():
-                    raise ParseError(
-                        detail='Error in module serialization', code=None)
-                else:
-                    module['course'] = course
-                    module_serializer.create(module)
-            return True
-        except ParseError as error:
-            if 'id' not in validated_data:
-                course.delete()
-            raise ParseError(detail=error.detail, code=None)
+        from .course_save import save_course
+        save_course(validated_data)
+        return True
 
 
 class CourseEditSerializer(serializers.ModelSerializer):
@@ -497,13 +511,26 @@ class UserSerializer(serializers.ModelSerializer):
 
         if 'language' not in value:
             value['language'] = 'en'
-        profile = Profile.objects.filter(user=obj).first()
+        profile = obj.profile
         value['language'] = profile.language
 
-        value['avatar'] = profile.avatar
+        value['avatar'] = profile.get_avatar_url('large')
+        value['avatar_small'] = profile.get_avatar_url('small')
         value['ranking'] = profile.ranking
         return value
 
+    @staticmethod
+    def store_avatar(value):
+        """
+        stores an uploaded avatar
+        :param value: the avatar as base64 data uri
+        :return: the hash of the avatar or None if the value is no upload
+        """
+        try:
+            return avatars.store_avatar(value)
+        except ValueError:
+            raise serializers.ValidationError({'avatar': 'invalid image'})
+
     def create(self, validated_data):
         """
         method creating a User object form a json input
@@ -516,7 +543,9 @@ class UserSerializer(serializers.ModelSerializer):
             validated_data['language'] = 'en'
         profile_data['language'] = validated_data.pop('language')
         if 'avatar' in validated_data:
-            profile_data['avatar'] = validated_data.pop('avatar')
+            avatar_hash = self.store_avatar(validated_data.pop('avatar'))
+            if avatar_hash:
+                profile_data['avatar_hash'] = avatar_hash
         # if 'language' in profile_data:
         #    profile_data['language'] = validated_data.pop('language')
         user = User.objects.create_user(**validated_data)
@@ -530,15 +559,18 @@ class UserSerializer(serializers.ModelSerializer):
         :author: Tobias Huber
         :param validated_data: validated data for the input
         """
+        avatar_hash = None
+        if 'avatar' in validated_data:
+            avatar_hash = self.store_avatar(validated_data['avatar'])
         instance.email = validated_data['email']
         instance.first_name = validated_data['first_name']
         instance.last_name = validated_data['last_name']
         if 'password' in validated_data:
             instance.set_password(validated_data['password'])
         # profile.language = validated_data['language']
-        if 'avatar' in validated_data:
+        if avatar_hash:
             profile = instance.profile
-            profile.avatar = validated_data['avatar']
+            profile.avatar_hash = avatar_hash
             profile.save()
         instance.save()
 
@@ -587,11 +619,13 @@ class RankingSerializer(serializers.BaseSerializer):
         :param instance: an ordered profile list
         :return: a dictionary with ranking information
         """
+        first_rank = self.context.get('first_rank', 1)
         value = []
-        for profile in instance:
+        for rank, profile in enumerate(instance, first_rank):
             value.append({
                 'name': profile.user.username,
                 'id': profile.id,
-                'ranking': profile.ranking
+                'ranking': profile.ranking,
+                'rank': rank
             })
         return value
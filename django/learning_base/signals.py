@@ -0,0 +1,204 @@
+"""
+signal handlers keeping denormalized data in sync with the models
+"""
+
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save, \
+    pre_delete, pre_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from .authentication import forget_tokens, forget_users
+from .content_cache import bump_content_version, versions_deferred
+from .course_delete import clear_course_content
+from .course_tree import invalidate_course_index
+from .databases import release_references
+from .models import Profile, get_user_hash, clear_roles, Course, \
+    CourseCategory, Module, Question, QuizQuestion, QuizAnswer
+from .multiple_choice.models import MultipleChoiceAnswer
+from .progress import refresh_course_progress
+
+
+@receiver(post_save, sender=User)
+def update_user_hash(sender, instance, **kwargs):
+    """
+    updates the stored anonymized hash if the username was changed
+    """
+    user_hash = get_user_hash(instance.username)
+    Profile.objects.filter(user=instance).exclude(
+        user_hash=user_hash).update(user_hash=user_hash)
+    forget_users([instance.id])
+
+
+@receiver(post_save, sender=Profile)
+def forget_profile_user(sender, instance, **kwargs):
+    """
+    removes the cached authentication of a user whose profile was changed
+    """
+    forget_users([instance.user_id])
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    """
+    removes the cached authentication of a deleted token
+    """
+    forget_tokens([instance.key])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def update_roles(sender, instance, action, pk_set, **kwargs):
+    """
+    removes the cached group names and authentications of the users whose
+    groups were changed
+    """
+    if isinstance(instance, User):
+        clear_roles(instance)
+        if action.startswith('post_'):
+            forget_users([instance.id])
+    elif action == 'pre_clear':
+        forget_users(instance.user_set.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        forget_users(pk_set)
+
+
+def changed_courses(instance):
+    """
+    :return: the courses whose content contains the instance, or None if the
+             instance is no course content
+    """
+    if isinstance(instance, Course):
+        return Course.objects.filter(id=instance.id)
+    if isinstance(instance, CourseCategory):
+        return Course.objects.filter(category=instance)
+    if isinstance(instance, Module):
+        return Course.objects.filter(id=instance.course_id)
+    if isinstance(instance, Question):
+        return Course.objects.filter(module=instance.module_id)
+    if isinstance(instance, MultipleChoiceAnswer):
+        return Course.objects.filter(module__question=instance.question_id)
+    if isinstance(instance, QuizQuestion):
+        return Course.objects.filter(id=instance.course_id)
+    if isinstance(instance, QuizAnswer):
+        return Course.objects.filter(quizquestion=instance.quiz_id)
+    return None
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def update_content_version(sender, instance, **kwargs):
+    """
+    outdates the cached content of the courses containing a changed object
+    """
+    if versions_deferred():
+        return
+    courses = changed_courses(instance)
+    if courses is not None:
+        bump_content_version(courses)
+
+
+# the fields deciding the position of the modules and questions in their
+# course, the parent first
+POSITION_FIELDS = {
+    Module: ('course_id', 'order'),
+    Question: ('module_id', 'order'),
+}
+
+
+def position_fields(instance):
+    """
+    :return: the model and the position fields of a module or question, or
+             None if the instance is neither
+    """
+    for model, fields in POSITION_FIELDS.items():
+        if isinstance(instance, model):
+            return model, fields
+    return None
+
+
+def parent_course(model, parent_id):
+    """
+    :return: the id of the course containing the parent of a module or
+             question, or None if it is deleted already
+    """
+    if model is Module:
+        return parent_id
+    return Module.objects.filter(id=parent_id).values_list(
+        'course_id', flat=True).first()
+
+
+def writes_position(fields, update_fields):
+    """
+    :param fields: the position fields of the saved row
+    :param update_fields: the fields written by the save, None for all
+    :return: True iff the save writes a position field
+    """
+    if update_fields is None:
+        return True
+    names = set(fields) | {field[:-len('_id')] for field in fields
+                           if field.endswith('_id')}
+    return bool(names & set(update_fields))
+
+
+@receiver(pre_save)
+def remember_position(sender, instance, update_fields=None, **kwargs):
+    """
+    remembers the stored position of a changed module or question, so
+    update_question_positions can skip saves keeping the position
+    """
+    position = position_fields(instance)
+    if versions_deferred() or position is None or instance.pk is None:
+        return
+    model, fields = position
+    if not writes_position(fields, update_fields):
+        instance.stored_position = tuple(getattr(instance, field)
+                                         for field in fields)
+    else:
+        instance.stored_position = model._base_manager.filter(
+            pk=instance.pk).values_list(*fields).first()
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def update_question_positions(sender, instance, created=False, **kwargs):
+    """
+    removes the cached positional index and refreshes the progress of the
+    users of the courses whose modules or questions were added, removed or
+    moved. Saves keeping the position of the row are skipped, bulk saves
+    (see course_save.py) do this once at the end.
+    """
+    position = position_fields(instance)
+    if versions_deferred() or position is None:
+        return
+    model, fields = position
+    stored = instance.__dict__.pop('stored_position', None)
+    current = tuple(getattr(instance, field) for field in fields)
+    if kwargs['signal'] is post_save and not created and stored == current:
+        return
+    courses = {parent_course(model, current[0])}
+    if stored is not None and stored[0] != current[0]:
+        courses.add(parent_course(model, stored[0]))
+    for course_id in courses - {None}:
+        invalidate_course_index(course_id)
+        refresh_course_progress(course_id)
+
+
+@receiver(pre_delete, sender=Course)
+def clear_deleted_course(sender, instance, **kwargs):
+    """
+    removes the cached content of a deleted course
+    """
+    clear_course_content([instance.id])
+
+
+@receiver(pre_delete, sender=User)
+@receiver(pre_delete, sender=Course)
+@receiver(pre_delete, sender=Question)
+@receiver(pre_delete, sender=QuizQuestion)
+def release_deleted_references(sender, instance, **kwargs):
+    """
+    applies the on_delete rules of the activity tables referencing a
+    deleted object
+    """
+    release_references(sender, [instance.pk])
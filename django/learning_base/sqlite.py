@@ -0,0 +1,24 @@
+"""
+Configuration of the SQLite connections. SQLite allows a single writer at a
+time; in the default rollback journal mode writers also block the readers,
+so concurrent requests of several uwsgi processes fail with "database is
+locked". The pragmas of the SQLITE_PRAGMAS setting are applied to every new
+connection, the shipped settings enable the write ahead log, which lets
+readers proceed during writes, and a busy timeout, which lets writers wait
+for the lock instead of failing.
+"""
+
+from django.conf import settings
+
+
+def configure_connection(sender, connection, **kwargs):
+    """
+    Applies the pragmas of the SQLITE_PRAGMAS setting to a new SQLite
+    connection, connected to the connection_created signal
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
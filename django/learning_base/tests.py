@@ -1,12 +1,40 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
 from django.utils import timezone
 from django.contrib.auth.models import User, Group, UserManager
+from PIL import Image
 
 from rest_framework.test import APIRequestFactory
 from rest_framework.test import force_authenticate
-from rest_framework.exceptions import ParseError
-
-from learning_base import views, models, serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed, ParseError
+
+from learning_base import views, models, serializers, progress, ranking, \
+    blobs, avatars, content_cache, answer_keys, mail_queue, sqlite, \
+    dataset, metrics, workers
+from learning_base.authentication import CachedTokenAuthentication
+from learning_base.databases import AnalyticsRouter
+from learning_base.request_metrics import QueryRecorder, \
+    active_recorders
+from learning_base.course_tree import load_course_tree, get_course_index, \
+    resolve_question
 from learning_base.models import Profile
 import learning_base.multiple_choice as MultipleChoice
 import learning_base.info as InformationText
@@ -15,6 +43,7 @@ import learning_base.info as InformationText
 class DatabaseMixin():
     def setup_database(self):
         self.factory = APIRequestFactory()
+        cache.clear()
 
         self.admin_group = Group.objects.create(name='admin')
         self.mod_group = Group.objects.create(name='moderator')
@@ -85,6 +114,36 @@ class DatabaseMixin():
             module=self.m1_test)
         self.q3_test.save()
 
+    def create_course(self, name, num_modules, num_questions):
+        modules = []
+        for module in range(num_modules):
+            questions = []
+            for question in range(num_questions):
+                questions.append({
+                    'title': 'question {}'.format(question),
+                    'text': 'some text',
+                    'feedback': '',
+                    'type': 'multiple_choice',
+                    'order': 2 * question,
+                    'answers': [{'text': 'yes', 'is_correct': True},
+                                {'text': 'no', 'is_correct': False}]})
+                questions.append({
+                    'title': 'info {}'.format(question),
+                    'text': 'some text',
+                    'feedback': '',
+                    'type': 'info_text',
+                    'order': 2 * question + 1,
+                    'text_field': 'information'})
+            modules.append({'name': 'module {}'.format(module),
+                            'learning_text': 'text',
+                            'order': module,
+                            'questions': questions})
+        course_data = {'name': name, 'category': 'test', 'difficulty': 1,
+                       'language': 'en', 'responsible_mod': self.u1,
+                       'modules': modules}
+        serializers.CourseSerializer(data=course_data).create(course_data)
+        return models.Course.objects.get(name=name)
+
 
 class AnswerViewTest(DatabaseMixin, TestCase):
     def setUp(self):
@@ -1401,7 +1460,7 @@ class UserViewTest(DatabaseMixin, TestCase):
             'email': self.test_user.email,
             'first_name': self.test_user.first_name,
             'last_name': self.test_user.last_name,
-            'avatar': self.test_user.profile.avatar,
+            'avatar': self.test_user.profile.get_avatar_url(),
         })
         force_authenticate(request, self.test_user)
         response = self.view(request)
@@ -1412,7 +1471,7 @@ class UserViewTest(DatabaseMixin, TestCase):
             'email': self.test_user.email,
             'first_name': 'test first name',
             'last_name': self.test_user.last_name,
-            'avatar': self.test_user.profile.avatar,
+            'avatar': self.test_user.profile.get_avatar_url(),
         })
         force_authenticate(request, self.test_user)
         response = self.view(request)
@@ -1435,7 +1494,7 @@ class UserViewTest(DatabaseMixin, TestCase):
         self.assertNotEqual(updated_user.email, 'please@dont.de')
         self.assertFalse(updated_user.first_name == 'please')
         self.assertFalse(updated_user.last_name == 'dont')
-        self.assertFalse(updated_user.profile.avatar == '...')
+        self.assertEqual(updated_user.profile.avatar_hash, '')
 
 
 class UserRegisterViewTest(DatabaseMixin, TestCase):
@@ -1547,6 +1606,8 @@ class PwResetViewTest(DatabaseMixin, TestCase):
         response = self.view(request)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(self.u1.email, 'user1@email.de')
+        # the password is replaced when the mail is delivered
+        mail_queue.deliver_mails()
         tested = User.objects.get(email='user1@email.de')
         self.assertFalse(tested.check_password('12345'))
 
@@ -1686,13 +1747,1479 @@ class RankingViewTest(TestCase, DatabaseMixin):
         self.setup_database()
 
     def test_get(self):
-        request_1 = self.factory.get('/course_categories')
+        self.normal_user.profile.ranking = 10
+        self.normal_user.profile.save()
+        self.moderator.profile.ranking = 5
+        self.moderator.profile.save()
+
+        request_1 = self.factory.get('/ranking')
         force_authenticate(request_1, self.u1)
         response = self.view(request_1)
-        self.assertEqual(serializers.RankingSerializer(models.Profile.objects.all().reverse()).data, response.data)
+        self.assertEqual(
+            [(entry['name'], entry['ranking'], entry['rank'])
+             for entry in response.data['ranking']],
+            [('normal user', 10, 1), ('moderator', 5, 2), ('admin', 0, 3)])
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(response.data['user']['rank'], 3)
+        self.assertEqual([entry['name']
+                          for entry in response.data['neighbors']],
+                         ['normal user', 'moderator', 'admin'])
+
+    def test_pages(self):
+        for i in range(5):
+            user = User.objects.create(username='user_{}'.format(i))
+            Profile.objects.create(user=user, ranking=i)
+
+        request = self.factory.get('/ranking', {'limit': 3, 'window': 1})
+        force_authenticate(request, self.u1)
+        first = self.view(request).data
+        self.assertEqual([entry['name'] for entry in first['ranking']],
+                         ['user_4', 'user_3', 'user_2'])
+        self.assertEqual([entry['name'] for entry in first['neighbors']],
+                         ['user_1', 'admin', 'normal user'])
+        self.assertEqual(first['user']['rank'], 5)
+
+        request = self.factory.get('/ranking', {'limit': 3,
+                                                'after': first['next']})
+        force_authenticate(request, self.u1)
+        with self.assertNumQueries(6):
+            second = self.view(request).data
+        self.assertEqual([(entry['name'], entry['rank'])
+                          for entry in second['ranking']],
+                         [('user_1', 4), ('admin', 5), ('normal user', 6)])
+
+        request = self.factory.get('/ranking', {'after': 'nope'})
+        force_authenticate(request, self.u1)
+        self.assertEqual(self.view(request).status_code, 400)
 
     def test_post(self):
         request_1 = self.factory.post('/course_categories')
         force_authenticate(request_1, self.u1)
         response = self.view(request_1)
         self.assertEqual(405, response.status_code)
+
+
+class ProgressTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+        self.view = views.QuestionView.as_view()
+
+    def solve_first_question(self):
+        request = self.factory.post('courses/1/0/0/',
+                                    {'answers': [self.a2_test.id]},
+                                    format='json')
+        force_authenticate(request, self.normal_user)
+        return self.view(request, course_id=self.c1_test_en.id, module_id=0,
+                         question_id=0)
+
+    def test_record_solved(self):
+        response = self.solve_first_question()
+        self.assertTrue(response.data['evaluate'])
+        self.assertTrue(models.UserQuestionProgress.objects.filter(
+            user=self.normal_user, question=self.q1_test).exists())
+        course_progress = models.UserCourseProgress.objects.get(
+            user=self.normal_user, course=self.c1_test_en)
+        self.assertEqual(course_progress.solved_questions, 1)
+
+        # solving a question again neither adds progress nor points
+        ranking = Profile.objects.get(user=self.normal_user).ranking
+        self.solve_first_question()
+        self.assertEqual(models.UserQuestionProgress.objects.filter(
+            user=self.normal_user).count(), 1)
+        self.assertEqual(
+            Profile.objects.get(user=self.normal_user).ranking, ranking)
+
+        request = self.factory.get('courses/1/0/0/')
+        request.user = self.normal_user
+        data = serializers.QuestionSerializer(
+            self.q1_test, context={'request': request}).data
+        self.assertTrue(data['solved'])
+        self.assertEqual([[entry['solved'] for entry in module]
+                          for module in data['progress']],
+                         [[True, False, False]])
+
+    def test_unlocked(self):
+        access = views.QuestionView.can_access_question
+        self.assertTrue(access(self.normal_user, self.q1_test, 0, 0))
+        self.assertFalse(access(self.normal_user, self.q2_test, 0, 1))
+
+        self.solve_first_question()
+        self.assertTrue(access(self.normal_user, self.q2_test, 0, 1))
+        self.assertFalse(access(self.normal_user, self.q3_test, 0, 2))
+        self.assertFalse(progress.course_completed(self.normal_user,
+                                                   self.c1_test_en))
+
+        # removing the second question unlocks the third one
+        self.q2_test.delete()
+        progress.refresh_course_progress(self.c1_test_en)
+        self.assertTrue(access(self.normal_user, self.q3_test, 0, 1))
+
+    def test_rebuild(self):
+        self.solve_first_question()
+        models.Try(user=self.normal_user, question=self.q2_test,
+                   solved=True).save()
+        models.Try(user=self.u1, question=self.q1_test, solved=False).save()
+
+        call_command('rebuild_progress', stdout=StringIO())
+
+        self.assertEqual(
+            set(models.UserQuestionProgress.objects.values_list(
+                'user', 'question')),
+            {(self.normal_user.id, self.q1_test.id),
+             (self.normal_user.id, self.q2_test.id)})
+        self.assertEqual(models.UserCourseProgress.objects.get(
+            user=self.normal_user).solved_questions, 2)
+        self.assertEqual(progress.unlocked_position(self.normal_user,
+                                                    self.c1_test_en), 2)
+
+
+class CourseTreeTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+
+    def count_queries(self, course):
+        request = self.factory.get('/courses/' + str(course.id))
+        force_authenticate(request, self.u1)
+        with CaptureQueriesContext(connection) as queries:
+            response = views.CourseView.as_view()(request, course_id=course.id)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_constant_queries(self):
+        small = self.create_course('small', 1, 1)
+        large = self.create_course('large', 5, 4)
+        self.assertEqual(self.count_queries(small), self.count_queries(large))
+
+    def test_tree(self):
+        course = self.create_course('tree', 2, 2)
+        loaded = load_course_tree(models.Course.objects.filter(id=course.id))
+        with self.assertNumQueries(0):
+            modules = loaded[0].module_set.all()
+            self.assertEqual(len(modules), 2)
+            questions = modules[1].question_set.all()
+            self.assertEqual([q.title for q in questions],
+                             ['question 0', 'info 0', 'question 1', 'info 1'])
+            self.assertEqual(len(questions[0].answer_set()), 2)
+            self.assertEqual(questions[1].module.course, loaded[0])
+
+    def test_resolve_question(self):
+        self.assertEqual(
+            [[question for question, _ in module]
+             for module in get_course_index(self.c1_test_en.id)],
+            [[self.q1_test.id, self.q2_test.id, self.q3_test.id]])
+        with self.assertNumQueries(1):
+            question = resolve_question(self.c1_test_en.id, 0, 1)
+            self.assertEqual(question.module.course, self.c1_test_en)
+        self.assertIsInstance(question, InformationText.models.InformationText)
+        self.assertEqual(question, self.q2_test)
+        with self.assertRaises(models.Question.DoesNotExist):
+            resolve_question(self.c1_test_en.id, 0, 3)
+
+        # saving a course invalidates the index
+        course = self.create_course('resolve', 1, 1)
+        self.assertEqual(len(get_course_index(course.id)[0]), 2)
+        module = course.module_set.first()
+        question = module.question_set.first()
+        edit_data = {
+            'id': course.id, 'name': 'resolve', 'category': 'test',
+            'difficulty': 1, 'language': 'en', 'responsible_mod': self.u1,
+            'modules': [{
+                'id': module.id, 'name': 'module', 'learning_text': 'text',
+                'order': 0,
+                'questions': [{
+                    'id': question.id, 'title': 'question', 'text': 'text',
+                    'feedback': '', 'type': 'multiple_choice', 'order': 0,
+                    'answers': [{'text': 'yes', 'is_correct': True}]}]}]}
+        serializers.CourseSerializer(data=edit_data).create(edit_data)
+        self.assertEqual(len(get_course_index(course.id)[0]), 1)
+
+    def test_orm_changes(self):
+        progress.record_solved(self.u1, self.c1_test_en, question=self.q1_test)
+        progress.record_solved(self.u1, self.c1_test_en, question=self.q2_test)
+        self.assertEqual(resolve_question(self.c1_test_en.id, 0, 1),
+                         self.q2_test)
+
+        # questions added and deleted outside of the course editor
+        added = InformationText.models.InformationText.objects.create(
+            title='added', text='text', feedback='', order=4,
+            module=self.m1_test)
+        self.q2_test.delete()
+        self.assertEqual(resolve_question(self.c1_test_en.id, 0, 1),
+                         self.q3_test)
+        self.assertEqual(resolve_question(self.c1_test_en.id, 0, 2), added)
+        self.assertEqual(progress.unlocked_position(self.u1, self.c1_test_en),
+                         1)
+
+        # only saves changing the position refresh the progress
+        refresh_path = 'learning_base.signals.refresh_course_progress'
+        with mock.patch(refresh_path) as refresh:
+            self.q3_test.title = 'renamed'
+            self.q3_test.save()
+            added.save(update_fields=['title'])
+            self.m1_test.save()
+            refresh.assert_not_called()
+            added.order = 5
+            added.save()
+            refresh.assert_called_once_with(self.c1_test_en.id)
+
+        # a question moved to another course changes both courses
+        other = models.Course.objects.create(
+            name='other', category=self.category,
+            responsible_mod=self.moderator)
+        module = models.Module.objects.create(
+            name='module', learning_text='', order=0, course=other)
+        with mock.patch(refresh_path) as refresh:
+            added.module = module
+            added.save()
+            self.assertEqual({call[0][0] for call in refresh.call_args_list},
+                             {self.c1_test_en.id, other.id})
+        self.assertEqual(len(get_course_index(self.c1_test_en.id)[0]), 2)
+        self.assertEqual(get_course_index(other.id)[0][0][0], added.id)
+
+
+class PointsLedgerTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+
+    def test_award_points(self):
+        ranking.award_points(self.normal_user, 2, question=self.q1_test)
+        ranking.award_points(self.normal_user, 3)
+        ranking.award_points(self.normal_user, 0)
+        self.assertEqual(models.PointsEntry.objects.filter(
+            user=self.normal_user).count(), 2)
+        self.assertEqual(
+            Profile.objects.get(user=self.normal_user).ranking, 5)
+
+    def test_question_points(self):
+        request = self.factory.post('courses/1/0/0/',
+                                    {'answers': [self.a2_test.id]},
+                                    format='json')
+        force_authenticate(request, self.normal_user)
+        views.QuestionView.as_view()(request, course_id=self.c1_test_en.id,
+                                     module_id=0, question_id=0)
+        entry = models.PointsEntry.objects.get(user=self.normal_user)
+        self.assertEqual(entry.question.id, self.q1_test.id)
+        self.assertEqual(entry.points, self.q1_test.get_points())
+        self.assertEqual(Profile.objects.get(user=self.normal_user).ranking,
+                         entry.points)
+
+    def test_reconcile(self):
+        ranking.award_points(self.normal_user, 4)
+        Profile.objects.filter(user=self.normal_user).update(ranking=1)
+        Profile.objects.filter(user=self.moderator).update(ranking=7)
+
+        call_command('reconcile_ranking', stdout=StringIO())
+
+        self.assertEqual(
+            Profile.objects.get(user=self.normal_user).ranking, 4)
+        self.assertEqual(Profile.objects.get(user=self.moderator).ranking, 0)
+
+    def test_recompute_points(self):
+        ranking.award_points(self.normal_user, 1, question=self.q1_test)
+        ranking.award_points(self.normal_user, 3)
+        ranking.award_points(self.u1, 1, question=self.q1_test)
+        self.c1_test_en.difficulty = models.Course.DIFFICULT
+        self.c1_test_en.save()
+
+        call_command('recompute_points', stdout=StringIO())
+
+        self.assertEqual(sorted(models.PointsEntry.objects.values_list(
+            'points', flat=True)), [2, 2, 3])
+        self.assertEqual(
+            Profile.objects.get(user=self.normal_user).ranking, 5)
+        self.assertEqual(Profile.objects.get(user=self.u1).ranking, 2)
+
+
+class StatisticsAggregationTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+        self.view = views.StatisticsView.as_view()
+        for user, question, solved in [
+                (self.u1, self.q1_test, False), (self.u1, self.q1_test, True),
+                (self.u1, self.q2_test, True), (self.u1, None, False),
+                (self.normal_user, self.q1_test, True)]:
+            models.Try(user=user, question=question, solved=solved).save()
+
+    def post(self, data):
+        request = self.factory.post('statistics', data, format='json')
+        force_authenticate(request, self.u1)
+        return self.view(request)
+
+    def test_filter(self):
+        for field in ['solved', 'question', 'user']:
+            expected = {}
+            for trie in models.Try.objects.filter(user=self.u1):
+                key = str(getattr(trie, field))
+                expected[key] = expected.get(key, 0) + 1
+            response = self.post({'id': self.u1.id, 'filter': field})
+            self.assertEqual(response.data, expected)
+        response = self.post({'id': self.u1.id, 'filter': 'nothing'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_categories_with_counter(self):
+        models.CourseCategory.objects.create(name='empty')
+        response = self.post({'id': self.u1.id,
+                              'categories__with__counter': True})
+        self.assertEqual(response.data, [
+            {'name': 'test', 'color': '#000000', 'counter': 3},
+            {'name': 'empty', 'color': '#000000', 'counter': 0}])
+
+    def test_list_questions(self):
+        with self.assertNumQueries(8):
+            response = self.post({'id': self.u1.id,
+                                  'course': self.c1_test_en.id,
+                                  'list_questions': True})
+        self.assertEqual(response.data, [[
+            {'name': '', 'solved': 2, 'not solved': 1},
+            {'name': '', 'solved': 1, 'not solved': 0},
+            {'name': 'youtube video', 'solved': 0, 'not solved': 0}]])
+
+
+class StatisticsExportTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+        for question, solved in [(self.q1_test, False), (self.q1_test, True),
+                                 (self.q3_test, True), (None, False)]:
+            models.Try(user=self.u1, question=question, solved=solved).save()
+
+    def export(self, chunk_size):
+        request = self.factory.post('statistics', {'id': self.u1.id,
+                                                   'format': 'csv'},
+                                    format='json')
+        force_authenticate(request, self.u1)
+        with mock.patch('learning_base.export.CHUNK_SIZE', chunk_size):
+            response = views.StatisticsView.as_view()(request)
+            self.assertTrue(response.streaming)
+            content = b''.join(response.streaming_content).decode()
+        return list(csv.reader(StringIO(content)))
+
+    def test_csv(self):
+        expected = [['question', 'user', 'date', 'solved']]
+        for trie in models.Try.objects.order_by('id'):
+            expected.append([str(trie.question or ''),
+                             self.u1_profile.get_hash(),
+                             trie.date.strftime('%d/%m/%Y'),
+                             str(trie.solved)])
+        self.assertEqual(self.export(2), expected)
+        self.assertEqual(self.export(1000), expected)
+
+    def test_user_hash(self):
+        self.assertEqual(self.u1_profile.user_hash,
+                         models.get_user_hash('admin'))
+        self.u1.username = 'renamed'
+        self.u1.save()
+        self.assertEqual(Profile.objects.get(user=self.u1).user_hash,
+                         models.get_user_hash('renamed'))
+
+
+class TryQueryPlanTest(DatabaseMixin, TestCase):
+    """
+    Runs EXPLAIN QUERY PLAN on the queries of the endpoints reading the Try
+    table and fails if the table is scanned instead of searched with an
+    index
+    """
+
+    def setUp(self):
+        self.setup_database()
+        users = [self.u1, self.normal_user, self.moderator] + [
+            User.objects.create(username='learner {}'.format(i))
+            for i in range(17)]
+        questions = [self.q1_test, self.q2_test, self.q3_test]
+        for i in range(9):
+            course = models.Course.objects.create(
+                name='course {}'.format(i), category=self.category,
+                language='en', responsible_mod=self.moderator,
+                is_visible=True)
+            module = models.Module.objects.create(
+                name='module', course=course, order=1)
+            for order in range(3):
+                questions.append(InformationText.models.InformationText.objects
+                                 .create(title='', text='', feedback='',
+                                         order=order, module=module))
+        self.mod_course = course
+        quiz_question = models.QuizQuestion.objects.create(
+            course=self.c1_test_en, question='quiz')
+        models.Try.objects.bulk_create(
+            [models.Try(user=users[i % 20], question=questions[i % 30],
+                        solved=i % 7 == 0)
+             for i in range(1200)]
+            + [models.Try(user=users[i % 20], quiz_question=quiz_question,
+                          solved=i % 7 == 0)
+               for i in range(60)])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertNoTryScan(self, view, request, user):
+        force_authenticate(request, user)
+        with CaptureQueriesContext(connection) as queries:
+            response = view(request)
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+        explained = 0
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or 'learning_base_try' not in sql:
+                continue
+            explained += 1
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = [row[-1] for row in cursor.fetchall()]
+            for step in plan:
+                self.assertNotRegex(
+                    step, r'^SCAN (TABLE )?learning_base_try\b',
+                    '{}\n{}'.format(sql, '\n'.join(plan)))
+        self.assertTrue(explained)
+
+    def statistics(self, data, user=None):
+        request = self.factory.post('statistics', data, format='json')
+        self.assertNoTryScan(views.StatisticsView.as_view(), request,
+                             user or self.normal_user)
+
+    def test_statistics_get(self):
+        request = self.factory.get('statistics')
+        self.assertNoTryScan(views.StatisticsView.as_view(), request,
+                             self.normal_user)
+
+    def test_statistics_post(self):
+        user_id = self.normal_user.id
+        for data in [
+                {'id': user_id},
+                {'id': user_id, 'solved': True},
+                {'id': user_id, 'date': {'start': '2000-01-01',
+                                         'end': '2100-01-01'}},
+                {'id': user_id, 'solved': False,
+                 'date': {'start': '2000-01-01', 'end': '2100-01-01'}},
+                {'id': user_id, 'course': self.c1_test_en.id},
+                {'id': user_id, 'categories__with__counter': True},
+                {'id': user_id, 'filter': 'question'},
+                {'id': user_id, 'format': 'csv'}]:
+            self.statistics(data)
+
+    def test_statistics_course(self):
+        self.statistics({'date': {'start': '2000-01-01',
+                                  'end': '2000-01-02'}}, self.u1)
+        self.statistics({'course': self.mod_course.id}, self.moderator)
+        self.statistics({'course': self.c1_test_en.id,
+                         'list_questions': True}, self.u1)
+
+    def test_started_courses(self):
+        request = self.factory.post('courses', {'type': 'started',
+                                                'category': '',
+                                                'language': 'en'},
+                                    format='json')
+        self.assertNoTryScan(views.MultiCourseView.as_view(), request,
+                             self.u1)
+
+
+class BlobStoreTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_settings.enable()
+        self.setup_database()
+        self.image = b'\x89PNG not really a png'
+        self.data_uri = 'data:image/png;base64,' + base64.b64encode(
+            self.image).decode()
+
+    def tearDown(self):
+        self.media_settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_store(self):
+        self.a1_test.img = self.data_uri
+        self.a1_test.save()
+        self.a2_test.img = self.data_uri
+        self.a2_test.save()
+        url = self.a1_test.img
+        self.assertTrue(url.startswith('/media/blobs/'))
+        self.assertTrue(url.endswith('.png'))
+        self.assertEqual(self.a2_test.img, url)
+        self.assertEqual(MultipleChoice.models.MultipleChoiceAnswer.objects.get(
+            id=self.a1_test.id).img, url)
+        self.assertEqual(serializers.get_answer_serializer(self.a1_test)['img'],
+                         url)
+        files = [name for _, _, names in os.walk(self.media_root)
+                 for name in names]
+        self.assertEqual(len(files), 1)
+        with open(blobs.blob_path(url[len(blobs.blob_url('')):]), 'rb') as blob:
+            self.assertEqual(blob.read(), self.image)
+        self.assertEqual(blobs.load_data_uri(url), self.data_uri)
+
+    def test_unchanged(self):
+        for value in ['', '/media/blobs/00/00.png', 'data:image/png;base64,!!',
+                      'data:text/html;base64,' + base64.b64encode(
+                          b'<script></script>').decode()]:
+            self.assertEqual(blobs.store_data_uri(value), value)
+        self.assertEqual(os.listdir(self.media_root), [])
+
+
+class AvatarTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_settings.enable()
+        self.setup_database()
+        self.view = views.UserView.as_view()
+        self.normal_user.set_password('12345')
+        self.normal_user.save()
+
+    def tearDown(self):
+        self.media_settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def upload(self, avatar):
+        request = self.factory.post('user/current', {
+            'oldpassword': '12345',
+            'email': '',
+            'first_name': '',
+            'last_name': '',
+            'avatar': avatar}, format='json')
+        force_authenticate(request, self.normal_user)
+        return self.view(request)
+
+    def test_default(self):
+        for i in range(5):
+            Profile.objects.create(user=User.objects.create(
+                username='user {}'.format(i)))
+        request = self.factory.get('user/')
+        force_authenticate(request, self.u1)
+        # permission check, users with profiles and groups
+        with self.assertNumQueries(3):
+            response = views.MultiUserView.as_view()(request)
+        urls = {user['avatar'] for user in response.data}
+        self.assertEqual(urls, {avatars.avatar_url('')})
+        # the thumbnails of the default avatar are stored on demand
+        for size, _ in avatars.AVATAR_SIZES:
+            self.assertTrue(os.path.exists(blobs.blob_path(avatars.avatar_name(
+                avatars.default_avatar_hash(), size))))
+
+    def test_upload(self):
+        image = BytesIO()
+        Image.new('RGBA', (300, 200), 'red').save(image, 'PNG')
+        response = self.upload('data:image/png;base64,' + base64.b64encode(
+            image.getvalue()).decode())
+        self.assertEqual(response.status_code, 200)
+        profile = Profile.objects.get(user=self.normal_user)
+        self.assertEqual(len(profile.avatar_hash), 64)
+        for size, length in avatars.AVATAR_SIZES:
+            url = profile.get_avatar_url(size)
+            path = blobs.blob_path(url[len(blobs.blob_url('')):])
+            with Image.open(path) as thumbnail:
+                self.assertEqual(thumbnail.size, (length, length))
+                self.assertEqual(thumbnail.format, 'JPEG')
+
+        request = self.factory.get('user/current')
+        force_authenticate(request, self.normal_user)
+        response = self.view(request)
+        self.assertEqual(response.data['avatar'],
+                         profile.get_avatar_url('large'))
+        self.assertEqual(response.data['avatar_small'],
+                         profile.get_avatar_url('small'))
+
+    def test_invalid(self):
+        response = self.upload('data:image/png;base64,' + base64.b64encode(
+            b'no image').decode())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Profile.objects.get(
+            user=self.normal_user).avatar_hash, '')
+
+
+class CourseSummaryTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+        self.view = views.MultiCourseView.as_view()
+
+    def post(self, summary):
+        request = self.factory.post('courses', {'type': '', 'category': '',
+                                                'language': 'en',
+                                                'summary': summary},
+                                    format='json')
+        # a new user object for every request, like the authentication
+        force_authenticate(request, User.objects.get(id=self.u1.id))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.view(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(queries)
+
+    def test_summary(self):
+        course = self.create_course('large', 3, 2)
+        first = load_course_tree(models.Course.objects.filter(id=course.id))[
+            0].module_set.all()[0].question_set.all()[0]
+        progress.record_solved(self.u1, course, question=first)
+        progress.record_solved(self.u1, self.c1_test_en, question=self.q1_test)
+        summary, num_queries = self.post(True)
+        full, _ = self.post(False)
+        self.assertEqual(len(summary), 2)
+        for course_summary, course_full in zip(summary, full):
+            self.assertNotIn('modules', course_summary)
+            for key in ['id', 'name', 'category', 'num_questions',
+                        'num_answered', 'responsible_mod']:
+                self.assertEqual(course_summary[key], course_full[key])
+        self.assertEqual([c['num_modules'] for c in summary], [1, 3])
+        self.assertEqual([c['completion'] for c in summary], [1 / 3, 1 / 12])
+
+        for i in range(5):
+            self.create_course('course {}'.format(i), 2, 2)
+        summary, more_queries = self.post(True)
+        self.assertEqual(len(summary), 7)
+        self.assertEqual(num_queries, more_queries)
+
+
+class ContentCacheTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+
+    def get_course(self, user=None):
+        request = self.factory.get('/courses/1')
+        force_authenticate(request, user or self.u1)
+        response = views.CourseView.as_view()(request,
+                                               course_id=self.c1_test_en.id)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def get_answers(self):
+        request = self.factory.get('/courses/1/1/1/answers')
+        force_authenticate(request, self.u1)
+        return views.AnswerView.as_view()(request, self.c1_test_en.id, 0,
+                                          0).data
+
+    def test_course(self):
+        self.get_course()
+        # the content version and the solved questions of the user
+        with self.assertNumQueries(2):
+            data = self.get_course()
+        self.assertEqual(data['num_answered'], 0)
+
+        progress.record_solved(self.u1, self.c1_test_en,
+                               question=self.q1_test)
+        with self.assertNumQueries(2):
+            data = self.get_course()
+        self.assertFalse(data.pop('quiz'))
+        self.assertEqual(data, serializers.CourseSerializer(
+            load_course_tree(models.Course.objects.filter(
+                id=self.c1_test_en.id))[0],
+            context={'solved_questions': {
+                self.c1_test_en.id: {self.q1_test.id}}}).data)
+        self.assertEqual(self.get_course(self.normal_user)['num_answered'], 0)
+
+        request = self.factory.post('/courses/1/toggleVisibility',
+                                    {'is_visible': 'false'})
+        force_authenticate(request, self.u1)
+        views.ToggleCourseVisibilityView.as_view()(
+            request, course_id=str(self.c1_test_en.id))
+        self.assertFalse(self.get_course()['is_visible'])
+
+        self.q2_test.title = 'changed'
+        self.q2_test.save()
+        self.assertEqual(
+            self.get_course()['modules'][0]['questions'][1]['title'],
+            'changed')
+
+    def test_answers(self):
+        self.assertEqual([a['text'] for a in self.get_answers()],
+                         ['something', 'something'])
+        with self.assertNumQueries(1):
+            self.get_answers()
+        self.a1_test.text = 'changed'
+        self.a1_test.save()
+        self.assertEqual([a['text'] for a in self.get_answers()],
+                         ['changed', 'something'])
+
+    def test_delete(self):
+        self.get_course()
+        self.c1_test_en.delete()
+        for version in range(20):
+            self.assertIsNone(cache.get(content_cache.content_key(
+                self.c1_test_en.id, version, 'course')))
+
+
+class RolesTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+
+    def test_roles(self):
+        user = User.objects.select_related('profile').get(
+            id=self.moderator.id)
+        with self.assertNumQueries(1):
+            self.assertTrue(models.is_mod(user))
+            self.assertFalse(models.is_admin(user))
+            self.assertTrue(user.profile.is_mod())
+        user.groups.add(self.admin_group)
+        self.assertTrue(models.is_admin(user))
+
+    def test_multi_course_view(self):
+        request = self.factory.post('courses', {'type': '', 'category': '',
+                                                'language': 'en',
+                                                'summary': True},
+                                    format='json')
+        force_authenticate(request, User.objects.get(id=self.moderator.id))
+        with CaptureQueriesContext(connection) as queries:
+            views.MultiCourseView.as_view()(request)
+        self.assertEqual(
+            len([query for query in queries.captured_queries
+                 if 'auth_group' in query['sql']]), 1)
+
+
+class CachedTokenAuthenticationTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+        self.token = Token.objects.create(user=self.normal_user)
+
+    def authenticate(self):
+        request = self.factory.get(
+            'user', HTTP_AUTHORIZATION='Token {}'.format(self.token.key))
+        return CachedTokenAuthentication().authenticate(request)
+
+    def test_cached(self):
+        with self.assertNumQueries(2):
+            user, token = self.authenticate()
+        self.assertEqual(user.id, self.normal_user.id)
+        self.assertEqual(token.key, self.token.key)
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate()
+            self.assertEqual(user.profile.language, 'en')
+            self.assertFalse(models.is_mod(user))
+
+    def test_deleted_token(self):
+        self.authenticate()
+        self.token.delete()
+        self.assertRaises(AuthenticationFailed, self.authenticate)
+
+    def test_inactive_user(self):
+        self.authenticate()
+        self.normal_user.is_active = False
+        self.normal_user.save()
+        self.assertRaises(AuthenticationFailed, self.authenticate)
+
+    def test_changed_groups(self):
+        user, _ = self.authenticate()
+        self.assertFalse(models.is_mod(user))
+        self.mod_group.user_set.add(self.normal_user)
+        user, _ = self.authenticate()
+        self.assertTrue(models.is_mod(user))
+
+    def test_changed_ranking(self):
+        self.authenticate()
+        ranking.award_points(self.normal_user, 5)
+        user, _ = self.authenticate()
+        self.assertEqual(user.profile.ranking, 5)
+
+
+class QuizGradingTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+        self.quiz = []
+        for number in range(6):
+            quiz_question = models.QuizQuestion.objects.create(
+                question='question {}'.format(number),
+                course=self.c1_test_en)
+            answers = [
+                models.QuizAnswer.objects.create(text='yes', correct=True,
+                                                 quiz=quiz_question),
+                models.QuizAnswer.objects.create(text='no', correct=False,
+                                                 quiz=quiz_question)]
+            self.quiz.append((quiz_question, answers))
+
+    def check_answers(self, wrong):
+        answers = []
+        for number, (quiz_question, quiz_answers) in enumerate(self.quiz):
+            answers.append({'id': quiz_question.id, 'answers': [
+                {'id': answer.id,
+                 'chosen': answer.correct != (number in wrong)}
+                for answer in quiz_answers]})
+        request = self.factory.post(
+            'courses/{}/quiz/'.format(self.c1_test_en.id),
+            {'type': 'check_answers', 'answers': answers}, format='json')
+        force_authenticate(request, self.normal_user)
+        return views.QuizView.as_view()(request,
+                                        course_id=self.c1_test_en.id)
+
+    def test_grading(self):
+        response = self.check_answers(wrong={1})
+        self.assertEqual([entry['solved'] for entry in response.data],
+                         [True, False, True, True, True, True])
+        self.assertEqual([entry['points'] for entry in response.data],
+                         [1, 0, 1, 1, 1, 1])
+        self.assertEqual(models.Try.objects.filter(
+            user=self.normal_user, quiz_question__isnull=False).count(), 6)
+        self.assertEqual(progress.solved_quiz_questions(
+            self.normal_user, self.c1_test_en),
+            {quiz_question.id
+             for number, (quiz_question, _) in enumerate(self.quiz)
+             if number != 1})
+
+        response = self.check_answers(wrong=set())
+        self.assertEqual([entry['points'] for entry in response.data],
+                         [0, 1, 0, 0, 0, 0])
+        self.assertEqual(models.UserCourseProgress.objects.get(
+            user=self.normal_user,
+            course=self.c1_test_en).solved_quiz_questions, 6)
+
+    def test_queries(self):
+        # the number of queries does not depend on the number of questions
+        with CaptureQueriesContext(connection) as queries:
+            self.check_answers(wrong=set())
+        models.Try.objects.all().delete()
+        models.UserQuestionProgress.objects.all().delete()
+        models.UserCourseProgress.objects.all().delete()
+        models.PointsEntry.objects.all().delete()
+        self.quiz = self.quiz[:3]
+        models.QuizQuestion.objects.exclude(
+            id__in=[quiz_question.id for quiz_question, _ in self.quiz]
+        ).delete()
+        with self.assertNumQueries(len(queries.captured_queries)):
+            self.check_answers(wrong=set())
+
+
+class AnswerKeyTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+
+    def load_question(self, question):
+        return type(question).objects.select_related('module__course').get(
+            id=question.id)
+
+    def test_question_key(self):
+        question = self.load_question(self.q1_test)
+        answer_keys.question_key(question)
+        with self.assertNumQueries(0):
+            answer_key = answer_keys.question_key(question)
+            self.assertTrue(answer_keys.grade(answer_key, [self.a2_test.id]))
+            self.assertFalse(answer_keys.grade(
+                answer_key, [self.a1_test.id, self.a2_test.id]))
+        self.assertEqual(answer_key.points, 1)
+        self.assertTrue(answer_keys.grade(
+            answer_keys.question_key(self.load_question(self.q2_test)), []))
+
+        self.a1_test.is_correct = True
+        self.a1_test.save()
+        answer_key = answer_keys.question_key(self.load_question(self.q1_test))
+        self.assertTrue(answer_keys.grade(
+            answer_key, [self.a1_test.id, self.a2_test.id]))
+
+    def test_points(self):
+        self.c1_test_en.difficulty = models.Course.DIFFICULT
+        self.c1_test_en.save()
+        self.assertEqual(answer_keys.question_key(
+            self.load_question(self.q1_test)).points, 2)
+
+    def test_quiz_key(self):
+        quiz_question = models.QuizQuestion.objects.create(
+            question='question', course=self.c1_test_en)
+        correct = models.QuizAnswer.objects.create(
+            text='yes', correct=True, quiz=quiz_question)
+        wrong = models.QuizAnswer.objects.create(
+            text='no', correct=False, quiz=quiz_question)
+        course = models.Course.objects.get(id=self.c1_test_en.id)
+        self.assertEqual(answer_keys.quiz_key(course),
+                         {quiz_question.id: frozenset([correct.id])})
+        self.assertFalse(quiz_question.evaluate(
+            {'answers': [{'id': correct.id, 'chosen': False},
+                         {'id': wrong.id, 'chosen': True}]}))
+        submission = {'answers': [{'id': correct.id, 'chosen': True},
+                                  {'id': wrong.id, 'chosen': True}]}
+        self.assertFalse(quiz_question.evaluate(submission))
+
+        wrong.correct = True
+        wrong.save()
+        course = models.Course.objects.get(id=self.c1_test_en.id)
+        self.assertTrue(quiz_question.evaluate(
+            submission, answer_keys.quiz_key(course)[quiz_question.id]))
+
+
+class CourseSaveTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+        self.course = self.create_course('save', 2, 2)
+
+    def edit_data(self):
+        modules = []
+        for module in self.course.module_set.all():
+            questions = []
+            for question in module.question_set.all():
+                data = {'id': question.id, 'title': question.title,
+                        'text': question.text, 'feedback': question.feedback,
+                        'order': question.order}
+                if isinstance(question,
+                              MultipleChoice.models.MultipleChoiceQuestion):
+                    data['type'] = 'multiple_choice'
+                    data['answers'] = [
+                        {'id': answer.id, 'text': answer.text,
+                         'is_correct': answer.is_correct}
+                        for answer in question.answer_set()]
+                else:
+                    data['type'] = 'info_text'
+                    data['text_field'] = question.text_field
+                questions.append(data)
+            modules.append({'id': module.id, 'name': module.name,
+                            'learning_text': module.learning_text,
+                            'order': module.order, 'questions': questions})
+        return {'id': self.course.id, 'name': 'save', 'category': 'test',
+                'difficulty': 1, 'language': 'en', 'responsible_mod': self.u1,
+                'modules': modules}
+
+    def save(self, data):
+        serializers.CourseSerializer(data=data).create(data)
+
+    def test_unchanged(self):
+        stored = self.edit_data()
+        with CaptureQueriesContext(connection) as queries:
+            self.save(self.edit_data())
+        self.assertFalse([query['sql'] for query in queries.captured_queries
+                          if query['sql'].startswith(('INSERT', 'DELETE'))])
+        self.assertEqual(self.edit_data(), stored)
+
+    def test_diff(self):
+        data = self.edit_data()
+        first, second = data['modules']
+        first['order'], second['order'] = second['order'], first['order']
+        removed = first['questions'].pop(1)
+        first['questions'][0]['answers'][0]['text'] = 'maybe'
+        first['questions'][0]['answers'].append(
+            {'text': 'new', 'is_correct': False})
+        version = models.Course.objects.get(id=self.course.id).content_version
+        self.save(data)
+
+        self.assertEqual([module.id for module in self.course.module_set.all()],
+                         [second['id'], first['id']])
+        self.assertFalse(models.Question.objects.filter(
+            id=removed['id']).exists())
+        question = models.Question.objects.get(
+            id=first['questions'][0]['id'])
+        self.assertEqual([answer.text for answer in question.answer_set()],
+                         ['maybe', 'no', 'new'])
+        self.assertEqual(
+            models.Course.objects.get(id=self.course.id).content_version,
+            version + 1)
+        self.assertEqual([len(module) for module in
+                          get_course_index(self.course.id)], [4, 3])
+
+    def test_move_question(self):
+        data = self.edit_data()
+        first, second = data['modules']
+        # the question keeps its order in the other module
+        moved = first['questions'].pop(1)
+        for question in second['questions'][1:]:
+            question['order'] += 1
+        second['questions'].insert(1, moved)
+        self.save(data)
+
+        module = models.Module.objects.get(id=second['id'])
+        self.assertEqual(
+            [question.id for question in module.question_set.all()],
+            [question['id'] for question in second['questions']])
+        self.assertEqual(models.Question.objects.get(id=moved['id']).order,
+                         moved['order'])
+
+    def test_rollback(self):
+        data = self.edit_data()
+        data['modules'][0]['name'] = 'renamed'
+        data['modules'][1]['questions'][0]['answers'] = [
+            {'text': 'no', 'is_correct': False}]
+        with self.assertRaises(ParseError):
+            self.save(data)
+        self.assertEqual(self.course.module_set.first().name, 'module 0')
+        self.assertEqual(models.Question.objects.filter(
+            module__course=self.course).count(), 8)
+
+
+class CourseDeleteTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+
+    def create_content(self, name, num_modules):
+        course = self.create_course(name, num_modules, 2)
+        question = models.Question.objects.filter(
+            module__course=course).first()
+        quiz_question = models.QuizQuestion.objects.create(
+            question='quiz', course=course)
+        models.QuizAnswer.objects.create(text='yes', correct=True,
+                                         quiz=quiz_question)
+        models.Try.objects.create(user=self.normal_user, question=question,
+                                  answer='[]', solved=True)
+        progress.record_solved(self.normal_user, course, question=question)
+        ranking.award_points(self.normal_user, 1, question=question)
+        return course
+
+    def test_delete_course(self):
+        course = self.create_content('delete', 2)
+        get_course_index(course.id)
+        course.delete()
+        self.assertFalse(models.Course.objects.filter(id=course.id).exists())
+        self.assertFalse(models.Module.objects.filter(course=course.id).exists())
+        self.assertEqual(models.Question.objects.count(), 3)
+        self.assertEqual(
+            MultipleChoice.models.MultipleChoiceQuestion.objects.count(), 1)
+        self.assertEqual(
+            MultipleChoice.models.MultipleChoiceAnswer.objects.count(), 2)
+        self.assertFalse(models.QuizQuestion.objects.exists())
+        self.assertFalse(models.QuizAnswer.objects.exists())
+        self.assertFalse(models.UserQuestionProgress.objects.exists())
+        self.assertFalse(models.UserCourseProgress.objects.exists())
+        self.assertEqual(models.Try.objects.get().question, None)
+        self.assertEqual(models.PointsEntry.objects.get().question, None)
+        self.assertEqual(get_course_index(course.id), [])
+
+    def test_queries(self):
+        # the number of statements does not depend on the size of the course
+        small = self.create_content('small', 1)
+        large = self.create_content('large', 5)
+        with CaptureQueriesContext(connection) as queries:
+            small.delete()
+        with self.assertNumQueries(len(queries.captured_queries)):
+            large.delete()
+
+    def test_delete_category(self):
+        self.create_content('category', 1)
+        self.category.delete()
+        self.assertFalse(models.Course.objects.exists())
+        self.assertFalse(models.Question.objects.exists())
+
+
+class MailQueueTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+        self.normal_user.email = 'user@example.com'
+        self.normal_user.save()
+
+    def test_password_reset(self):
+        request = self.factory.post('pw-reset/',
+                                    {'email': 'user@example.com'})
+        response = views.PwResetView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(models.MailJob.objects.count(), 1)
+        # the password is neither stored nor changed before the delivery
+        self.assertIn(mail_queue.PASSWORD_PLACEHOLDER,
+                      models.MailJob.objects.get().message)
+        password = self.normal_user.password
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.'
+                        'send_messages', side_effect=OSError('refused')):
+            self.assertEqual(mail_queue.deliver_mails(), (0, 1))
+        self.assertEqual(User.objects.get(id=self.normal_user.id).password,
+                         password)
+        models.MailJob.objects.update(next_attempt=timezone.now())
+
+        out = StringIO()
+        call_command('send_queued_mail', once=True, stdout=out)
+        self.assertIn('Delivered 1 mails, 0 failed', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['user@example.com'])
+        self.assertFalse(models.MailJob.objects.exists())
+        new_password = mail.outbox[0].body.split('\n')[4].strip()
+        self.assertEqual(len(new_password), mail_queue.PASSWORD_LENGTH)
+        self.assertTrue(User.objects.get(
+            id=self.normal_user.id).check_password(new_password))
+
+    def test_batches(self):
+        for number in range(5):
+            mail_queue.enqueue_mail('subject {}'.format(number), 'message',
+                                    'bot@clonecademy.de',
+                                    ['user@example.com', ''])
+        self.assertEqual(mail_queue.deliver_mails(batch_size=3), (3, 0))
+        self.assertEqual(mail_queue.deliver_mails(batch_size=3), (2, 0))
+        self.assertEqual([message.subject for message in mail.outbox],
+                         ['subject {}'.format(number) for number in range(5)])
+        self.assertEqual(mail.outbox[0].to, ['user@example.com'])
+
+    def test_retry(self):
+        mail_queue.enqueue_mail('subject', 'message', 'bot@clonecademy.de',
+                                ['user@example.com'])
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.'
+                        'send_messages', side_effect=OSError('refused')):
+            self.assertEqual(mail_queue.deliver_mails(), (0, 1))
+        job = models.MailJob.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.last_error, 'refused')
+        self.assertGreater(job.next_attempt, timezone.now())
+        # the job is not delivered before the delay has passed
+        self.assertEqual(mail_queue.deliver_mails(), (0, 0))
+
+        models.MailJob.objects.update(next_attempt=timezone.now())
+        self.assertEqual(mail_queue.deliver_mails(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+        job = mail_queue.enqueue_mail('subject', 'message',
+                                      'bot@clonecademy.de',
+                                      ['user@example.com'])
+        models.MailJob.objects.filter(id=job.id).update(
+            attempts=mail_queue.MAX_ATTEMPTS)
+        self.assertEqual(mail_queue.deliver_mails(), (0, 0))
+
+
+class SQLiteConfigurationTest(TestCase):
+    @override_settings(SQLITE_PRAGMAS={'busy_timeout': 1234})
+    def test_pragmas(self):
+        sqlite.configure_connection(None, connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 1234)
+
+
+class DatabasesTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+
+    def test_router(self):
+        router = AnalyticsRouter()
+        self.assertEqual(router.db_for_write(models.Try), 'analytics')
+        self.assertEqual(router.db_for_read(models.PointsEntry), 'analytics')
+        self.assertEqual(router.db_for_read(models.Course), 'default')
+        self.assertEqual(router.db_for_read(User), 'default')
+        self.assertTrue(router.allow_migrate('analytics', 'learning_base',
+                                             'usercourseprogress'))
+        self.assertFalse(router.allow_migrate('default', 'learning_base',
+                                              'usercourseprogress'))
+        self.assertTrue(router.allow_migrate('default', 'auth', 'user'))
+        self.assertFalse(router.allow_migrate('analytics', 'learning_base'))
+
+    def test_delete_user(self):
+        user = User.objects.create(username='deleted')
+        models.Try.objects.create(user=user, question=self.q1_test,
+                                  solved=True)
+        progress.record_solved(user, self.c1_test_en, question=self.q1_test)
+        ranking.award_points(user, 1, question=self.q1_test)
+        user.delete()
+        self.assertIsNone(models.Try.objects.get().user_id)
+        self.assertFalse(models.UserQuestionProgress.objects.exists())
+        self.assertFalse(models.UserCourseProgress.objects.exists())
+        self.assertFalse(models.PointsEntry.objects.exists())
+
+    def test_delete_question(self):
+        models.Try.objects.create(user=self.u1, question=self.q1_test,
+                                  solved=True)
+        progress.record_solved(self.u1, self.c1_test_en, question=self.q1_test)
+        ranking.award_points(self.u1, 1, question=self.q1_test)
+        models.Question.objects.filter(id=self.q1_test.id).delete()
+        self.assertIsNone(models.Try.objects.get().question_id)
+        self.assertFalse(models.UserQuestionProgress.objects.exists())
+        self.assertIsNone(models.PointsEntry.objects.get().question_id)
+
+
+class DatasetTest(TestCase):
+    def test_generate(self):
+        written = dataset.generate_dataset(
+            num_users=4, num_courses=2, num_modules=2, num_questions=3,
+            num_quiz_questions=5, started_courses=2, seed=1, moderator=True)
+        self.assertEqual(written[User], 4)
+        self.assertEqual(models.Profile.objects.count(), 4)
+        self.assertEqual(Token.objects.count(), 4)
+        self.assertEqual(models.Module.objects.count(), 4)
+        self.assertEqual(
+            InformationText.models.InformationText.objects.count(), 4)
+        self.assertEqual(
+            MultipleChoice.models.MultipleChoiceQuestion.objects.count(), 8)
+        self.assertEqual(
+            MultipleChoice.models.MultipleChoiceAnswer.objects.count(), 32)
+        self.assertEqual(models.QuizQuestion.objects.count(), 10)
+        for question in models.Question.objects.all():
+            self.assertTrue(question.correct_answers() is None
+                            or question.correct_answers())
+        self.assertEqual(written[models.Try], models.Try.objects.count())
+
+        # the progress and the rankings match the generated history
+        solved = models.Try.objects.filter(
+            solved=True, question__isnull=False).values(
+                'user', 'question').distinct().count()
+        self.assertEqual(models.UserQuestionProgress.objects.filter(
+            question__isnull=False).count(), solved)
+        self.assertEqual(
+            sum(models.Profile.objects.values_list('ranking', flat=True)),
+            sum(models.PointsEntry.objects.values_list('points', flat=True)))
+
+        # the courses are usable through the api
+        user = User.objects.get(username__startswith=dataset.PREFIX,
+                                groups__name='moderator')
+        course = models.Course.objects.first()
+        request = APIRequestFactory().get('courses/')
+        force_authenticate(request, user)
+        response = views.CourseView.as_view()(request, course_id=course.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['modules']), 2)
+
+    def test_credentials(self):
+        dataset.generate_dataset(
+            num_users=3, num_courses=1, num_modules=1, num_questions=1,
+            num_quiz_questions=0, started_courses=0, seed=1)
+        keys = set(Token.objects.values_list('key', flat=True))
+        for user in User.objects.all():
+            self.assertFalse(user.has_usable_password())
+            self.assertFalse(user.groups.exists())
+        models.Try.objects.all().delete()
+        User.objects.all().delete()
+        # the tokens do not depend on the seed
+        dataset.generate_dataset(
+            num_users=3, num_courses=1, num_modules=1, num_questions=1,
+            num_quiz_questions=0, started_courses=0, seed=1)
+        self.assertFalse(
+            keys & set(Token.objects.values_list('key', flat=True)))
+
+    def test_command_refuses(self):
+        with self.settings(DEBUG=False):
+            with self.assertRaises(CommandError):
+                call_command('generate_dataset', users=1, courses=1)
+        with self.settings(DEBUG=True):
+            User.objects.create_user(username='teacher')
+            with self.assertRaises(CommandError):
+                call_command('generate_dataset', users=1, courses=1)
+        self.assertFalse(
+            User.objects.filter(username__startswith=dataset.PREFIX).exists())
+
+    def test_load_test(self):
+        dataset.generate_dataset(
+            num_users=2, num_courses=1, num_modules=1, num_questions=2,
+            num_quiz_questions=0, started_courses=0, seed=1)
+        out = StringIO()
+        call_command('load_test', workers=1, flows=2, steps=1, stdout=out)
+        self.assertIn('GET CourseView', out.getvalue())
+        self.assertIn('requests in', out.getvalue())
+
+
+def failing_worker(exit_code):
+    """
+    worker of WorkersTest raising an exception or exiting without a result
+    """
+    if exit_code is None:
+        raise ValueError('failed worker')
+    os._exit(exit_code)
+
+
+class WorkersTest(TestCase):
+    def test_results(self):
+        self.assertEqual(sorted(workers.collect_results(
+            *workers.start_workers(abs, [(-1,), (2,)]))), [1, 2])
+
+    def test_exception(self):
+        with self.assertRaisesRegex(CommandError, 'failed worker'):
+            workers.collect_results(
+                *workers.start_workers(failing_worker, [(None,)]))
+
+    def test_benchmark_submissions(self):
+        # the command replaces the databases by temporary files, which the
+        # in-memory test database of this process does not allow
+        out = subprocess.run(
+            [sys.executable, 'manage.py', 'benchmark_submissions',
+             '--workers', '1', '--submissions', '2'],
+            cwd=settings.BASE_DIR, stdout=subprocess.PIPE, check=True,
+            universal_newlines=True).stdout
+        self.assertEqual(out.splitlines()[1].split(),
+                         ['1', '2', mock.ANY, mock.ANY, '0'])
+
+    def test_exit(self):
+        for exit_code in (0, 1):
+            with self.assertRaisesRegex(CommandError, 'without a result'):
+                workers.collect_results(*workers.start_workers(
+                    failing_worker, [(exit_code,)]))
+
+
+# the maximal number of queries of the endpoints for the course created by
+# QueryBudgetTest, keyed by the method and the name of the view. A request
+# to a listed endpoint exceeding its budget fails the test, the budgets must
+# not grow with the number of modules and questions of the course.
+QUERY_BUDGETS = {
+    'POST MultiCourseView': 11,
+    'GET CourseView': 9,
+    'GET QuestionView': 9,
+    'POST QuestionView': 17,
+    'GET QuizView': 4,
+    'POST StatisticsView': 8,
+    'GET RankingView': 5,
+    'GET UserView': 1,
+}
+
+
+class QueryBudgetMixin():
+    """
+    Sends requests through the url configuration and compares their number
+    of queries with QUERY_BUDGETS
+    """
+
+    def request_within_budget(self, user, method, path, data=None):
+        client = Client(HTTP_AUTHORIZATION='Token {}'.format(
+            Token.objects.get_or_create(user=user)[0].key))
+        endpoint = '{} {}'.format(method, resolve(path).func.__name__)
+        with QueryRecorder(capture=True) as recorder:
+            if method == 'GET':
+                response = client.get(path)
+            else:
+                response = client.post(path, json.dumps(data),
+                                       content_type='application/json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLessEqual(
+            recorder.count, QUERY_BUDGETS[endpoint],
+            '{} exceeds its query budget:\n{}'.format(
+                endpoint, '\n'.join(recorder.queries)))
+        return response
+
+
+class QueryBudgetTest(DatabaseMixin, QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+        self.course = self.create_course('budget', 4, 5)
+        self.user = self.normal_user
+
+    def test_courses(self):
+        response = self.request_within_budget(
+            self.user, 'POST', '/courses/',
+            {'type': '', 'category': '', 'language': 'en'})
+        self.assertEqual(response.status_code, 200)
+        response = self.request_within_budget(
+            self.user, 'GET', '/courses/{}'.format(self.course.id))
+        self.assertEqual(response.status_code, 200)
+
+    def test_questions(self):
+        path = '/courses/{}/0/0'.format(self.course.id)
+        response = self.request_within_budget(self.user, 'GET', path)
+        self.assertEqual(response.status_code, 200)
+        answers = list(MultipleChoice.models.MultipleChoiceAnswer.objects
+                       .filter(question__module__course=self.course,
+                               question__order=0, question__module__order=0,
+                               is_correct=True).values_list('id', flat=True))
+        response = self.request_within_budget(self.user, 'POST', path,
+                                              {'answers': answers})
+        self.assertEqual(response.status_code, 200)
+        response = self.request_within_budget(
+            self.user, 'GET', '/courses/{}/quiz'.format(self.course.id))
+        self.assertEqual(response.status_code, 403)
+
+    def test_user(self):
+        for question in models.Question.objects.filter(
+                module__course=self.course):
+            models.Try.objects.create(user=self.user, question=question,
+                                      solved=True)
+        response = self.request_within_budget(
+            self.user, 'POST', '/statistics',
+            {'id': self.user.id, 'course': self.course.id,
+             'list_questions': True})
+        self.assertEqual(response.status_code, 200)
+        response = self.request_within_budget(self.user, 'GET', '/ranking')
+        self.assertEqual(response.status_code, 200)
+        response = self.request_within_budget(self.user, 'GET',
+                                              '/user/current')
+        self.assertEqual(response.status_code, 200)
+
+
+class RequestMetricsMiddlewareTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+        self.client = Client(HTTP_AUTHORIZATION='Token {}'.format(
+            Token.objects.create(user=self.u1).key))
+
+    @override_settings(REQUEST_METRICS=True, DEBUG=True)
+    def test_metrics(self):
+        with self.assertLogs('learning_base.request_metrics') as logs:
+            response = self.client.get('/courses/{}'.format(
+                self.c1_test_en.id))
+        self.assertEqual(response.status_code, 200)
+        measurement = json.loads(logs.records[0].getMessage())
+        self.assertEqual(measurement['view'], 'CourseView')
+        self.assertEqual(measurement['method'], 'GET')
+        self.assertEqual(measurement['status'], 200)
+        self.assertGreater(measurement['queries'], 0)
+        self.assertEqual(response['X-Query-Count'],
+                         str(measurement['queries']))
+        self.assertIn('X-DB-Time-Ms', response)
+        self.assertIn('X-Wall-Time-Ms', response)
+
+    @override_settings(REQUEST_METRICS=True, DEBUG=False)
+    def test_no_headers(self):
+        with self.assertLogs('learning_base.request_metrics'):
+            response = self.client.get('/user/current')
+        self.assertNotIn('X-Query-Count', response)
+
+    def test_recorder(self):
+        with QueryRecorder() as recorder, \
+                CaptureQueriesContext(connection) as queries:
+            self.client.get('/courses/{}'.format(self.c1_test_en.id))
+        self.assertEqual(recorder.count, len(queries))
+        self.assertGreater(recorder.seconds, 0)
+        self.assertEqual(active_recorders(), [])
+
+    @override_settings(REQUEST_METRICS=True)
+    def test_exception(self):
+        with mock.patch('learning_base.views.RankingView.get',
+                        side_effect=ValueError('broken')), \
+                self.assertLogs('learning_base.request_metrics') as logs, \
+                self.assertRaises(ValueError):
+            self.client.get('/ranking')
+        measurement = json.loads(logs.records[0].getMessage())
+        self.assertEqual(measurement['view'], 'RankingView')
+        self.assertEqual(measurement['status'], 500)
+        self.assertEqual(active_recorders(), [])
+
+
+class MetricsTest(DatabaseMixin, TestCase):
+    def setUp(self):
+        self.setup_database()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        metrics_settings = override_settings(METRICS_DIR=self.directory)
+        metrics_settings.enable()
+        self.addCleanup(metrics_settings.disable)
+        metrics.registry.reset()
+        self.client = Client(HTTP_AUTHORIZATION='Token {}'.format(
+            Token.objects.create(user=self.u1).key))
+
+    def test_metrics(self):
+        # the counters of another uwsgi process
+        with open(os.path.join(self.directory, '1-1.json'), 'w') as file:
+            json.dump([['clonecademy_tries_total', [], 2],
+                       ['clonecademy_cache_requests_total',
+                        [['cache', 'token'], ['result', 'hit']], 3]], file)
+        self.client.get('/courses/{}'.format(self.c1_test_en.id))
+        self.client.post('/courses/{}/0/0'.format(self.c1_test_en.id),
+                         json.dumps({'answers': [self.a2_test.id]}),
+                         content_type='application/json')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE clonecademy_request_duration_seconds histogram',
+                      lines)
+        self.assertIn('clonecademy_requests_total{method="GET",status="200",'
+                      'view="CourseView"} 1', lines)
+        self.assertIn('clonecademy_request_duration_seconds_bucket{'
+                      'view="QuestionView",le="+Inf"} 1', lines)
+        self.assertIn('clonecademy_tries_total 3', lines)
+        self.assertIn('clonecademy_cache_requests_total{cache="token",'
+                      'result="hit"} 4', lines)
+        self.assertIn('clonecademy_cache_hit_ratio{cache="course_index"} 0.5',
+                      lines)
+
+    def read_own_file(self):
+        with open(os.path.join(self.directory,
+                               metrics.registry.name)) as file:
+            return {name: value for name, _, value in json.load(file)}
+
+    def test_flush_interval(self):
+        metrics.record_request('CourseView', 'GET', 200, 0.1, 3, 0.01)
+        metrics.record_request('CourseView', 'GET', 200, 0.1, 3, 0.01)
+        # the second request is written after FLUSH_INTERVAL seconds
+        self.assertEqual(self.read_own_file()['clonecademy_requests_total'],
+                         1)
+        metrics.registry.flushed -= metrics.FLUSH_INTERVAL
+        metrics.record_request('CourseView', 'GET', 200, 0.1, 3, 0.01)
+        self.assertEqual(self.read_own_file()['clonecademy_requests_total'],
+                         3)
+
+    def test_merge_finished(self):
+        process = subprocess.Popen(['true'])
+        process.wait()
+        for number in range(2):
+            path = os.path.join(self.directory, '{}-{}.json'.format(
+                process.pid, number))
+            with open(path, 'w') as file:
+                json.dump([['clonecademy_tries_total', [], 2]], file)
+        metrics.increment('clonecademy_tries_total')
+        for _ in range(2):
+            self.assertEqual(metrics.collect()[
+                ('clonecademy_tries_total', ())], 5)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         sorted([metrics.LOCK_FILE, metrics.MERGED_FILE,
+                                 metrics.registry.name]))
+
+    def test_admin_only(self):
+        client = Client(HTTP_AUTHORIZATION='Token {}'.format(
+            Token.objects.create(user=self.normal_user).key))
+        self.assertEqual(client.get('/metrics').status_code, 403)
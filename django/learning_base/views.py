@@ -3,21 +3,36 @@ This module contains all directly accessed API functions
 Views are not documented extensively in the code but at
 https://github.com/Iliricon/clonecademy
 """
-from django.http import HttpResponse
-from django.core.mail import send_mail
+from collections import Counter
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.db.models import Count
+from django.http import HttpResponse, StreamingHttpResponse
 from django.contrib.auth.models import User, Group
 from django.utils import timezone
-from django.utils.crypto import get_random_string
 
 from rest_framework import status
-from rest_framework import authentication, permissions
+from rest_framework import permissions
 from rest_framework.views import APIView
 from rest_framework.exceptions import ParseError, PermissionDenied
 from rest_framework.response import Response
 
+from . import answer_keys
+from . import content_cache
+from .authentication import CachedTokenAuthentication
 from . import custom_permissions
+from . import metrics
+from . import progress
+from . import ranking
 from . import serializers
-from .models import Course, CourseCategory, Try, Profile, started_courses, QuizQuestion
+from .course_tree import load_course_tree, load_course_outline, \
+    get_course_index, locate_question, question_position, resolve_question
+from .databases import analytics_database
+from .export import stream_tries_csv
+from .mail_queue import PASSWORD_PLACEHOLDER, enqueue_mail
+from .models import Course, CourseCategory, Try, Profile, started_courses, QuizQuestion, \
+    Question, get_roles, is_admin, is_mod
 
 
 class CategoryView(APIView):
@@ -25,7 +40,7 @@ class CategoryView(APIView):
     Shows, creates, updates and deletes a category
     :author: Claas Voelcker, Tobias Huber
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (custom_permissions.IsAdminOrReadOnly,)
 
     def get(self, request, format=None):
@@ -104,7 +119,7 @@ class MultiCourseView(APIView):
     interface with three filter settings.
     @author Claas Voelcker
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request, format=None):
@@ -119,7 +134,9 @@ class MultiCourseView(APIView):
         Returns a set of courses detailed by the query. It expects a request
         with the keys 'language', 'category', 'type'. The returning JSON
         corresponds to the values. All values can be empty strings, resulting
-        in all courses being returned.
+        in all courses being returned. If the optional key 'summary' is true,
+        only the courses and their progress counters are returned, without
+        the modules and questions.
         """
         try:
             types = ['mod', 'started']
@@ -141,8 +158,7 @@ class MultiCourseView(APIView):
             courses = courses.filter(language=r_lan)
 
             # filter invisible courses if neccessary
-            if not (request.user.profile.is_mod()
-                    or request.user.profile.is_admin()):
+            if not (is_mod(request.user) or is_admin(request.user)):
                 courses = courses.filter(is_visible=True)
 
             if r_category != '':
@@ -153,8 +169,17 @@ class MultiCourseView(APIView):
                 courses = courses.filter(responsible_mod=request.user)
             elif r_type == 'started':
                 courses = started_courses(request.user)
+            if data.get('summary'):
+                courses = progress.with_course_summary(
+                    courses.select_related('category'), request.user)
+                data = serializers.CourseSummarySerializer(
+                    courses, many=True).data
+                return Response(data, status=status.HTTP_200_OK)
+            courses = load_course_tree(courses)
             data = serializers.CourseSerializer(courses, many=True, context={
-                'request': request}).data
+                'request': request,
+                'solved_questions': progress.solved_questions_by_course(
+                    request.user, courses)}).data
             return Response(data, status=status.HTTP_200_OK)
         except Exception as errors:
             return Response({'error': 'Query not possible' + str(errors)},
@@ -167,7 +192,7 @@ class CourseEditView(APIView):
     TODO: this is probably redundant code
     @author Leonhard Wiedmann
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (custom_permissions.IsModOrAdmin,)
 
     def get(self, request, course_id=None, format=None):
@@ -179,13 +204,17 @@ class CourseEditView(APIView):
             return Response({'error': 'Method not allowed'},
                             status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
-        try:
-            course = Course.objects.filter(id=course_id).first()
+        def build():
+            course = load_course_tree(Course.objects.filter(id=course_id),
+                                      quiz=True)[0]
             course_serializer = serializers.CourseEditSerializer(
                 course,
                 context={
                     'request': request})
-            data = course_serializer.data
+            return course_serializer.data
+
+        try:
+            data = content_cache.get_content(course_id, 'edit', build)
             return Response(data)
 
         except Exception as errors:
@@ -198,9 +227,7 @@ class CourseEditView(APIView):
         """
         data = request.data
         if data['delete']:
-            groups = request.user.groups.values_list('name', flat=True)
-
-            if 'admin' in groups:
+            if is_admin(request.user):
                 course = Course.objects.filter(id=course_id)
                 if not course.exists():
                     return Response({'error': 'Course does not exist'},
@@ -216,7 +243,7 @@ class CourseView(APIView):
     Contains all code related to viewing and saving courses.
     :author: Claas Voelcker
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (
         custom_permissions.IsModOrAdminOrReadOnly,)
 
@@ -237,14 +264,13 @@ class CourseView(APIView):
             return Response({'error': 'Method not allowed'},
                             status=status.HTTP_405_METHOD_NOT_ALLOWED)
         try:
-            # fetch the course object, serialize it and return
-            # the serialization
-            course = Course.objects.filter(id=course_id).first()
-            data = serializers.CourseSerializer(course, context={
-                'request': request}).data
-            data['quiz'] = False
-            if len(course.quizquestion_set.all()) > 0:
-                data['quiz'] = True
+            # the serialized course is read from the content cache and
+            # completed with the progress of the user
+            content = content_cache.get_content(
+                course_id, 'course',
+                lambda: serializers.course_content(course_id))
+            solved = progress.solved_questions(request.user, course_id)
+            data = serializers.merge_course_progress(content, solved)
             return Response(data,
                             status=status.HTTP_200_OK)
         # in case of an exception, throw a "Course not found" error for the
@@ -289,7 +315,7 @@ class CourseView(APIView):
         else:
             responsible_mod = Course.objects.get(id=course_id).responsible_mod
             # decline access if user is neither admin nor the responsible mod
-            if (request.user.profile.is_admin()
+            if (is_admin(request.user)
                     or request.user == responsible_mod):
                 data['responsible_mod'] = responsible_mod
             else:
@@ -329,7 +355,7 @@ class ToggleCourseVisibilityView(APIView):
     @author Tobias Huber
     """
 
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (custom_permissions.IsAdmin,)
 
     def post(self, request, course_id):
@@ -364,7 +390,7 @@ class ModuleView(APIView):
     Shows a module
     @author Claas Voelcker
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request, course_id, module_id, format=None):
@@ -388,14 +414,16 @@ class QuestionView(APIView):
     answers, which are given by a separate class.
     @author Claas Voelcker
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     @staticmethod
     def can_access_question(user, question, module_id, question_id):
         """
         Checks if the question is accessable by the user (all questions before
-        need to be answered correctly)
+        need to be answered correctly). The position of the question is
+        compared with the furthest position unlocked by the user, which is
+        maintained in the UserCourseProgress.
         :param user: user wanting to access
         :param question: question to be accessed
         :param module_id: module id the question belongs to
@@ -403,25 +431,12 @@ class QuestionView(APIView):
         :return: True|False (see description)
         @author Tobias Huber
         """
-        module = question.module
         first_question = int(module_id) <= 0 and int(question_id) <= 0
         if first_question:
             return True
-        elif (not first_question
-              and question.get_previous_in_order()
-              and Try.objects.filter(
-                  user=user,
-                  question=question.get_previous_in_order(),
-                  solved=True)):
-            return True
-        elif (not module.is_first_module()
-              and module.get_previous_in_order()
-              and Try.objects.filter(
-                  user=user,
-                  question=module.get_previous_in_order().question_set.all()[0],
-                  solved=True)):
-            return True
-        return False
+        course_id = question.module.course_id
+        return (question_position(course_id, module_id, question_id)
+                <= progress.unlocked_position(user, course_id))
 
     def get(self, request, course_id, module_id, question_id, format=None):
         """
@@ -429,18 +444,13 @@ class QuestionView(APIView):
         and position (last_module and last_question keys)
         """
         try:
-            course = Course.objects.get(id=course_id)
-            course_module = course.module_set.all()[int(module_id)]
-            question = course_module.question_set.all()[int(question_id)]
-
-            if question is None:
-                return Response({'error': 'Question not found'},
-                                status=status.HTTP_404_NOT_FOUND)
+            question = resolve_question(course_id, module_id, question_id)
             if not self.can_access_question(request.user, question, module_id,
                                             question_id):
                 return Response({'error': "Previous question(s) haven't been "
                                         'answered correctly yet'},
                                 status=status.HTTP_403_FORBIDDEN)
+            load_course_outline(question.module.course)
             data = serializers.QuestionSerializer(question,
                                                   context={'request': request})
             data = data.data
@@ -455,12 +465,13 @@ class QuestionView(APIView):
         @author Tobias Huber
         """
         try:
-            course = Course.objects.get(id=course_id)
-            course_module = course.module_set.all()[int(module_id)]
-            question = course_module.question_set.all()[int(question_id)]
+            question = resolve_question(course_id, module_id, question_id)
         except Exception:
             return Response({'error': 'Question not found'},
                             status=status.HTTP_404_NOT_FOUND)
+        course_module = question.module
+        course = course_module.course
+        index = get_course_index(course.id)
         # deny access if there is a/are previous question(s) and it/they
         # haven't been answered correctly
         if not (self.can_access_question(request.user, question, module_id,
@@ -471,21 +482,27 @@ class QuestionView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        solved = question.evaluate(request.data["answers"])
-
-        # only saves the points if the question hasn't been answered yet
-        if solved and not question.try_set.filter(
-                user=request.user, solved=True).exists():
-            request.user.profile.ranking += question.get_points()
-            request.user.profile.save()
-        Try(user=request.user, question=question,
-            answer=str(request.data["answers"]), solved=solved).save()
+        answer_key = answer_keys.question_key(question)
+        solved = answer_keys.grade(answer_key, request.data["answers"])
+
+        # the writes form one short transaction of the activity database,
+        # which starts with a write so SQLite takes the write lock first
+        # instead of upgrading a read
+        with transaction.atomic(using=analytics_database()):
+            Try(user=request.user, question=question,
+                answer=str(request.data["answers"]), solved=solved).save()
+            metrics.increment('clonecademy_tries_total')
+            # only saves the points if the question hasn't been answered yet
+            if solved and progress.record_solved(request.user, course,
+                                                 question=question):
+                ranking.award_points(request.user, answer_key.points,
+                                     question=question)
         response = {"evaluate": solved}
         if solved:
             next_type = ""
-            if not question.is_last_question():
+            if int(question_id) < len(index[int(module_id)]) - 1:
                 next_type = str(course_id) + '/' + str(int(module_id) + 1) + '/' + str(int(question_id) + 2)
-            elif not course_module.is_last_module():
+            elif int(module_id) < len(index) - 1:
                 next_type = str(course_id) + '/' + str(int(module_id) + 2) + '/1'
             elif course.quizquestion_set.exists():
                 response['quiz'] = True
@@ -503,19 +520,21 @@ class AnswerView(APIView):
     Shows all possible answers to a question.
     :author: Claas Voelcker
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request, course_id, module_id, question_id, format=None):
         """
         Lists the answers for a question
         """
-        course = Course.objects.get(id=course_id)
-        module = course.module_set.all()[int(module_id)]
-        question = module.question_set.all()[int(question_id)]
-        answers = question.answer_set()
-        data = [serializers.get_answer_serializer(answer) for answer in
-                answers]
+        def build():
+            question = resolve_question(course_id, module_id, question_id)
+            return [serializers.get_answer_serializer(answer)
+                    for answer in question.answer_set()]
+
+        question_pk, _ = locate_question(course_id, module_id, question_id)
+        data = content_cache.get_content(
+            course_id, 'answers_{}'.format(question_pk), build)
         return Response(data, status=status.HTTP_200_OK)
 
     def post(self, request, format=None):
@@ -555,7 +574,7 @@ class QuizView(APIView):
     evaluates this quiz question in post
     @author Leonhard Wiedmann
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request, course_id):
@@ -565,12 +584,8 @@ class QuizView(APIView):
         """
         course = Course.objects.filter(id=course_id).first()
 
-        # check if user did last question of the last module
-        # if valid the course is completed
-        module = course.module_set.all()[len(course.module_set.all()) - 1]
-        question = module.question_set.all(
-        )[len(module.question_set.all()) - 1]
-        if not Try.objects.filter(question=question, solved=True).exists():
+        # check if user solved all questions of the course
+        if not progress.course_completed(request.user, course):
             return Response({"error": "complete the course first"},
                             status=status.HTTP_403_FORBIDDEN)
 
@@ -590,7 +605,7 @@ class QuizView(APIView):
         # this switch/case differentiates between the two
         if request.data['type'] == "check_answers":
             course = Course.objects.get(id=course_id)
-            quiz = course.quizquestion_set.all()
+            quiz = list(course.quizquestion_set.all())
             all_question_length = len(quiz)
             if all_question_length <= 0:
                 return Response({"error": "this quiz does not exist"},
@@ -602,9 +617,13 @@ class QuizView(APIView):
                     .format(len(quiz), len(request.data['answers']))
                 return Response({"error": resp, "test": request.data},
                                 status=status.HTTP_400_BAD_REQUEST)
-            response = []
-            newly_solved = 0
             old_solved = 0
+            results = []
+            tries = []
+            solved_before = progress.solved_quiz_questions(request.user,
+                                                           course)
+            # the answers are evaluated in memory with the cached answer key
+            quiz_key = answer_keys.quiz_key(course)
             for i, quiz_entry in enumerate(quiz):
                 answer_solved = request.data['answers'][i]
                 for answer in request.data['answers']:
@@ -612,28 +631,37 @@ class QuizView(APIView):
                         answer.pop('id')
                         answer_solved = answer
                         break
-                solved = quiz_entry.evaluate(answer_solved)
-                points = 0
-                if solved and not quiz_entry.try_set.filter(
-                        user=request.user, solved=True).exists():
-                    points = 1
-                    newly_solved += 1
-                    request.user.profile.ranking += quiz_entry.get_points()
-                elif quiz_entry.try_set.filter(user=request.user,
-                                               solved=True).exists():
+                solved = quiz_entry.evaluate(answer_solved,
+                                             quiz_key.get(quiz_entry.id))
+                if quiz_entry.id in solved_before:
                     old_solved += 1
-                Try(user=request.user, quiz_question=quiz_entry,
-                    answer=str(request.data), solved=solved).save()
-
-                response.append({"name": quiz[i].question, "solved": solved, 'points': points})
-
-            old_extra = float(old_solved / all_question_length)
-            new_extra = float(
-                (newly_solved + old_solved) / all_question_length)
-            request.user.profile.ranking += calculate_quiz_points(
-                old_extra, new_extra, course.difficulty)
-            request.user.profile.save()
-
+                results.append((quiz_entry, solved))
+                tries.append(Try(user=request.user, quiz_question=quiz_entry,
+                                 answer=str(request.data), solved=solved))
+
+            with transaction.atomic(using=analytics_database()):
+                Try.objects.bulk_create(tries)
+                metrics.increment('clonecademy_tries_total', len(tries))
+                newly_solved = progress.record_solved_quiz(
+                    request.user, course,
+                    [quiz_entry for quiz_entry, solved in results
+                     if solved and quiz_entry.id not in solved_before])
+                for quiz_entry in newly_solved:
+                    ranking.award_points(request.user, quiz_entry.get_points(),
+                                         quiz_question=quiz_entry)
+
+                old_extra = float(old_solved / all_question_length)
+                new_extra = float(
+                    (len(newly_solved) + old_solved) / all_question_length)
+                ranking.award_points(
+                    request.user,
+                    calculate_quiz_points(old_extra, new_extra,
+                                          course.difficulty),
+                    course=course)
+
+            response = [{"name": quiz_entry.question, "solved": solved,
+                         'points': int(quiz_entry in newly_solved)}
+                        for quiz_entry, solved in results]
             return Response(response, status=status.HTTP_200_OK)
         if request.data['type'] == 'get_answers':
             course = Course.objects.get(id=course_id)
@@ -650,7 +678,7 @@ class UserView(APIView):
     Shows a user profile
     @author Claas Voelcker
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request, user_id=False, format=None):
@@ -664,7 +692,7 @@ class UserView(APIView):
         """
         user = request.user
         if user_id:
-            if user.profile.is_admin():
+            if is_admin(user):
                 user = User.objects.filter(id=user_id).first()
                 if not user:
                     return Response({'error': 'User not found'},
@@ -732,14 +760,15 @@ class MultiUserView(APIView):
     Shows an overview over all users
     @author Claas Voelcker
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (custom_permissions.IsAdmin,)
 
     def get(self, request):
         """
         Returns all users
         """
-        users = User.objects.all()
+        users = User.objects.select_related('profile').prefetch_related(
+            'groups')
         data = serializers.UserSerializer(users, many=True).data
         return Response(data)
 
@@ -757,7 +786,7 @@ class StatisticsView(APIView):
     access the try object.
     @author: Claas Voelcker
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request, user_id=None):
@@ -769,6 +798,17 @@ class StatisticsView(APIView):
         data = serializers.TrySerializer(tries, many=True).data
         return Response(data)
 
+    @staticmethod
+    def question_ids(**lookups):
+        """
+        :param lookups: the filter of the questions
+        :return: the ids of the matching questions for a filter of the tries
+        """
+        # a list of values works with the tries stored in another database
+        # and lets SQLite search the tries with the index of the question
+        return list(Question.objects.filter(**lookups).values_list(
+            'id', flat=True))
+
     def post(self, request, format=None):
         """
         implements filtering logic for the statistics
@@ -777,28 +817,27 @@ class StatisticsView(APIView):
         :return:
         """
         import time
-        import csv
         data = request.data
         user = request.user
 
         tries = Try.objects.all()
+        # the filters of the questions of the tries, applied together with
+        # a single lookup
+        question_lookups = {}
 
-        groups = user.groups.values_list('name', flat=True)
+        groups = get_roles(user)
 
-        is_mod = 'moderator' in groups or 'admin' in groups
+        mod_rights = 'moderator' in groups or 'admin' in groups
 
         # the simplest call is if the user just wants its statistic
-        print(data)
-        print(data['id'])
         if 'id' in data and data['id'] == user.id:
             tries = tries.filter(user=user)
 
         # A moderator can get all statistics of his created courses
         # with 'get_courses' as in put the it will return all courses created
         # by this user
-        elif is_mod and 'course' in data and 'admin' not in groups:
-            tries = tries.filter(
-                question__module__course__responsible_mod=user)
+        elif mod_rights and 'course' in data and 'admin' not in groups:
+            question_lookups['module__course__responsible_mod'] = user
 
         # admins can get all statistics of all users
         elif 'admin' in groups:
@@ -811,23 +850,30 @@ class StatisticsView(APIView):
         # return all statistics after prefiltering for this course
         if 'course' in data:
 
-            tries = tries.filter(question__module__course__id=data['course'])
+            question_lookups['module__course__id'] = data['course']
 
             if 'list_questions' in data:
-                course = Course.objects.filter(id=data['course']).first()
+                courses = load_course_tree(
+                    Course.objects.filter(id=data['course']), answers=False)
+                if not courses:
+                    return Response({'error': 'Course not found'},
+                                    status=status.HTTP_404_NOT_FOUND)
+                # count the tries of every question grouped by the solved flag
+                question_ids = [question.id
+                                for module in courses[0].module_set.all()
+                                for question in module.question_set.all()]
+                counter = Counter()
+                for question, solved, count in Try.objects.filter(
+                        question__in=question_ids).order_by(
+                        ).values_list('question', 'solved').annotate(
+                            count=Count('id')):
+                    counter[(question, solved)] = count
                 value = []
-                index = 0
-                for module in course.module_set.all():
-                    value.append([])
-                    for question in module.question_set.all():
-                        value[index].append({'name': question.title,
-                                             'solved': len(
-                                                 question.try_set.filter(
-                                                     solved=True).all()),
-                                             'not solved': len(
-                                                 question.try_set.filter(
-                                                     solved=False).all())})
-                    index += 1
+                for module in courses[0].module_set.all():
+                    value.append([{'name': question.title,
+                                   'solved': counter[(question.id, True)],
+                                   'not solved': counter[(question.id, False)]}
+                                  for question in module.question_set.all()])
                 return Response(value)
 
         # get the statistics for a specific time
@@ -845,21 +891,32 @@ class StatisticsView(APIView):
 
         # filter for a specific category
         if 'category' in data:
+            question_lookups['module__course__category__name'] = \
+                data['category']
+
+        if question_lookups:
             tries = tries.filter(
-                question__module__course__category__name=data['category'])
+                question__in=self.question_ids(**question_lookups))
 
         # if this variable is set the view will return a array of dicts which
         # are {name: string, color: string, counter: number}
         if 'categories__with__counter' in data:
-            categories = CourseCategory.objects.all()
+            # the tries are counted per question, the categories of the
+            # questions are read separately
+            categories = dict(Question.objects.non_polymorphic().values_list(
+                'id', 'module__course__category'))
+            counter = Counter()
+            for question, count in tries.filter(
+                    question__isnull=False).order_by().values_list(
+                        'question').annotate(count=Count('id')):
+                counter[categories.get(question)] += count
             value = []
-            for cat in categories:
+            for cat in CourseCategory.objects.all():
                 value.append(
                     {
                         'name': cat.name,
                         'color': cat.color,
-                        'counter': len(tries.filter(
-                            question__module__course__category=cat))
+                        'counter': counter.get(cat.id, 0)
                     })
             return Response(value)
 
@@ -867,18 +924,37 @@ class StatisticsView(APIView):
 
         # filters the statistics and counts for the 'filter' variable
         if 'filter' in data:
-            value = {}
-            for trie in tries:
-                if not str(getattr(trie, data['filter'])) in value:
-                    value[str(getattr(trie, data['filter']))] = 1
-                else:
-                    value[str(getattr(trie, data['filter']))] += 1
-            return Response(value)
+            try:
+                field = Try._meta.get_field(data['filter'])
+            except FieldDoesNotExist:
+                return Response({'error': 'invalid filter'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            counts = tries.order_by().values_list(field.attname).annotate(
+                count=Count('id'))
+            # the tries are counted by their string representation of the
+            # field, related objects are fetched once for all groups
+            related = {}
+            if field.is_relation:
+                related = field.related_model.objects.in_bulk(
+                    [key for key, _ in counts if key is not None])
+            value = Counter()
+            for key, count in counts:
+                value[str(related.get(key) if field.is_relation
+                          else key)] += count
+            return Response(dict(value))
 
         # this part orders the list for the 'order' value in the request
         if 'order' in data:
             tries = tries.order_by(data['order'])
 
+        if 'format' in data and data['format'] == 'csv':
+            response = StreamingHttpResponse(stream_tries_csv(tries),
+                                             content_type='text/csv')
+            filename = time.strftime('%d/%m/%Y') + '-' + user.username + '.csv'
+            content = 'attachment; filename="' + filename
+            response['Content-Disposition'] = content
+            return response
+
         if 'serialize' in data:
             serialize_data = serializers.TrySerializer(tries, many=True,
                                                        context={
@@ -887,42 +963,63 @@ class StatisticsView(APIView):
         else:
             serialize_data = serializers.TrySerializer(tries, many=True).data
 
-        if 'format' in data and data['format'] == 'csv':
-            response = HttpResponse(content_type='text/csv')
-            filename = time.strftime('%d/%m/%Y') + '-' + user.username + '.csv'
-            content = 'attachment; filename="' + filename
-            response['Content-Disposition'] = content
-            writer = csv.writer(response)
-            writer.writerow(['question', 'user', 'date', 'solved'])
-            for row in serialize_data:
-                profile = Profile.objects.get(user__username=row['user'])
-                profile_hash = profile.get_hash()
-                writer.writerow(
-                    [row['question'],
-                     profile_hash,
-                     row['date'],
-                     row['solved']])
-            return response
         return Response(serialize_data)
 
 
 class RankingView(APIView):
     """
-    A view for the ranking. The get method returns an ordered list of all users
-    according to their rank.
+    A view for the ranking. The get method returns a page of the users ordered
+    by their rank, the rank of the requesting user and the users ranked next
+    to them.
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
+    # default and maximal values for the 'limit' and 'window' parameters
+    PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 100
+    WINDOW = 2
+    MAX_WINDOW = 10
+
     def get(self, request, format=None):
         """
         API request for ranking information
+        The optional query parameters are 'limit' (the page size), 'after'
+        (the 'next' value of the previous page) and 'window' (the number of
+        users shown above and below the requesting user)
         :param request: can be empty
         :param format: request: can be empty
         :return: a json response with ranking information
         """
-        profiles = Profile.objects.all().reverse()
-        data = serializers.RankingSerializer(profiles).data
+        params = request.query_params
+        try:
+            limit = min(int(params.get('limit', self.PAGE_SIZE)),
+                        self.MAX_PAGE_SIZE)
+            window = min(int(params.get('window', self.WINDOW)),
+                         self.MAX_WINDOW)
+            profiles, first_rank, next_cursor = ranking.get_page(
+                max(limit, 1), params.get('after'))
+        except ValueError:
+            return Response({'error': 'invalid ranking query'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        data = {
+            'ranking': serializers.RankingSerializer(
+                profiles, context={'first_rank': first_rank}).data,
+            'next': next_cursor,
+            'user': None,
+            'neighbors': []
+        }
+        profile = Profile.objects.select_related('user').filter(
+            user=request.user).first()
+        if profile:
+            rank = ranking.get_rank(profile.ranking, profile.id)
+            neighbors, first_rank = ranking.get_neighbors(profile, rank,
+                                                          max(window, 0))
+            data['user'] = serializers.RankingSerializer(
+                [profile], context={'first_rank': rank}).data[0]
+            data['neighbors'] = serializers.RankingSerializer(
+                neighbors, context={'first_rank': first_rank}).data
         return Response(data)
 
     def post(self, request, format=None):
@@ -933,6 +1030,26 @@ class RankingView(APIView):
                         status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
 
+class MetricsView(APIView):
+    """
+    The request, database, cache and try counters of all processes in the
+    text exposition format of Prometheus, only accessible by admins
+    """
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (custom_permissions.IsAdmin,)
+
+    def get(self, request, format=None):
+        """
+        returns the metrics, the METRICS_DIR setting needs to be set
+        """
+        if not metrics.enabled():
+            return Response({'error': 'Metrics are not collected'},
+                            status=status.HTTP_404_NOT_FOUND)
+        return HttpResponse(metrics.render(),
+                            content_type='text/plain; version=0.0.4; '
+                                         'charset=utf-8')
+
+
 class RequestView(APIView):
     """
     The RequestView class is used to submit a request for moderator rights.
@@ -940,7 +1057,7 @@ class RequestView(APIView):
     The request can be accessed via "clonecademy/user/request/"
     @author Tobias Huber
     """
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request, format=None):
@@ -948,7 +1065,7 @@ class RequestView(APIView):
         Returns True if request is allowed and False if request isn't allowed
         or the user is already mod.
         """
-        allowed = (not request.user.profile.is_mod()
+        allowed = (not is_mod(request.user)
                    and request.user.profile.modrequest_allowed())
         return Response({'allowed': allowed},
                         status=status.HTTP_200_OK)
@@ -968,7 +1085,7 @@ class RequestView(APIView):
         # pay attention because there could be localization errors
         profile.last_modrequest = timezone.now()
         profile.save()
-        send_mail(
+        enqueue_mail(
             'Moderator rights requested by {}'.format(user.username),
             'The following user {} requested moderator rights for the'
             'CloneCademy platform. \n'
@@ -1002,7 +1119,7 @@ class UserRightsView(APIView):
     I do not understand.
     """
 
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (custom_permissions.IsAdmin,)
 
     def post(self, request, user_id, format=None):
@@ -1045,10 +1162,8 @@ class UserRightsView(APIView):
         """
         user = User.objects.get(id=user_id)
         return Response({'username': user.username,
-                         'is_mod?':
-                             user.groups.filter(name='moderator').exists(),
-                         'is_admin?':
-                             user.groups.filter(name='admin').exists()})
+                         'is_mod?': is_mod(user),
+                         'is_admin?': is_admin(user)})
 
 
 class PwResetView(APIView):
@@ -1081,21 +1196,18 @@ class PwResetView(APIView):
 
         # if request data is valid:
         user = User.objects.get(email=data['email'])
-        # generate a random password with the rand() implementation of
-        # django.utils.crypto
-        new_password = get_random_string(length=16)
-
-        send_mail(
+        # the new password is created and set by the mail queue when the
+        # mail is delivered, so it is never stored
+        enqueue_mail(
             'Password Reset on clonecademy.net',
             ('Hello {},\n \n'
              + 'You have requested a new password on clonecademy.net \n'
              + 'Your new password is: \n{} \n \n'
              + 'Please change it imediately! \n'
              + 'Have a nice day,\nyour CloneCademy bot').format(
-                 user.username, new_password),
+                 user.username, PASSWORD_PLACEHOLDER),
             'bot@clonecademy.de',
-            [user.email]
+            [user.email],
+            password_reset=user
         )
-        user.set_password(new_password)
-        user.save()
         return Response(status=status.HTTP_200_OK)
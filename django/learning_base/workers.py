@@ -0,0 +1,92 @@
+"""
+Worker processes of the load test and benchmark commands. Every worker sends
+exactly one result to the parent, an exception of the worker is sent as its
+traceback. The parent checks the workers while it waits for their results,
+so a worker dying without a result fails the command instead of blocking it
+forever.
+"""
+
+import multiprocessing
+import queue
+import traceback
+
+from django.core.management.base import CommandError
+from django.db import connections
+
+# seconds a worker waits at the start barrier for the other workers
+START_TIMEOUT = 60
+
+# seconds between two checks of the workers while the parent waits
+POLL_INTERVAL = 1
+
+
+def run_worker(results, target, *args):
+    """
+    Runs the function of a worker process and sends its return value or the
+    traceback of its exception to the parent
+    :param results: the queue of the results
+    :param target: the function of the worker
+    :param args: the arguments of the function
+    """
+    try:
+        # the connection of the parent process must not be shared
+        connections.close_all()
+        results.put((target(*args), None))
+    except Exception:
+        results.put((None, traceback.format_exc()))
+    finally:
+        connections.close_all()
+
+
+def start_workers(target, arguments):
+    """
+    Starts one worker process per argument tuple
+    :param target: the function of the workers
+    :param arguments: the arguments of the function for every worker
+    :return: the processes and the queue of their results
+    """
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=run_worker,
+                                         args=(results, target) + tuple(args))
+                 for args in arguments]
+    for process in processes:
+        process.start()
+    return processes, results
+
+
+def collect_results(processes, results):
+    """
+    Waits for the results of all workers and joins them. The remaining
+    workers are terminated if one of them fails.
+    :param processes: the processes returned by start_workers
+    :param results: the queue returned by start_workers
+    :return: the return values of the workers in the order they finished
+    :raise: CommandError if a worker raised an exception or exited without
+            sending a result
+    """
+    outcomes = []
+    try:
+        while len(outcomes) < len(processes):
+            # the results of workers exited before the check are in the queue
+            exited = not any(process.is_alive() for process in processes)
+            try:
+                result, error = results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if exited or any(process.exitcode not in (None, 0)
+                                 for process in processes):
+                    raise CommandError(
+                        'A worker exited without a result, exit codes: '
+                        '{}'.format(', '.join(str(process.exitcode)
+                                              for process in processes)))
+                continue
+            if error is not None:
+                raise CommandError('A worker failed:\n{}'.format(error))
+            outcomes.append(result)
+    finally:
+        if len(outcomes) < len(processes):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+        for process in processes:
+            process.join()
+    return outcomes
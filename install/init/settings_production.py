@@ -32,8 +32,20 @@ MANAGERS = ADMINS
 EMAIL_SUBJECT_PREFIX = ''
 
 URL_PREFIX = 'api/'
+
+# the uwsgi processes need to share the cache, otherwise changes to a course
+# are not seen by the other processes
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'database/cache'),
+    }
+}
 SESSION_COOKIE_SECURE = True
 
+# served by nginx, see nginx-app.conf
+MEDIA_ROOT = '/home/docker/persistent/media'
+
 # @see https://docs.djangoproject.com/es/1.9/topics/email/
 
 # Local time zone for this installation. Choices can be found here:
@@ -47,6 +59,14 @@ TIME_ZONE = 'Europe/Berlin'
 # http://www.i18nguy.com/unicode/language-identifiers.html
 LANGUAGE_CODE = 'de-DE'
 
+# Log the queries and the duration of every request (see
+# learning_base/request_metrics.py)
+REQUEST_METRICS = True
+
+# The uwsgi processes write their counters to this directory, /metrics adds
+# them up. Remove the directory to reset the counters.
+METRICS_DIR = '/tmp/clonecademy_metrics'
+
 # A sample logging configuration. The only tangible logging
 # performed by this configuration is to send an email to
 # the site admins on every HTTP 500 error when DEBUG=False.
@@ -81,6 +101,11 @@ LOGGING = {
             'handlers': ['console'],
             'level': 'DEBUG',
         },
+        'learning_base.request_metrics': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     }
 }
 